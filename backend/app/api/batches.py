@@ -0,0 +1,67 @@
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from ..core.config import get_settings
+from ..database import get_job_stats
+from ..services.container import Services, get_services
+
+settings = get_settings()
+
+router = APIRouter(prefix=settings.API_V1_STR)
+
+class BatchItemIn(BaseModel):
+    prompt: str
+    custom_id: Optional[str] = None
+
+class BatchJobIn(BaseModel):
+    items: List[BatchItemIn]
+    task_type: str = "general"
+    model: Optional[str] = None  # Routed per item when omitted
+
+def _found(job):
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job
+
+@router.post("/batches")
+async def create_batch(body: BatchJobIn, services: Services = Depends(get_services)):
+    """Queue a bulk job; results are read from /batches/{job_id}/results"""
+    if not body.items:
+        raise HTTPException(status_code=400, detail="No items")
+    if len(body.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_ITEMS} items per job")
+    if body.model is not None and body.model not in services.ai_service.models:
+        raise HTTPException(status_code=400, detail=f"Unknown or disabled model: {body.model}")
+    job_id = await services.batches.create_job(
+        [(item.prompt, item.custom_id) for item in body.items], body.task_type, body.model
+    )
+    return {"job_id": job_id, "total": len(body.items)}
+
+@router.get("/batches/{job_id}")
+async def get_batch(job_id: str, services: Services = Depends(get_services)):
+    """Progress of a job, with the spend and throughput recorded in telemetry"""
+    job = _found(await services.batches.get_job(job_id))
+    return {**job, "telemetry": await asyncio.to_thread(get_job_stats, job_id)}
+
+@router.get("/batches/{job_id}/results")
+async def batch_results(job_id: str, after: int = Query(0, ge=0), follow: bool = True,
+                        services: Services = Depends(get_services)):
+    """Results as NDJSON, one line per item in completion order and a
+    summary line at the end. Pass the last ``seq`` seen as ``after`` to
+    pick up a broken stream where it stopped."""
+    _found(await services.batches.get_job(job_id))
+    return StreamingResponse(
+        services.batches.stream_results(job_id, after, follow),
+        media_type="application/x-ndjson"
+    )
+
+@router.post("/batches/{job_id}/resume")
+async def resume_batch(job_id: str, services: Services = Depends(get_services)):
+    """Retry the failed and unfinished items of a finished or cancelled job"""
+    return _found(await services.batches.resume(job_id))
+
+@router.post("/batches/{job_id}/cancel")
+async def cancel_batch(job_id: str, services: Services = Depends(get_services)):
+    return _found(await services.batches.cancel(job_id))
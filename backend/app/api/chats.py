@@ -0,0 +1,105 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select, tuple_, literal
+from sqlalchemy.orm import Session
+from ..core.config import get_settings
+from ..core.database import get_db
+from ..models.models import Chat, Message
+
+settings = get_settings()
+
+router = APIRouter(prefix=settings.API_V1_STR)
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _before(created_at_column, id_column, cursor: str):
+    """Keyset predicate ``(created_at, id) < cursor``; literals are typed so
+    the cursor is bound exactly the way the columns are stored"""
+    created_at, row_id = decode_cursor(cursor)
+    return tuple_(created_at_column, id_column) < tuple_(
+        literal(created_at, created_at_column.type), literal(row_id, id_column.type)
+    )
+
+def _page(rows, limit: int, to_item) -> Response:
+    """Serialize plain rows straight to JSON, skipping ORM objects and
+    response-model validation"""
+    items = [to_item(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return Response(
+        content=json.dumps({"items": items, "next_cursor": next_cursor}),
+        media_type="application/json"
+    )
+
+METRIC_COLUMNS = (Message.tokens_used, Message.cost_usd, Message.latency_ms, Message.time_to_first_token_ms)
+
+def _metadata(row) -> Optional[dict]:
+    """Reply metadata in the shape clients received it in before the
+    metrics moved to their own columns"""
+    if row.provider is None and row.message_metadata is None:
+        return None
+    metrics = {
+        column.key: getattr(row, column.key)
+        for column in METRIC_COLUMNS if getattr(row, column.key) is not None
+    }
+    metrics.update((row.message_metadata or {}).get("metrics") or {})
+    return {"provider": row.provider, "metrics": metrics}
+
+@router.get("/chats")
+def list_chats(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Chats, newest first, one keyset page at a time"""
+    query = select(Chat.id, Chat.created_at)
+    if cursor:
+        query = query.where(_before(Chat.created_at, Chat.id, cursor))
+    rows = db.execute(
+        query.order_by(Chat.created_at.desc(), Chat.id.desc()).limit(limit + 1)
+    ).all()
+    return _page(rows, limit, lambda row: {
+        "id": row.id,
+        "created_at": row.created_at.isoformat()
+    })
+
+@router.get("/chats/{chat_id}/messages")
+def list_messages(
+    chat_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Messages of a chat, newest first; pass ``next_cursor`` back to page
+    towards older messages"""
+    query = select(
+        Message.id, Message.role, Message.content, Message.model, Message.created_at,
+        Message.provider, *METRIC_COLUMNS, Message.message_metadata
+    ).where(Message.chat_id == chat_id)
+    if cursor:
+        query = query.where(_before(Message.created_at, Message.id, cursor))
+    rows = db.execute(
+        query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1)
+    ).all()
+    return _page(rows, limit, lambda row: {
+        "id": row.id,
+        "role": row.role,
+        "content": row.content,
+        "model": row.model,
+        "created_at": row.created_at.isoformat(),
+        "metadata": _metadata(row)
+    })
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from ..core.config import get_settings
+from ..services.file_ingest import UploadError, UploadTooLarge
+from ..services.container import Services, get_services
+
+settings = get_settings()
+
+router = APIRouter(prefix=settings.API_V1_STR)
+
+@router.post("/files")
+async def upload_file(request: Request, filename: str = Query(..., max_length=255),
+                      services: Services = Depends(get_services)):
+    """Upload an attachment as the raw request body.
+    
+    The body is streamed to disk chunk by chunk and never held in memory.
+    Extraction starts in the background; the returned ``file_id`` can be
+    attached to a message straight away.
+    """
+    file_ingest = services.file_ingest
+    # Refuse a declared oversize body before reading any of it
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > file_ingest.max_bytes:
+        raise HTTPException(status_code=413, detail=f"File exceeds {file_ingest.max_bytes} bytes")
+    try:
+        upload = await file_ingest.save(filename, request.stream())
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    file_ingest.start_extraction(upload["file_id"])
+    return upload
+
+@router.get("/files/{file_id}")
+async def file_status(file_id: str, services: Services = Depends(get_services)):
+    """Extraction status and, once ready, the extracted text and metadata"""
+    status = services.file_ingest.status(file_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return {"file_id": file_id, **status}
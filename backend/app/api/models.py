@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException
+from ..core.config import get_settings
+from ..services.container import Services, get_services
+from ..services.model_registry import NoEnabledModels
+
+settings = get_settings()
+
+router = APIRouter(prefix=settings.API_V1_STR)
+
+def _catalogue(services: Services):
+    snapshot = services.ai_service.registry.snapshot
+    return {
+        "version": snapshot.version,
+        "models": {
+            name: {**entry, "capabilities": list(entry["capabilities"])}
+            for name, entry in snapshot.entries.items()
+        }
+    }
+
+@router.get("/models")
+async def list_models(services: Services = Depends(get_services)):
+    """Model catalogue with prices, as currently used for routing"""
+    return _catalogue(services)
+
+@router.post("/models/reload")
+async def reload_models(services: Services = Depends(get_services)):
+    """Re-read ai_models now instead of waiting for the next poll"""
+    try:
+        await services.ai_service.registry.reload()
+    except NoEnabledModels as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _catalogue(services)
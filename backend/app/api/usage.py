@@ -0,0 +1,45 @@
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from ..core.config import get_settings
+from ..core.database import get_db
+from ..services.usage import GROUP_COLUMNS, usage_stats, chat_usage
+
+settings = get_settings()
+
+router = APIRouter(prefix=settings.API_V1_STR)
+
+@router.get("/usage")
+def get_usage(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    group_by: str = "model",
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Requests, tokens and spend between two UTC days (inclusive), grouped
+    by a comma-separated list of day, provider and model. Served from the
+    daily rollups, so the cost does not grow with the number of calls."""
+    groups = [name for name in group_by.split(",") if name]
+    unknown = set(groups) - set(GROUP_COLUMNS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by {', '.join(sorted(unknown))}")
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start is after end")
+    return usage_stats(db, start, end, groups, provider, model)
+
+@router.get("/chats/{chat_id}/usage")
+def get_chat_usage(
+    chat_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Totals of a chat per model, between two UTC days (inclusive) when given"""
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start is after end")
+    return chat_usage(db, chat_id, start, end, provider, model)
@@ -1,80 +1,156 @@
+import asyncio
+from typing import Optional
 import socketio
-from ..services.ai_service import AIService
-from ..core.database import SessionLocal
-from ..models.models import Chat, Message
-import json
+from ..core.config import get_settings
+from ..services.container import get_services
+from ..services.generations import ChunkStream, TooManyGenerations
 
-sio = socketio.AsyncServer(
-    async_mode='asgi',
-    cors_allowed_origins=[
-        'http://localhost:51692',
-        'http://localhost:55237'
-    ]
-)
-app = socketio.ASGIApp(sio)
+settings = get_settings()
 
-ai_service = AIService()
+# Built by create_socketio_app
+sio: Optional[socketio.AsyncServer] = None
+
+def create_socketio_app() -> socketio.ASGIApp:
+    """Build the Socket.IO server with this module's event handlers"""
+    global sio
+    # With several workers, emits are relayed through Redis so a worker can
+    # reach sockets connected to another one
+    client_manager = None
+    if settings.SHARED_STATE_BACKEND == 'redis':
+        client_manager = socketio.AsyncRedisManager(settings.REDIS_URL)
+    
+    sio = socketio.AsyncServer(
+        async_mode='asgi',
+        client_manager=client_manager,
+        cors_allowed_origins=[
+            'http://localhost:51692',
+            'http://localhost:55237'
+        ]
+    )
+    for handler in (connect, disconnect, cancel, message):
+        sio.on(handler.__name__, handler)
+    # Mounted under /ws by main.py; Starlette keeps the full path in the scope
+    return socketio.ASGIApp(sio, socketio_path='ws/socket.io')
+
+def outbound_backlog(sid):
+    """Packets queued for a client that its transport has not written yet"""
+    socket = sio.eio.sockets.get(sio.manager.eio_sid_from_sid(sid, '/'))
+    return socket.queue.qsize() if socket is not None else 0
 
-@sio.event
 async def connect(sid, environ):
     print(f"Client connected: {sid}")
-    
-@sio.event
+
 async def disconnect(sid):
+    # Nobody is left to read these replies, so stop paying for them
+    get_services().generations.cancel(sid, reason='disconnect')
     print(f"Client disconnected: {sid}")
 
-@sio.event
+async def cancel(sid, data=None):
+    """Stop the reply being generated for ``chatId``, or every reply of this
+    client when no chat is given"""
+    chat_id = (data or {}).get('chatId')
+    get_services().generations.cancel(sid, int(chat_id) if chat_id else None)
+
 async def message(sid, data):
     try:
         content = data.get('content')
         chat_id = data.get('chatId')
+        chat_id = int(chat_id) if chat_id else None
         task_type = data.get('taskType', 'general')
+        attachments = data.get('attachments') or []
         
-        # Store user message
-        db = SessionLocal()
-        if not chat_id:
-            chat = Chat()
-            db.add(chat)
-            db.commit()
-            chat_id = chat.id
-        
-        user_message = Message(
-            chat_id=chat_id,
-            content=content,
-            role='user'
-        )
-        db.add(user_message)
-        db.commit()
-        
-        # Generate AI response
-        response = await ai_service.route_query(content, task_type)
-        
-        # Store AI response
-        ai_message = Message(
-            chat_id=chat_id,
-            content=response['content'],
-            role='assistant',
-            model=response['model'],
-            metadata={
-                'provider': response['provider'],
-                'metrics': response['metrics']
-            }
-        )
-        db.add(ai_message)
-        db.commit()
-        
-        # Send response back to client
-        await sio.emit('message', {
-            'chatId': chat_id,
-            'content': response['content'],
-            'role': 'assistant',
-            'model': response['model'],
-            'provider': response['provider'],
-            'metrics': response['metrics']
-        }, room=sid)
+        # A new message for a chat supersedes the reply still streaming there
+        try:
+            generation = get_services().generations.start(
+                sid,
+                chat_id if chat_id is not None else object(),
+                respond(sid, chat_id, content, task_type, attachments)
+            )
+        except TooManyGenerations as e:
+            await sio.emit('error', {'message': str(e)}, room=sid)
+            return
         
+        try:
+            await generation.task
+        except asyncio.CancelledError:
+            if generation.reason is None:
+                raise
+            if generation.reason != 'disconnect':
+                await sio.emit('cancelled', {
+                    'chatId': chat_id,
+                    'reason': generation.reason
+                }, room=sid)
+    
     except Exception as e:
         print(f"Error processing message: {str(e)}")
         await sio.emit('error', {'message': str(e)}, room=sid)
-    finally:
-        db.close()
\ No newline at end of file
+
+async def respond(sid, chat_id, content, task_type, attachments):
+    """Generate, stream and store the reply to one message. Cancelling this
+    coroutine stops the upstream call; the part of the reply streamed until
+    then is stored, marked partial."""
+    services = get_services()
+    persistence = services.persistence
+    # Load earlier turns before this one is recorded
+    if chat_id is not None:
+        history = await services.context_builder.history(chat_id)
+    else:
+        chat_id = await persistence.new_chat()
+        history = []
+    
+    # Store user message; writes are batched off the event loop
+    persistence.add_message(chat_id, 'user', content)
+    
+    # Stream the AI response back as it is generated, coalescing chunks
+    # while the client is slow to read them
+    async def send_chunk(text, seq):
+        await sio.emit('message_chunk', {
+            'chatId': chat_id,
+            'seq': seq,
+            'content': text
+        }, room=sid)
+    
+    stream = ChunkStream(send_chunk, lambda: outbound_backlog(sid))
+    try:
+        # Extracted attachment text goes to the model; only the typed
+        # message is stored in the chat history
+        query = content
+        if attachments:
+            attachment_context = await services.file_ingest.context_for(attachments, content)
+            if attachment_context:
+                query = f"{attachment_context}\n\n{content}"
+        
+        response = await services.ai_service.route_query(
+            query, task_type, on_token=stream.push, history=history, chat_id=chat_id
+        )
+        # Chunks still buffered go out before the final message
+        await stream.close()
+    except asyncio.CancelledError:
+        stream.abort()
+        # Keep what the client has seen so the chat history matches it
+        if stream.text:
+            persistence.add_message(chat_id, 'assistant', stream.text, metrics={'partial': True})
+        raise
+    except BaseException:
+        stream.abort()
+        raise
+    
+    # Store AI response
+    persistence.add_message(
+        chat_id,
+        'assistant',
+        response['content'],
+        model=response['model'],
+        provider=response['provider'],
+        metrics=response['metrics']
+    )
+    
+    # Send the assembled response back to client
+    await sio.emit('message', {
+        'chatId': chat_id,
+        'content': response['content'],
+        'role': 'assistant',
+        'model': response['model'],
+        'provider': response['provider'],
+        'metrics': response['metrics']
+    }, room=sid)
@@ -0,0 +1,354 @@
+"""Concurrent benchmark harness for AIService and the Socket.IO endpoint.
+
+By default every provider is replaced by the local mock servers in
+``mock_providers`` so runs are offline and comparable across commits. The
+report (throughput, latency and time-to-first-token percentiles, event-loop
+lag) is written as JSON.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+import aiohttp
+from ..core.config import get_settings
+from ..services.router import percentile
+from .mock_providers import MockConfig, serve
+
+settings = get_settings()
+
+DEFAULT_PROMPTS = [
+    "Write a haiku about artificial intelligence.",
+    "Explain quantum computing in simple terms.",
+    "What are the three laws of robotics?"
+]
+
+Sample = Dict[str, Any]
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a sleeping task"""
+    
+    def __init__(self, interval_s: float = 0.01):
+        self.interval_s = interval_s
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval_s)
+            self.samples.append(max(0.0, (loop.time() - start - self.interval_s) * 1000))
+    
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+def distribution(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    return {
+        "p50": percentile(ordered, 50),
+        "p95": percentile(ordered, 95),
+        "p99": percentile(ordered, 99),
+        "mean": sum(ordered) / len(ordered),
+        "max": ordered[-1]
+    }
+
+def summarize(samples: List[Sample], elapsed_s: float) -> Dict[str, Any]:
+    ok = [s for s in samples if s["ok"]]
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "elapsed_s": elapsed_s,
+        "throughput_rps": len(ok) / elapsed_s if elapsed_s else 0.0,
+        "latency_ms": distribution([s["latency_ms"] for s in ok]),
+        "ttft_ms": distribution([s["ttft_ms"] for s in ok if s["ttft_ms"] is not None])
+    }
+
+async def drive(request: Callable[[int], Awaitable[Sample]], total: int,
+                concurrency: int, rate: float) -> List[Sample]:
+    """Issue ``total`` requests with at most ``concurrency`` in flight. With a
+    ``rate`` (requests/s) arrivals are open-loop; otherwise closed-loop."""
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    
+    async def one(i: int) -> Sample:
+        async with semaphore:
+            return await request(i)
+    
+    tasks = []
+    start = loop.time()
+    for i in range(total):
+        if rate:
+            await asyncio.sleep(max(0.0, start + i / rate - loop.time()))
+        tasks.append(loop.create_task(one(i)))
+    return await asyncio.gather(*tasks)
+
+REQUEST_TIMEOUT_S = 120.0
+
+async def timed(call: Callable[[Callable[[], None]], Awaitable[Any]]) -> Sample:
+    """Run ``call(mark_first_token)`` and time it"""
+    start = time.perf_counter()
+    first = None
+    
+    def mark_first_token():
+        nonlocal first
+        if first is None:
+            first = time.perf_counter()
+    
+    try:
+        await asyncio.wait_for(call(mark_first_token), REQUEST_TIMEOUT_S)
+        ok, error = True, None
+    except asyncio.TimeoutError:
+        ok, error = False, "timed out"
+    except Exception as e:
+        ok, error = False, str(e)
+    end = time.perf_counter()
+    return {
+        "ok": ok,
+        "error": error,
+        "latency_ms": (end - start) * 1000,
+        "ttft_ms": (first - start) * 1000 if first is not None else None
+    }
+
+async def bench_ai_service(prompts: List[str], total: int, concurrency: int, rate: float,
+                           on_result: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    from ..services.ai_service import AIService
+    service = AIService()
+    await service.start()
+    
+    async def request(i: int) -> Sample:
+        prompt = prompts[i % len(prompts)]
+        
+        async def call(mark_first_token):
+            async def on_token(text):
+                mark_first_token()
+            try:
+                response = await service.route_query(prompt, "general", on_token=on_token)
+            except Exception as e:
+                if on_result:
+                    on_result(prompt, {"success": False, "error": str(e)})
+                raise
+            if on_result:
+                on_result(prompt, response)
+        
+        return await timed(call)
+    
+    try:
+        return await _measure(request, total, concurrency, rate)
+    finally:
+        await service.aclose()
+
+async def bench_socketio(prompts: List[str], total: int, concurrency: int, rate: float,
+                         port: int) -> Dict[str, Any]:
+    import socketio
+    import uvicorn
+    from ..main import create_app
+    
+    server = uvicorn.Server(uvicorn.Config(create_app(), host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.get_running_loop().create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    
+    clients: asyncio.Queue = asyncio.Queue()
+    connected = []
+    for _ in range(concurrency):
+        client = socketio.AsyncClient()
+        client.pending = None
+        
+        def handlers(client):
+            async def on_chunk(data):
+                if client.pending:
+                    client.pending["first_token"]()
+            
+            async def on_message(data):
+                if client.pending and not client.pending["done"].done():
+                    client.pending["done"].set_result(data)
+            
+            async def on_error(data):
+                if client.pending and not client.pending["done"].done():
+                    client.pending["done"].set_exception(RuntimeError(data.get("message")))
+            
+            client.on("message_chunk", on_chunk)
+            client.on("message", on_message)
+            client.on("error", on_error)
+        
+        handlers(client)
+        await client.connect(f"http://127.0.0.1:{port}", socketio_path="/ws/socket.io", transports=["websocket"])
+        connected.append(client)
+        clients.put_nowait(client)
+    
+    async def request(i: int) -> Sample:
+        client = await clients.get()
+        
+        async def call(mark_first_token):
+            client.pending = {
+                "first_token": mark_first_token,
+                "done": asyncio.get_running_loop().create_future()
+            }
+            await client.emit("message", {"content": prompts[i % len(prompts)], "taskType": "general"})
+            await client.pending["done"]
+        
+        try:
+            return await timed(call)
+        finally:
+            client.pending = None
+            clients.put_nowait(client)
+    
+    try:
+        return await _measure(request, total, concurrency, rate)
+    finally:
+        for client in connected:
+            await client.disconnect()
+        server.should_exit = True
+        await server_task
+
+async def _measure(request, total: int, concurrency: int, rate: float) -> Dict[str, Any]:
+    monitor = LoopLagMonitor()
+    monitor.start()
+    start = time.perf_counter()
+    samples = await drive(request, total, concurrency, rate)
+    elapsed = time.perf_counter() - start
+    await monitor.stop()
+    report = summarize(samples, elapsed)
+    report["event_loop_lag_ms"] = distribution(monitor.samples)
+    errors = sorted({s["error"] for s in samples if s["error"]})
+    report["error_messages"] = errors[:10]
+    return report
+
+def start_mock_providers(port: int, config: MockConfig) -> multiprocessing.Process:
+    """Start the mock servers in a separate process so their work does not
+    show up as event-loop lag in the process being measured"""
+    process = multiprocessing.get_context("spawn").Process(target=serve, args=(port, config), daemon=True)
+    process.start()
+    
+    async def wait_ready():
+        async with aiohttp.ClientSession() as session:
+            for _ in range(100):
+                try:
+                    async with session.get(f"http://127.0.0.1:{port}/health") as response:
+                        if response.status == 200:
+                            return
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.1)
+        raise RuntimeError("Mock providers did not start")
+    
+    asyncio.run(wait_ready())
+    return process
+
+def use_mock_providers(port: int):
+    """Point every provider at the mock servers and lift quotas that would
+    otherwise throttle the benchmark"""
+    base = f"http://127.0.0.1:{port}"
+    settings.OPENAI_BASE_URL = f"{base}/v1"
+    settings.ANTHROPIC_BASE_URL = base
+    settings.DEEPSEEK_BASE_URL = f"{base}/v1"
+    settings.OPENAI_API_KEY = settings.OPENAI_API_KEY or "mock"
+    settings.ANTHROPIC_API_KEY = settings.ANTHROPIC_API_KEY or "mock"
+    settings.DEEPSEEK_API_KEY = settings.DEEPSEEK_API_KEY or "mock"
+    settings.PROVIDER_LIMITS = {
+        name: {"rpm": 10 ** 9, "tpm": 10 ** 12, "concurrency": 10 ** 6}
+        for name in settings.PROVIDER_LIMITS
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark AIService and the Socket.IO endpoint")
+    parser.add_argument("--target", choices=["ai_service", "socketio", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=0.0, help="arrivals per second; 0 for closed loop")
+    parser.add_argument("--prompts", help="file with one prompt per line")
+    parser.add_argument("--live", action="store_true", help="call the real providers instead of mocks")
+    parser.add_argument("--cache", action="store_true", help="keep the response cache enabled")
+    parser.add_argument("--mock-port", type=int, default=18080)
+    parser.add_argument("--server-port", type=int, default=18081)
+    parser.add_argument("--ttft-ms", type=float, default=MockConfig.ttft_ms)
+    parser.add_argument("--ttft-sigma", type=float, default=MockConfig.ttft_sigma)
+    parser.add_argument("--tokens-per-s", type=float, default=MockConfig.tokens_per_s)
+    parser.add_argument("--output-tokens", type=int, default=MockConfig.output_tokens)
+    parser.add_argument("--error-rate", type=float, default=MockConfig.error_rate)
+    parser.add_argument("--error-status", type=int, default=MockConfig.error_status)
+    parser.add_argument("--output", help="report path (default bench_results/<timestamp>.json)")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    prompts = DEFAULT_PROMPTS
+    if args.prompts:
+        with open(args.prompts) as f:
+            prompts = [line.strip() for line in f if line.strip()]
+    
+    settings.RESPONSE_CACHE_ENABLED = args.cache
+    mock_config = MockConfig(
+        ttft_ms=args.ttft_ms,
+        ttft_sigma=args.ttft_sigma,
+        tokens_per_s=args.tokens_per_s,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status
+    )
+    mock_process = None
+    if not args.live:
+        mock_process = start_mock_providers(args.mock_port, mock_config)
+        use_mock_providers(args.mock_port)
+    if args.target in ("socketio", "both"):
+        settings.DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    
+    report = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_commit": git_commit(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "live": args.live,
+            "cache": args.cache,
+            "mock": None if args.live else asdict(mock_config)
+        },
+        "results": {}
+    }
+    try:
+        if args.target in ("ai_service", "both"):
+            report["results"]["ai_service"] = asyncio.run(
+                bench_ai_service(prompts, args.requests, args.concurrency, args.rate)
+            )
+        if args.target in ("socketio", "both"):
+            report["results"]["socketio"] = asyncio.run(
+                bench_socketio(prompts, args.requests, args.concurrency, args.rate, args.server_port)
+            )
+    finally:
+        if mock_process is not None:
+            mock_process.terminate()
+    
+    output = args.output or os.path.join(
+        "bench_results", f"bench-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"Report written to {output}")
+    return report
@@ -0,0 +1,159 @@
+"""Local stand-ins for the OpenAI, Anthropic and Deepseek HTTP APIs.
+
+The servers answer with synthetic completions after a configurable delay,
+stream tokens at a configurable rate and fail a configurable fraction of
+requests, so benchmarks run offline and reproducibly.
+"""
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, asdict
+from aiohttp import web
+
+WORDS = "the quick brown fox jumps over a lazy dog while models stream tokens".split()
+
+@dataclass
+class MockConfig:
+    ttft_ms: float = 300.0           # median time to first token
+    ttft_sigma: float = 0.5          # lognormal spread of the first-token delay
+    tokens_per_s: float = 80.0       # streaming rate once the first token is out
+    output_tokens: int = 60
+    error_rate: float = 0.0
+    error_status: int = 500          # e.g. 429 to exercise rate-limit handling
+    seed: int = 0
+
+class MockProviders:
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.requests = 0
+    
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/v1/messages", self.messages)
+        app.router.add_get("/health", lambda request: web.json_response({"ok": True}))
+        return app
+    
+    async def _first_token_delay(self):
+        delay = self.config.ttft_ms / 1000 * self.random.lognormvariate(0, self.config.ttft_sigma)
+        await asyncio.sleep(delay)
+    
+    def _should_fail(self) -> bool:
+        return self.random.random() < self.config.error_rate
+    
+    def _tokens(self):
+        return [self.random.choice(WORDS) + " " for _ in range(self.config.output_tokens)]
+    
+    @staticmethod
+    def _input_tokens(messages) -> int:
+        return sum(len(m.get("content", "")) for m in messages) // 4 + 1
+    
+    async def _stream(self, request: web.Request, events):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        interval = 1 / self.config.tokens_per_s
+        for event, pause in events:
+            await response.write(event.encode("utf-8"))
+            if pause:
+                await asyncio.sleep(interval)
+        await response.write_eof()
+        return response
+    
+    async def chat_completions(self, request: web.Request):
+        """OpenAI-compatible endpoint, also used for Deepseek"""
+        self.requests += 1
+        body = await request.json()
+        await self._first_token_delay()
+        if self._should_fail():
+            return web.json_response({"error": {"message": "mock failure"}}, status=self.config.error_status)
+        tokens = self._tokens()
+        usage = {
+            "prompt_tokens": self._input_tokens(body["messages"]),
+            "completion_tokens": len(tokens)
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": f"mock-{self.requests}", "created": int(time.time()), "model": body["model"]}
+        
+        if not body.get("stream"):
+            return web.json_response({
+                **base,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+        
+        def chunk(delta, finish_reason=None, chunk_usage=None):
+            choices = [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            payload = {**base, "object": "chat.completion.chunk", "choices": choices, "usage": chunk_usage}
+            return f"data: {json.dumps(payload)}\n\n"
+        
+        events = [(chunk({"role": "assistant", "content": ""}), False)]
+        events += [(chunk({"content": token}), True) for token in tokens]
+        events.append((chunk({}, "stop"), False))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            events.append((chunk(None, chunk_usage=usage), False))
+        events.append(("data: [DONE]\n\n", False))
+        return await self._stream(request, events)
+    
+    async def messages(self, request: web.Request):
+        """Anthropic Messages endpoint"""
+        self.requests += 1
+        body = await request.json()
+        await self._first_token_delay()
+        if self._should_fail():
+            return web.json_response(
+                {"type": "error", "error": {"type": "api_error", "message": "mock failure"}},
+                status=self.config.error_status
+            )
+        tokens = self._tokens()[:body.get("max_tokens", self.config.output_tokens)]
+        input_tokens = self._input_tokens(body["messages"])
+        message = {
+            "id": f"mock-{self.requests}",
+            "type": "message",
+            "role": "assistant",
+            "model": body["model"],
+            "content": [],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": 0}
+        }
+        
+        if not body.get("stream"):
+            message.update(
+                content=[{"type": "text", "text": "".join(tokens)}],
+                stop_reason="end_turn",
+                usage={"input_tokens": input_tokens, "output_tokens": len(tokens)}
+            )
+            return web.json_response(message)
+        
+        def event(name, payload):
+            return f"event: {name}\ndata: {json.dumps({'type': name, **payload})}\n\n"
+        
+        events = [
+            (event("message_start", {"message": message}), False),
+            (event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}}), False)
+        ]
+        events += [
+            (event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": token}}), True)
+            for token in tokens
+        ]
+        events += [
+            (event("content_block_stop", {"index": 0}), False),
+            (event("message_delta", {
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": len(tokens)}
+            }), False),
+            (event("message_stop", {}), False)
+        ]
+        return await self._stream(request, events)
+
+def serve(port: int, config: MockConfig):
+    """Run the mock servers in the current process until killed"""
+    print(f"Mock providers on port {port}: {asdict(config)}")
+    web.run_app(MockProviders(config).app(), host="127.0.0.1", port=port, print=None)
@@ -0,0 +1,139 @@
+"""Import-time and cold-start benchmark for the API server.
+
+Each run uses a fresh interpreter. ``import`` runs measure ``import app.main``
+with ``-X importtime`` and attribute the time to top-level packages.
+``startup`` runs measure the time from spawning ``uvicorn --factory`` to the
+first answered request. The report is written as JSON next to the
+load-benchmark reports.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Any, List
+from .harness import git_commit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _env(db_dir: str) -> Dict[str, str]:
+    # A throwaway database and no provider traffic, so runs are offline
+    return {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(db_dir, 'startup.db')}",
+        "PROVIDER_WARMUP_CONNECTIONS": "0"
+    }
+
+def parse_importtime(stderr: str) -> Dict[str, Any]:
+    """Total import time of app.main and self time per top-level package, in ms"""
+    packages = defaultdict(float)
+    total_us = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # column header
+        name = fields[2].strip()
+        packages[name.split(".")[0]] += self_us / 1000
+        if name == "app.main":
+            total_us = cumulative_us
+    return {"total_ms": total_us / 1000, "packages_ms": dict(packages)}
+
+def bench_import(runs: int, env: Dict[str, str]) -> Dict[str, Any]:
+    totals, walls = [], []
+    packages: Dict[str, List[float]] = defaultdict(list)
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import app.main"],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+        )
+        walls.append((time.perf_counter() - start) * 1000)
+        parsed = parse_importtime(result.stderr)
+        totals.append(parsed["total_ms"])
+        for name, ms in parsed["packages_ms"].items():
+            packages[name].append(ms)
+    slowest = sorted(packages.items(), key=lambda item: -statistics.median(item[1]))[:15]
+    return {
+        "runs": runs,
+        "import_ms_median": statistics.median(totals),
+        "import_ms_min": min(totals),
+        "process_ms_median": statistics.median(walls),
+        "slowest_packages_ms": {name: round(statistics.median(ms), 1) for name, ms in slowest}
+    }
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def bench_startup(runs: int, env: Dict[str, str], timeout_s: float = 30.0) -> Dict[str, Any]:
+    readies = []
+    for _ in range(runs):
+        port = _free_port()
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:create_app", "--factory",
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env
+        )
+        try:
+            while True:
+                if time.perf_counter() - start > timeout_s or process.poll() is not None:
+                    raise RuntimeError("Server did not start")
+                try:
+                    urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1).close()
+                    break
+                except OSError:
+                    time.sleep(0.01)
+            readies.append((time.perf_counter() - start) * 1000)
+        finally:
+            process.terminate()
+            process.wait()
+    return {
+        "runs": runs,
+        "ready_ms_median": statistics.median(readies),
+        "ready_ms_min": min(readies)
+    }
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark import time and cold start of the API server")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target", choices=["import", "startup", "both"], default="both")
+    parser.add_argument("--output", help="report path (default bench_results/startup-<timestamp>.json)")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    db_dir = tempfile.mkdtemp()
+    env = _env(db_dir)
+    report = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "results": {}
+    }
+    if args.target in ("import", "both"):
+        report["results"]["import"] = bench_import(args.runs, env)
+    if args.target in ("startup", "both"):
+        report["results"]["startup"] = bench_startup(args.runs, env)
+    
+    output = args.output or os.path.join(
+        "bench_results", f"startup-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"Report written to {output}")
+    return report
@@ -0,0 +1,255 @@
+"""Storage benchmark for chat messages.
+
+Writes the same synthetic chats once in the previous layout (plain text
+content, every reply metric inside the JSON metadata) and once in the
+current one (compressed content, typed metric columns), each to a fresh
+SQLite file. Reports file size after VACUUM, batched write throughput,
+history-page and full-scan read throughput, and a spend-per-provider
+aggregate. The report is written as JSON next to the load-benchmark
+reports.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from sqlalchemy import (
+    MetaData, Table, Column, Integer, String, Text, DateTime, JSON, Index,
+    create_engine, event, insert, select, text
+)
+from ..core.config import get_settings
+from ..core.database import set_sqlite_pragmas
+from ..models.models import Base, Chat, Message, MESSAGE_METRIC_COLUMNS
+from ..models.types import resolve_codec
+from .harness import git_commit
+
+settings = get_settings()
+
+# The messages table before content compression and typed metrics
+legacy_metadata = MetaData()
+legacy_messages = Table(
+    "messages", legacy_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("chat_id", Integer),
+    Column("content", Text),
+    Column("role", String),
+    Column("model", String, nullable=True),
+    Column("created_at", DateTime),
+    Column("message_metadata", JSON, nullable=True),
+    Index("ix_messages_chat_id_created_at", "chat_id", "created_at", "id")
+)
+
+SYLLABLES = (
+    "a", "an", "ar", "be", "co", "de", "di", "el", "en", "er", "ex", "in", "is", "la", "le",
+    "ma", "me", "mo", "ne", "no", "on", "or", "pa", "pe", "ra", "re", "ri", "ro", "se", "si",
+    "ta", "te", "ti", "to", "tu", "un", "ur", "va", "ve", "vi"
+)
+MODELS = (("gpt-4-turbo", "openai"), ("gpt-3.5-turbo", "openai"), ("claude-3-opus", "anthropic"))
+
+def synthetic_messages(count: int, per_chat: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Alternating questions and replies. Words follow a Zipf distribution
+    over a fixed vocabulary, so text compresses roughly like prose; replies
+    are long-tailed in length and some contain code."""
+    rng = random.Random(seed)
+    vocabulary = sorted({
+        "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(6000)
+    })
+    rng.shuffle(vocabulary)
+    cumulative, total = [], 0.0
+    for rank in range(len(vocabulary)):
+        total += 1 / (rank + 1)
+        cumulative.append(total)
+    
+    def prose(chars: int) -> str:
+        words = rng.choices(vocabulary, cum_weights=cumulative, k=max(1, chars // 6))
+        sentences = [" ".join(words[i:i + 14]).capitalize() + "." for i in range(0, len(words), 14)]
+        return "\n\n".join(" ".join(sentences[i:i + 4]) for i in range(0, len(sentences), 4))
+    
+    messages = []
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        chat_id, turn = i // per_chat + 1, i % per_chat
+        created_at = start + timedelta(seconds=i)
+        if turn % 2 == 0:
+            messages.append({"chat_id": chat_id, "role": "user", "created_at": created_at,
+                             "content": prose(int(min(2000, rng.lognormvariate(5.0, 0.8))))})
+            continue
+        content = prose(int(min(20000, rng.lognormvariate(7.2, 0.9))))
+        if rng.random() < 0.3:
+            content += "\n\n```python\n" + "\n".join(
+                f"    {rng.choice(vocabulary)} = {rng.choice(vocabulary)}({rng.randint(0, 99)})"
+                for _ in range(rng.randint(3, 30))
+            ) + "\n```"
+        model, provider = rng.choice(MODELS)
+        tokens = len(content) // 4
+        messages.append({
+            "chat_id": chat_id, "role": "assistant", "created_at": created_at,
+            "content": content, "model": model, "provider": provider,
+            "metrics": {
+                "tokens_used": tokens,
+                "cost_usd": tokens * 0.00003,
+                "latency_ms": rng.uniform(500, 8000),
+                "time_to_first_token_ms": rng.uniform(150, 900),
+                "queue_wait_ms": rng.uniform(0, 5),
+                "queue_depth": rng.randint(0, 3),
+                "task_type": "general",
+                "task_confidence": rng.random()
+            }
+        })
+    return messages
+
+def legacy_row(message: Dict[str, Any]) -> Dict[str, Any]:
+    metadata = None
+    if message["role"] == "assistant":
+        metadata = {"provider": message["provider"], "metrics": message["metrics"]}
+    return {
+        "chat_id": message["chat_id"], "role": message["role"], "content": message["content"],
+        "model": message.get("model"), "created_at": message["created_at"], "message_metadata": metadata
+    }
+
+def current_row(message: Dict[str, Any]) -> Dict[str, Any]:
+    # Same split as PersistenceService.add_message
+    extra = dict(message.get("metrics") or {})
+    typed = {name: extra.pop(name, None) for name in MESSAGE_METRIC_COLUMNS}
+    return {
+        "chat_id": message["chat_id"], "role": message["role"], "content": message["content"],
+        "model": message.get("model"), "provider": message.get("provider"), **typed,
+        "created_at": message["created_at"], "message_metadata": {"metrics": extra} if extra else None
+    }
+
+LAYOUTS = {
+    "before": {
+        "table": legacy_messages,
+        "create": lambda engine: legacy_metadata.create_all(engine),
+        "row": legacy_row,
+        "engine_options": {},
+        "aggregate": (
+            "SELECT json_extract(message_metadata, '$.provider'), "
+            "SUM(json_extract(message_metadata, '$.metrics.cost_usd')), "
+            "SUM(json_extract(message_metadata, '$.metrics.tokens_used')) "
+            "FROM messages WHERE message_metadata IS NOT NULL GROUP BY 1"
+        )
+    },
+    "after": {
+        "table": Message.__table__,
+        "create": lambda engine: Base.metadata.create_all(engine, tables=[Chat.__table__, Message.__table__]),
+        "row": current_row,
+        "engine_options": {"json_serializer": lambda value: json.dumps(value, separators=(",", ":"))},
+        "aggregate": (
+            "SELECT provider, SUM(cost_usd), SUM(tokens_used) "
+            "FROM messages WHERE provider IS NOT NULL GROUP BY provider"
+        )
+    }
+}
+
+def bench_layout(name: str, messages: List[Dict[str, Any]], db_dir: str,
+                 batch_size: int, page_reads: int, seed: int) -> Dict[str, Any]:
+    layout = LAYOUTS[name]
+    path = os.path.join(db_dir, f"{name}.db")
+    engine = create_engine(f"sqlite:///{path}", **layout["engine_options"])
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    layout["create"](engine)
+    table = layout["table"]
+    
+    # One transaction per batch, as the persistence writer does
+    rows = [layout["row"](message) for message in messages]
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        with engine.begin() as conn:
+            conn.execute(insert(table), rows[i:i + batch_size])
+    write_s = time.perf_counter() - start
+    
+    with engine.connect() as conn:
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        conn.execute(text("VACUUM"))
+    db_bytes = os.path.getsize(path)
+    
+    # Latest page of random chats, through the chat-history index
+    rng = random.Random(seed)
+    chats = messages[-1]["chat_id"]
+    page = (
+        select(table.c.role, table.c.content, table.c.message_metadata)
+        .where(table.c.chat_id == text(":chat_id"))
+        .order_by(table.c.created_at.desc(), table.c.id.desc())
+        .limit(50)
+    )
+    page_rows = 0
+    with engine.connect() as conn:
+        start = time.perf_counter()
+        for _ in range(page_reads):
+            page_rows += len(conn.execute(page, {"chat_id": rng.randint(1, chats)}).all())
+        page_s = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        scanned_chars = sum(len(content) for content, in conn.execute(select(table.c.content)))
+        scan_s = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        totals = conn.execute(text(layout["aggregate"])).all()
+        aggregate_s = time.perf_counter() - start
+    engine.dispose()
+    
+    return {
+        "db_bytes": db_bytes,
+        "bytes_per_message": db_bytes / len(messages),
+        "write_rows_per_s": len(rows) / write_s,
+        "page_read_rows_per_s": page_rows / page_s,
+        "scan_rows_per_s": len(rows) / scan_s,
+        "scan_chars": scanned_chars,
+        "aggregate_ms": aggregate_s * 1000,
+        "aggregate": {provider: {"cost_usd": cost, "tokens": tokens} for provider, cost, tokens in totals}
+    }
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark message storage size and throughput")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--per-chat", type=int, default=20, help="messages per chat")
+    parser.add_argument("--page-reads", type=int, default=2000, help="history pages read")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="report path (default bench_results/storage-<timestamp>.json)")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    messages = synthetic_messages(args.messages, args.per_chat, args.seed)
+    db_dir = tempfile.mkdtemp()
+    results = {
+        name: bench_layout(name, messages, db_dir, settings.DB_WRITE_BATCH_SIZE, args.page_reads, args.seed)
+        for name in LAYOUTS
+    }
+    before, after = results["before"], results["after"]
+    report = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "messages": args.messages,
+        "content_chars": sum(len(m["content"]) for m in messages),
+        "codec": resolve_codec(),
+        "min_bytes": settings.MESSAGE_COMPRESSION_MIN_BYTES,
+        "results": results,
+        "after_vs_before": {
+            metric: after[metric] / before[metric]
+            for metric in ("db_bytes", "write_rows_per_s", "page_read_rows_per_s",
+                           "scan_rows_per_s", "aggregate_ms")
+        }
+    }
+    
+    output = args.output or os.path.join(
+        "bench_results", f"storage-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps({key: report[key] for key in ("codec", "min_bytes", "after_vs_before")}, indent=2))
+    for name, result in results.items():
+        print(f"{name}: {result['db_bytes'] / 2 ** 20:.1f} MiB, "
+              f"write {result['write_rows_per_s']:.0f} rows/s, "
+              f"page reads {result['page_read_rows_per_s']:.0f} rows/s, "
+              f"scan {result['scan_rows_per_s']:.0f} rows/s, "
+              f"aggregate {result['aggregate_ms']:.1f} ms")
+    print(f"Report written to {output}")
+    return report
@@ -1,9 +1,5 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "OneTap AI"
@@ -12,15 +8,174 @@ class Settings(BaseSettings):
     
     DATABASE_URL: str = "sqlite:///./onetap.db"
     REDIS_URL: str = "redis://localhost:6379"
+    # Create tables and apply migrations at startup. run.py does this once
+    # before spawning several workers and turns it off for them
+    SCHEMA_CHECK_ON_STARTUP: bool = True
+    
+    # Scale-out: uvicorn worker processes per node, and where state shared
+    # between them lives ("memory" for a single worker, "redis" via REDIS_URL
+    # for Socket.IO fan-out, router statistics and chat context versions)
+    WORKERS: int = 1
+    SHARED_STATE_BACKEND: str = "memory"
+    # Counters the in-process backend keeps, least recently used dropped first
+    SHARED_STATE_MAX_COUNTERS: int = 100000
+    ROUTER_SYNC_INTERVAL_S: float = 2.0
+    
+    # Batched chat/message writer
+    DB_WRITE_BATCH_SIZE: int = 500
+    DB_WRITE_FLUSH_INTERVAL_MS: int = 50
+    # A failed batch is retried this often, then written one row at a time
+    DB_WRITE_RETRIES: int = 2
+    DB_WRITE_RETRY_DELAY_MS: int = 100
+    DB_BUSY_TIMEOUT_MS: int = 5000
+    # Chat ids each worker reserves at a time from the shared sequence
+    CHAT_ID_BLOCK_SIZE: int = 100
+    # Message content of at least MESSAGE_COMPRESSION_MIN_BYTES is stored
+    # compressed on SQLite: "auto" uses zstd when the zstandard package is
+    # installed and zlib otherwise; "none" stores plain text
+    MESSAGE_COMPRESSION: str = "auto"
+    MESSAGE_COMPRESSION_MIN_BYTES: int = 512
+    
+    # API-call telemetry buffer; records beyond the capacity are dropped and counted
+    TELEMETRY_DATABASE_URL: str = "sqlite:///api_calls.db"
+    TELEMETRY_BUFFER_SIZE: int = 50000
+    TELEMETRY_BATCH_SIZE: int = 1000
+    TELEMETRY_FLUSH_INTERVAL_MS: int = 500
+    
+    OPENAI_API_KEY: str = ""
+    ANTHROPIC_API_KEY: str = ""
+    DEEPSEEK_API_KEY: str = ""
+    
+    # Provider endpoints; overridden to point at local mock servers in benchmarks
+    OPENAI_BASE_URL: str = "https://api.openai.com/v1"
+    ANTHROPIC_BASE_URL: str = "https://api.anthropic.com"
+    DEEPSEEK_BASE_URL: str = "https://api.deepseek.com/v1"
+    
+    # Attachments: streamed to UPLOAD_DIR, extracted in a process pool and
+    # cached by content hash. CSVs are converted to Arrow and queried locally
+    UPLOAD_DIR: str = "./uploads"
+    UPLOAD_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    EXTRACTION_WORKERS: int = 2
+    EXTRACTION_CACHE_ENTRIES: int = 256
+    EXTRACT_MAX_CHARS: int = 20000
+    PDF_MAX_PAGES: int = 500
+    CSV_SAMPLE_ROWS: int = 20
+    IMAGE_MAX_SIDE: int = 1024
+    
+    # Bulk jobs. Items are fanned out at batch priority, except that a
+    # model's items go to the provider's batch API (cheaper, but results take
+    # minutes to hours) when a job has at least BATCH_PROVIDER_MIN_ITEMS of
+    # them. A worker holds a lease on a running job; jobs whose lease lapses
+    # are resumed by another worker
+    BATCH_MAX_ITEMS: int = 50000
+    BATCH_CONCURRENCY: int = 32
+    BATCH_ITEM_ATTEMPTS: int = 2
+    BATCH_PROVIDER_API_ENABLED: bool = True
+    BATCH_PROVIDER_MIN_ITEMS: int = 100
+    BATCH_PROVIDER_CHUNK_ITEMS: int = 10000
+    BATCH_PROVIDER_PRICE_FACTOR: float = 0.5
+    BATCH_POLL_INTERVAL_S: float = 30.0
+    BATCH_LEASE_S: float = 60.0
+    BATCH_WRITE_INTERVAL_MS: int = 200
+    
+    # Per-socket backpressure: concurrent generations, and the outbound
+    # buffer that coalesces streamed chunks for slow clients
+    SOCKET_MAX_INFLIGHT: int = 4
+    SOCKET_STREAM_BUFFER_CHARS: int = 256 * 1024
+    SOCKET_MAX_QUEUED_PACKETS: int = 64
+    SOCKET_STREAM_INTERVAL_MS: float = 20.0
+    
+    # Per-chat history windows kept in memory for context building
+    CONTEXT_CACHE_CHATS: int = 10000
+    CONTEXT_WINDOW_MESSAGES: int = 100
+    CONTEXT_WINDOW_TOKENS: int = 32000
+    # Per-chat message counts in shared state expire after this long unused;
+    # a window not checked against its count for as long is reloaded
+    CONTEXT_VERSION_TTL_S: int = 86400
+    
+    # Response cache: in-memory LRU plus an optional persistent tier
+    # ("memory", "redis" via REDIS_URL, or "sqlite" as a local stand-in)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_BACKEND: str = "memory"
+    RESPONSE_CACHE_TTL_S: int = 3600
+    RESPONSE_CACHE_MAX_ENTRIES: int = 10000
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    RESPONSE_CACHE_SQLITE_PATH: str = "./response_cache.db"
+    
+    # Model catalogue and prices are read from ai_models and re-read this often
+    MODEL_REGISTRY_POLL_S: float = 30.0
+    
+    # Server-side task classifier. Queries the client sends as "general" are
+    # routed on the predicted task when its probability reaches the minimum
+    # confidence; only the last TASK_CLASSIFIER_MAX_CHARS are classified
+    TASK_CLASSIFIER_ENABLED: bool = True
+    TASK_CLASSIFIER_MIN_CONFIDENCE: float = 0.6
+    TASK_CLASSIFIER_MAX_CHARS: int = 500
+    
+    # Adaptive model router objective (lower weighted score wins)
+    ROUTER_LATENCY_WEIGHT: float = 1.0
+    ROUTER_COST_WEIGHT: float = 1.0
+    ROUTER_QUALITY_WEIGHT: float = 2.0
+    ROUTER_ERROR_WEIGHT: float = 5.0
+    ROUTER_EXPLORATION_RATE: float = 0.05
+    ROUTER_WINDOW: int = 200
+    ROUTER_DEFAULT_LATENCY_MS: float = 3000.0
+    
+    # Hedged requests and failover. A backup model is started when the
+    # primary has no first token by its HEDGE_PERCENTILE time-to-first-token
+    HEDGING_ENABLED: bool = False
+    HEDGE_PERCENTILE: float = 95.0
+    HEDGE_MIN_DELAY_MS: float = 500.0
+    HEDGE_BUDGET_RATIO: float = 0.05
+    HEDGE_BUDGET_BURST: float = 10.0
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_S: float = 30.0
+    
+    # Budget admission before dispatch. Budgets are in USD, 0 disables one:
+    # per chat over its lifetime, and for the whole deployment per UTC day.
+    # max_tokens follows the p95 output length of a task type with headroom,
+    # once it has ADMISSION_OUTPUT_MIN_SAMPLES replies; inputs up to
+    # ADMISSION_EXACT_MAX_CHARS are counted with tiktoken when it loads
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_TOKENIZER: str = "auto"
+    ADMISSION_EXACT_MAX_CHARS: int = 8000
+    ADMISSION_CHAT_BUDGET_USD: float = 0.0
+    ADMISSION_DAILY_BUDGET_USD: float = 0.0
+    ADMISSION_SYNC_INTERVAL_S: float = 30.0
+    DEFAULT_MAX_OUTPUT_TOKENS: int = 1024
+    ADMISSION_MIN_OUTPUT_TOKENS: int = 256
+    ADMISSION_MAX_OUTPUT_TOKENS: int = 4096
+    ADMISSION_OUTPUT_HEADROOM: float = 1.5
+    ADMISSION_OUTPUT_WINDOW: int = 200
+    ADMISSION_OUTPUT_MIN_SAMPLES: int = 20
+    
+    # Per-provider quotas enforced before dispatch
+    PROVIDER_LIMITS: dict = {
+        "openai": {"rpm": 500, "tpm": 200000, "concurrency": 50},
+        "anthropic": {"rpm": 50, "tpm": 40000, "concurrency": 20},
+        "deepseek": {"rpm": 60, "tpm": 100000, "concurrency": 20}
+    }
+    # Used for providers added to the registry but missing above
+    DEFAULT_PROVIDER_LIMITS: dict = {"rpm": 60, "tpm": 100000, "concurrency": 10}
+    # Output tokens reserved against the TPM budget until real usage is known
+    SCHEDULER_OUTPUT_TOKEN_ESTIMATE: int = 512
     
-    OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
-    ANTHROPIC_API_KEY: str = os.getenv("ANTHROPIC_API_KEY", "")
-    DEEPSEEK_API_KEY: str = os.getenv("DEEPSEEK_API_KEY", "")
+    # Connection pool shared by all calls to a provider
+    PROVIDER_MAX_CONNECTIONS: int = 100
+    PROVIDER_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    PROVIDER_KEEPALIVE_EXPIRY_S: float = 30.0
+    PROVIDER_CONNECT_TIMEOUT_S: float = 5.0
+    PROVIDER_READ_TIMEOUT_S: float = 120.0
+    # Connections opened per provider at startup; 0 disables the warmup
+    PROVIDER_WARMUP_CONNECTIONS: int = 2
     
     CORS_ORIGINS: list = ["http://localhost:54733", "http://localhost:59988"]
     
     class Config:
         case_sensitive = True
+        # Read by pydantic when settings are first built, not at import
+        env_file = ".env"
+        extra = "ignore"
 
 @lru_cache()
 def get_settings():
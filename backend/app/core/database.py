@@ -1,15 +1,46 @@
-from sqlalchemy import create_engine
+import json
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from .config import get_settings
 
 settings = get_settings()
 
-engine = create_engine(settings.DATABASE_URL)
+# JSON columns are written without whitespace
+engine = create_engine(
+    settings.DATABASE_URL,
+    json_serializer=lambda value: json.dumps(value, separators=(",", ":"))
+)
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers run alongside the batched writer; NORMAL sync is
+    durable under WAL and avoids an fsync per commit"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute(f"PRAGMA busy_timeout={settings.DB_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", set_sqlite_pragmas)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def init_db():
+    """Create missing tables and apply pending migrations. Runs once per
+    deployment (see SCHEMA_CHECK_ON_STARTUP), not at import"""
+    from .migrations import run_migrations
+    from ..models import models
+    from .. import database as telemetry
+    models.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    telemetry.create_tables()
+
 def get_db():
     db = SessionLocal()
     try:
@@ -0,0 +1,75 @@
+import asyncio
+import os
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, generate_latest, multiprocess, CONTENT_TYPE_LATEST
+)
+
+# Provider calls range from sub-second cache-warm replies to minute-long generations
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+PROVIDER_LATENCY = Histogram(
+    "onetap_provider_latency_seconds", "Provider call duration from admission to last token",
+    ["provider", "model"], buckets=LATENCY_BUCKETS
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "onetap_time_to_first_token_seconds", "Provider call duration until the first token",
+    ["provider", "model"], buckets=LATENCY_BUCKETS
+)
+QUEUE_WAIT = Histogram(
+    "onetap_provider_queue_wait_seconds", "Time spent waiting for provider quota",
+    ["provider"], buckets=FAST_BUCKETS + LATENCY_BUCKETS[5:]
+)
+DB_WRITE = Histogram(
+    "onetap_db_write_seconds", "Duration of one batched database write",
+    ["store"], buckets=FAST_BUCKETS
+)
+EVENT_LOOP_LAG = Histogram(
+    "onetap_event_loop_lag_seconds", "How late the event loop wakes a sleeping task",
+    buckets=FAST_BUCKETS
+)
+TOKENS = Counter("onetap_tokens_total", "Tokens billed by providers", ["provider", "model"])
+COST = Counter("onetap_cost_usd_total", "Provider spend in USD", ["provider", "model"])
+CACHE_REQUESTS = Counter(
+    "onetap_response_cache_requests_total", "Response cache lookups",
+    ["provider", "model", "result"]
+)
+ERRORS = Counter("onetap_provider_errors_total", "Failed provider calls", ["provider", "model"])
+TASK_CLASSIFICATIONS = Counter(
+    "onetap_task_classifications_total", "Task types queries were routed on",
+    ["task_type", "source"]
+)
+ADMISSION_DECISIONS = Counter(
+    "onetap_admission_decisions_total", "Budget admission outcomes", ["decision"]
+)
+ADMISSION_LATENCY = Histogram(
+    "onetap_admission_seconds", "Time to count tokens and check budgets for a call",
+    buckets=(0.00005, 0.0001, 0.00025) + FAST_BUCKETS
+)
+SINGLE_FLIGHT_COALESCED = Counter(
+    "onetap_single_flight_coalesced_total", "Requests served by joining an identical in-flight call"
+)
+GENERATIONS_CANCELLED = Counter(
+    "onetap_generations_cancelled_total", "Generations abandoned before completion", ["reason"]
+)
+
+async def watch_event_loop_lag(interval_s: float = 0.5):
+    """Sample event-loop lag forever; run as a background task"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval_s)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - interval_s))
+
+def render():
+    """Current metrics in the Prometheus text format, with its content type.
+    
+    With several workers (``PROMETHEUS_MULTIPROC_DIR`` set by run.py) the
+    samples every worker wrote to that directory are aggregated, so any
+    worker answering a scrape reports the whole node.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
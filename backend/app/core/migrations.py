@@ -0,0 +1,186 @@
+import json
+from datetime import datetime
+from sqlalchemy import text, inspect
+from sqlalchemy.engine import Engine
+from .config import get_settings
+
+settings = get_settings()
+
+def add_column(table: str, column: str, ddl: str):
+    """Statement adding a column unless create_all already created it
+    (ALTER TABLE has no IF NOT EXISTS in SQLite)"""
+    def apply(conn):
+        if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return apply
+
+def backfill_messages(conn, chunk: int = 1000):
+    """Move reply metrics from message_metadata to the typed columns and
+    compress existing content the way new rows are stored. Space freed in
+    the SQLite file is reused by new rows; VACUUM returns it to the disk."""
+    from ..models.models import MESSAGE_METRIC_COLUMNS
+    from ..models.types import compress, resolve_codec
+    codec = resolve_codec() if conn.dialect.name == "sqlite" else "none"
+    update = text(
+        "UPDATE messages SET content = :content, provider = :provider, "
+        + "".join(f"{name} = :{name}, " for name in MESSAGE_METRIC_COLUMNS)
+        + "message_metadata = :message_metadata WHERE id = :id"
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            text("SELECT id, content, message_metadata FROM messages WHERE id > :last_id ORDER BY id LIMIT :chunk"),
+            {"last_id": last_id, "chunk": chunk}
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        changed = []
+        for row_id, content, metadata in rows:
+            packed = compress(content, codec, settings.MESSAGE_COMPRESSION_MIN_BYTES) if isinstance(content, str) else content
+            if isinstance(metadata, str):
+                metadata = json.loads(metadata)
+            if not metadata and packed is content:
+                continue
+            rest = dict(metadata or {})
+            provider = rest.pop("provider", None)
+            metrics = dict(rest.pop("metrics", None) or {})
+            typed = {name: metrics.pop(name, None) for name in MESSAGE_METRIC_COLUMNS}
+            if metrics:
+                rest["metrics"] = metrics
+            changed.append({
+                "id": row_id, "content": packed, "provider": provider, **typed,
+                "message_metadata": json.dumps(rest, separators=(",", ":")) if rest else None
+            })
+        if changed:
+            conn.execute(update, changed)
+
+def backfill_usage_rollups(conn):
+    """Seed the usage rollups from stored replies. Replies stored before
+    the rollups existed carry no cache or coalescing flags, so every one of
+    them counts as billed."""
+    day = "date(created_at)" if conn.dialect.name == "sqlite" else "CAST(created_at AS DATE)"
+    conn.execute(text(
+        "INSERT INTO usage_rollups_daily "
+        "(day, provider, model, requests, tokens_used, cost_usd, latency_ms_total, cache_hits, cost_saved_usd) "
+        f"SELECT {day}, provider, model, COUNT(*), SUM(COALESCE(tokens_used, 0)), "
+        "SUM(COALESCE(cost_usd, 0)), SUM(COALESCE(latency_ms, 0)), 0, 0 "
+        "FROM messages WHERE provider IS NOT NULL AND model IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM usage_rollups_daily) "
+        f"GROUP BY {day}, provider, model"
+    ))
+
+def rebuild_chat_usage(conn, chunk: int = 1000):
+    """Key the per-chat rollups by day and provider too. Rows keyed by
+    chat and model alone cannot be split by day, so the table is rebuilt
+    from the stored replies, the way record_usage counts them."""
+    from sqlalchemy import select
+    from ..models.models import ChatUsage, Message, MESSAGE_METRIC_COLUMNS
+    from ..services.usage import record_usage, usage_entry
+    if "day" not in {c["name"] for c in inspect(conn).get_columns("chat_usage")}:
+        conn.execute(text("DROP TABLE chat_usage"))
+        ChatUsage.__table__.create(conn)
+    elif conn.execute(text("SELECT 1 FROM chat_usage LIMIT 1")).first() is not None:
+        return
+    
+    columns = [getattr(Message, name) for name in MESSAGE_METRIC_COLUMNS]
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(Message.id, Message.chat_id, Message.created_at, Message.provider, Message.model,
+                   Message.message_metadata, *columns)
+            .where(Message.id > last_id, Message.chat_id.is_not(None),
+                   Message.provider.is_not(None), Message.model.is_not(None))
+            .order_by(Message.id)
+            .limit(chunk)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        record_usage(conn, [
+            usage_entry(
+                row.created_at, row.provider, row.model,
+                {**((row.message_metadata or {}).get("metrics") or {}),
+                 **{name: getattr(row, name) for name in MESSAGE_METRIC_COLUMNS}},
+                row.chat_id
+            )
+            for row in rows
+        ], daily=False)
+
+# Ordered, append-only list of (version, description, statements). Each
+# statement is SQL or a callable taking the connection, and must be safe on
+# databases that create_all already brought up to date, so new installs and
+# upgraded ones converge on the same schema.
+MIGRATIONS = [
+    (1, "keyset index for chat history pages", [
+        "DROP INDEX IF EXISTS ix_messages_chat_id_created_at",
+        "CREATE INDEX IF NOT EXISTS ix_messages_chat_id_created_at ON messages (chat_id, created_at, id)",
+    ]),
+    (2, "keyset index for chat list pages", [
+        "CREATE INDEX IF NOT EXISTS ix_chats_created_at ON chats (created_at, id)",
+    ]),
+    (3, "chat id sequence shared by workers", [
+        "CREATE TABLE IF NOT EXISTS id_sequences (name VARCHAR PRIMARY KEY, next_id INTEGER NOT NULL)",
+        "INSERT INTO id_sequences (name, next_id) "
+        "SELECT 'chats', (SELECT COALESCE(MAX(id), 0) + 1 FROM chats) "
+        "WHERE NOT EXISTS (SELECT 1 FROM id_sequences WHERE name = 'chats')",
+    ]),
+    (4, "pricing and lifecycle columns for the model registry", [
+        add_column("ai_models", "input_price_per_1k", "FLOAT DEFAULT 0"),
+        add_column("ai_models", "output_price_per_1k", "FLOAT DEFAULT 0"),
+        add_column("ai_models", "context_tokens", "INTEGER DEFAULT 4000"),
+        add_column("ai_models", "enabled", "BOOLEAN DEFAULT 1"),
+        add_column("ai_models", "updated_at", "TIMESTAMP"),
+    ]),
+    (5, "task capabilities for the seeded models", [
+        f"UPDATE ai_models SET capabilities = '{capabilities}' "
+        f"WHERE name = '{name}' AND CAST(capabilities AS TEXT) = '[\"general\"]'"
+        for name, capabilities in [
+            ("gpt-4-turbo", '["general", "math", "programming", "analytics", "creative", "translation"]'),
+            ("gpt-4", '["general", "math", "programming", "analytics"]'),
+            ("gpt-3.5-turbo", '["general", "translation", "creative", "analytics"]'),
+            ("claude-3-opus", '["general", "math", "programming", "analytics", "creative"]'),
+            ("claude-3-sonnet", '["general", "programming", "translation", "creative", "analytics"]'),
+            ("claude-2.1", '["general", "translation", "creative"]')
+        ]
+    ]),
+    (6, "typed message metrics and compressed message content", [
+        add_column("messages", "provider", "VARCHAR"),
+        add_column("messages", "tokens_used", "INTEGER"),
+        add_column("messages", "cost_usd", "FLOAT"),
+        add_column("messages", "latency_ms", "FLOAT"),
+        add_column("messages", "time_to_first_token_ms", "FLOAT"),
+        backfill_messages,
+    ]),
+    (7, "usage rollups per day, provider, model and chat", [
+        backfill_usage_rollups,
+    ]),
+    (8, "per-chat usage rollups by day and provider", [
+        rebuild_chat_usage,
+    ]),
+]
+
+def run_migrations(engine: Engine):
+    """Apply pending schema migrations, recording each in schema_migrations"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations "
+            "(version INTEGER PRIMARY KEY, description VARCHAR, applied_at TIMESTAMP)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+    
+    for version, description, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(text(statement))
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) "
+                     "VALUES (:version, :description, :applied_at)"),
+                {"version": version, "description": description, "applied_at": datetime.utcnow()}
+            )
+        print(f"Applied migration {version}: {description}")
@@ -0,0 +1,107 @@
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+from .config import get_settings
+
+settings = get_settings()
+
+class LocalState:
+    """In-process stand-in for ``RedisState``, used with a single worker and in tests.
+    Counters are dropped least recently used first past ``max_counters``."""
+
+    def __init__(self, max_counters: int = settings.SHARED_STATE_MAX_COUNTERS):
+        self.max_counters = max_counters
+        # key -> (value, monotonic expiry or None)
+        self._counters: "OrderedDict[str, Tuple[int, Optional[float]]]" = OrderedDict()
+        self._lists: Dict[str, deque] = {}
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        """Add ``amount`` to a counter; with ``ttl``, it expires after that many
+        seconds without being read or incremented"""
+        value = self._value(key) + amount
+        self._set(key, value, ttl)
+        return value
+
+    async def get_int(self, key: str, ttl: Optional[int] = None) -> int:
+        value = self._value(key)
+        if ttl is not None and key in self._counters:
+            self._set(key, value, ttl)
+        return value
+
+    def _value(self, key: str) -> int:
+        entry = self._counters.get(key)
+        if entry is None:
+            return 0
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._counters[key]
+            return 0
+        self._counters.move_to_end(key)
+        return value
+
+    def _set(self, key: str, value: int, ttl: Optional[int]):
+        self._counters[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        self._counters.move_to_end(key)
+        while len(self._counters) > self.max_counters:
+            self._counters.popitem(last=False)
+
+    async def exchange(self, items: Dict[str, List[str]], window: int) -> Dict[str, List[str]]:
+        """Append ``items`` to their lists, keep the newest ``window`` entries
+        of each and return the merged lists"""
+        merged = {}
+        for key, values in items.items():
+            merged_list = self._lists.setdefault(key, deque(maxlen=window))
+            merged_list.extend(values)
+            merged[key] = list(merged_list)
+        return merged
+
+    async def aclose(self):
+        pass
+
+class RedisState:
+    """Counters and sample windows shared by every worker through REDIS_URL"""
+
+    def __init__(self, url: str, prefix: str = "onetap:state:"):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        if ttl is None:
+            return await self.client.incrby(self.prefix + key, amount)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.incrby(self.prefix + key, amount)
+        pipe.expire(self.prefix + key, ttl)
+        value, _ = await pipe.execute()
+        return value
+
+    async def get_int(self, key: str, ttl: Optional[int] = None) -> int:
+        if ttl is None:
+            value = await self.client.get(self.prefix + key)
+        else:
+            value = await self.client.getex(self.prefix + key, ex=ttl)
+        return int(value) if value is not None else 0
+
+    async def exchange(self, items: Dict[str, List[str]], window: int) -> Dict[str, List[str]]:
+        # One round trip for every list
+        pipe = self.client.pipeline(transaction=False)
+        for key, values in items.items():
+            if values:
+                pipe.rpush(self.prefix + key, *values)
+                pipe.ltrim(self.prefix + key, -window, -1)
+            pipe.lrange(self.prefix + key, 0, -1)
+        replies = await pipe.execute()
+        merged = {}
+        position = 0
+        for key, values in items.items():
+            position += 3 if values else 1
+            merged[key] = [v.decode() if isinstance(v, bytes) else v for v in replies[position - 1]]
+        return merged
+
+    async def aclose(self):
+        await self.client.aclose()
+
+def shared_state_from_settings():
+    if settings.SHARED_STATE_BACKEND == "redis":
+        return RedisState(settings.REDIS_URL)
+    return LocalState()
@@ -1,7 +1,17 @@
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, Boolean, func
+from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, Boolean, Index, func, case, insert, select, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from collections import deque
 from datetime import datetime
+import atexit
+import logging
+import threading
+import time
+from .core.config import get_settings
+from .core import metrics
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
@@ -19,43 +29,166 @@ class APICall(Base):
     latency = Column(Float)  # in seconds
     tokens_used = Column(Integer)
     cost_usd = Column(Float)
+    job_id = Column(String, nullable=True)  # Bulk job the call belonged to
+    
+    __table_args__ = (
+        Index('ix_api_calls_job_id', 'job_id'),
+    )
 
-engine = create_engine('sqlite:///api_calls.db')
-Base.metadata.create_all(engine)
+# Worker processes share the file; wait for the write lock instead of failing
+engine = create_engine(
+    settings.TELEMETRY_DATABASE_URL,
+    connect_args={'timeout': settings.DB_BUSY_TIMEOUT_MS / 1000}
+)
 Session = sessionmaker(bind=engine)
 
+def create_tables(bind=engine):
+    from .core.migrations import add_column
+    Base.metadata.create_all(bind)
+    # Files created before job_id was added
+    with bind.begin() as conn:
+        add_column('api_calls', 'job_id', 'VARCHAR')(conn)
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_api_calls_job_id ON api_calls (job_id)'))
+
+class TelemetryBuffer:
+    """Bounded in-memory buffer of api_calls rows.
+    
+    ``record`` never blocks: it appends to a deque, or drops and counts the
+    row when the buffer is full. A daemon thread bulk-inserts the buffered
+    rows every ``batch_size`` rows or ``flush_interval_ms``. The table is
+    created by the first flush rather than at import.
+    """
+    
+    def __init__(self, capacity=settings.TELEMETRY_BUFFER_SIZE,
+                 batch_size=settings.TELEMETRY_BATCH_SIZE,
+                 flush_interval_ms=settings.TELEMETRY_FLUSH_INTERVAL_MS,
+                 bind=engine):
+        self.bind = bind
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.dropped = 0
+        self._rows = deque()
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._tables_ready = False
+    
+    def record(self, row):
+        if len(self._rows) >= self.capacity:
+            self.dropped += 1
+            return False
+        self._rows.append(row)
+        if self._thread is None:
+            self._start()
+        if len(self._rows) >= self.batch_size:
+            self._wake.set()
+        return True
+    
+    def flush(self):
+        """Write everything buffered so far in one transaction"""
+        with self._flush_lock:
+            self._ensure_tables()
+            rows = []
+            while self._rows:
+                rows.append(self._rows.popleft())
+            if not rows:
+                return
+            start = time.perf_counter()
+            try:
+                with self.bind.begin() as conn:
+                    conn.execute(insert(APICall), rows)
+            except Exception as e:
+                self.dropped += len(rows)
+                logger.warning("Error writing %d API call records: %s", len(rows), e)
+            finally:
+                metrics.DB_WRITE.labels("api_calls").observe(time.perf_counter() - start)
+    
+    def _ensure_tables(self):
+        if self._tables_ready:
+            return
+        try:
+            create_tables(self.bind)
+            self._tables_ready = True
+        except Exception as e:
+            # Retried by the next flush
+            logger.warning("Error creating the api_calls table: %s", e)
+    
+    def _start(self):
+        with self._flush_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telemetry-flusher", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+    
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+telemetry = TelemetryBuffer()
+
 def log_api_call(provider, result):
-    session = Session()
-    try:
-        api_call = APICall(
-            provider=provider,
-            model=result.get('model'),
-            prompt=result.get('prompt'),
-            response=result.get('response'),
-            success=result.get('success'),
-            error=result.get('error') if not result.get('success') else None,
-            latency=result.get('metrics', {}).get('latency', 0) if result.get('success') else 0,
-            tokens_used=result.get('metrics', {}).get('tokens', 0) if result.get('success') else 0,
-            cost_usd=result.get('metrics', {}).get('cost_usd', 0) if result.get('success') else 0
-        )
-        session.add(api_call)
-        session.commit()
-    finally:
-        session.close()
+    metrics = result.get('metrics', {}) if result.get('success') else {}
+    return telemetry.record({
+        'timestamp': datetime.utcnow(),
+        'provider': provider,
+        'model': result.get('model'),
+        'prompt': result.get('prompt'),
+        'response': result.get('response'),
+        'success': result.get('success'),
+        'error': result.get('error') if not result.get('success') else None,
+        'latency': metrics.get('latency', 0),
+        'tokens_used': metrics.get('tokens', 0),
+        'cost_usd': metrics.get('cost_usd', 0),
+        'job_id': result.get('job_id')
+    })
 
 def get_api_stats():
+    telemetry.flush()
     session = Session()
     try:
-        total_calls = session.query(APICall).count()
-        successful_calls = session.query(APICall).filter_by(success=True).count()
-        total_cost = session.query(APICall).filter_by(success=True).with_entities(
-            func.sum(APICall.cost_usd)).scalar() or 0
+        # One aggregate pass instead of a query per figure
+        total_calls, successful_calls, total_cost = session.execute(select(
+            func.count(APICall.id),
+            func.sum(case((APICall.success, 1), else_=0)),
+            func.sum(case((APICall.success, APICall.cost_usd), else_=0))
+        )).one()
+        successful_calls = successful_calls or 0
         
         return {
             'total_calls': total_calls,
             'successful_calls': successful_calls,
             'failed_calls': total_calls - successful_calls,
-            'total_cost_usd': total_cost
+            'total_cost_usd': total_cost or 0,
+            'dropped_records': telemetry.dropped
+        }
+    finally:
+        session.close()
+
+def get_job_stats(job_id):
+    """Calls, spend and throughput of one bulk job"""
+    telemetry.flush()
+    session = Session()
+    try:
+        calls, successful_calls, tokens, cost, first, last = session.execute(select(
+            func.count(APICall.id),
+            func.sum(case((APICall.success, 1), else_=0)),
+            func.sum(APICall.tokens_used),
+            func.sum(APICall.cost_usd),
+            func.min(APICall.timestamp),
+            func.max(APICall.timestamp)
+        ).where(APICall.job_id == job_id)).one()
+        elapsed = (last - first).total_seconds() if calls else 0
+        
+        return {
+            'calls': calls,
+            'successful_calls': successful_calls or 0,
+            'tokens_used': tokens or 0,
+            'cost_usd': cost or 0,
+            'calls_per_second': calls / elapsed if elapsed else None,
+            'tokens_per_second': (tokens or 0) / elapsed if elapsed else None
         }
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
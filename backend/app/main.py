@@ -1,32 +1,100 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from .core.config import get_settings
-from .api.websocket import app as socketio_app
-from .core.database import engine
-from .models import models
+from .api.websocket import create_socketio_app
+from .api.chats import router as chats_router
+from .api.files import router as files_router
+from .api.models import router as models_router
+from .api.batches import router as batches_router
+from .api.usage import router as usage_router
+from .core.database import init_db
+from .database import telemetry
+from .core import metrics
+from .services.container import build_services
 
 settings = get_settings()
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup and shutdown of the services shared by all requests.
+    
+    Nothing here runs at import, so spawning a worker only pays for imports.
+    Provider connections are warmed in the background and do not hold up
+    startup.
+    """
+    services = app.state.services
+    ai_service, persistence, batches = services.ai_service, services.persistence, services.batches
+    if settings.SCHEMA_CHECK_ON_STARTUP:
+        await asyncio.to_thread(init_db)
+    # Independent of each other, so they start concurrently. The provider
+    # clients are built here, off the event loop, before any request needs them
+    await asyncio.gather(persistence.start(), ai_service.registry.reload(), ai_service.start())
+    
+    background = [
+        asyncio.create_task(metrics.watch_event_loop_lag()),
+        asyncio.create_task(ai_service.registry.poll_forever()),
+        asyncio.create_task(batches.resume_forever()),
+        # tiktoken may download its encoding; admission estimates until then
+        asyncio.create_task(asyncio.to_thread(ai_service.admission.tokenizer.load))
+    ]
+    if ai_service.admission.daily_budget_usd > 0:
+        background.append(asyncio.create_task(ai_service.admission.sync_forever()))
+    if settings.SHARED_STATE_BACKEND == "redis":
+        background.append(asyncio.create_task(ai_service.router.sync_forever(services.shared_state)))
+    if settings.PROVIDER_WARMUP_CONNECTIONS > 0:
+        background.append(asyncio.create_task(ai_service.warmup()))
+    
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+        await batches.stop()
+        await persistence.stop()
+        await ai_service.aclose()
+        # API calls logged until now, rather than only at interpreter exit
+        await asyncio.to_thread(telemetry.flush)
+        services.file_ingest.shutdown()
+        await services.shared_state.aclose()
 
-app = FastAPI(
-    title=settings.PROJECT_NAME,
-    version=settings.VERSION,
-)
-
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.CORS_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Mount Socket.IO app
-app.mount("/ws", socketio_app)
-
-@app.get("/")
-async def root():
-    return {"message": "Welcome to OneTap AI API"}
\ No newline at end of file
+def create_app() -> FastAPI:
+    """Build the ASGI application; run with ``uvicorn app.main:create_app --factory``"""
+    app = FastAPI(
+        title=settings.PROJECT_NAME,
+        version=settings.VERSION,
+        lifespan=lifespan
+    )
+    # Services are built per app rather than at import; routes and socket
+    # handlers reach them through get_services
+    app.state.services = build_services()
+    
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    app.include_router(chats_router)
+    app.include_router(files_router)
+    app.include_router(models_router)
+    app.include_router(batches_router)
+    app.include_router(usage_router)
+    
+    # Mount Socket.IO app
+    app.mount("/ws", create_socketio_app())
+    
+    @app.get("/")
+    async def root():
+        return {"message": "Welcome to OneTap AI API"}
+    
+    @app.get("/metrics")
+    async def prometheus_metrics():
+        content, content_type = metrics.render()
+        return Response(content=content, media_type=content_type)
+    
+    return app
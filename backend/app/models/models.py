@@ -1,29 +1,47 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Text, JSON, Index, Float, Boolean
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from .types import CompressedText
 
 Base = declarative_base()
 
+# Reply metrics stored in typed Message columns of the same name
+MESSAGE_METRIC_COLUMNS = ("tokens_used", "cost_usd", "latency_ms", "time_to_first_token_ms")
+
 class Chat(Base):
     __tablename__ = "chats"
     
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     messages = relationship("Message", back_populates="chat")
+    
+    __table_args__ = (
+        Index("ix_chats_created_at", "created_at", "id"),
+    )
 
 class Message(Base):
     __tablename__ = "messages"
     
     id = Column(Integer, primary_key=True, index=True)
     chat_id = Column(Integer, ForeignKey("chats.id"))
-    content = Column(Text)
+    content = Column(CompressedText())  # Compressed on SQLite above MESSAGE_COMPRESSION_MIN_BYTES
     role = Column(String)  # 'user' or 'assistant'
     model = Column(String, nullable=True)  # Which AI model generated this response
     created_at = Column(DateTime, default=datetime.utcnow)
-    message_metadata = Column(JSON, nullable=True)  # Additional metadata like tokens, model settings
+    # Metrics of assistant replies, typed so they aggregate without parsing JSON
+    provider = Column(String, nullable=True)
+    tokens_used = Column(Integer, nullable=True)
+    cost_usd = Column(Float, nullable=True)
+    latency_ms = Column(Float, nullable=True)
+    time_to_first_token_ms = Column(Float, nullable=True)
+    message_metadata = Column(JSON, nullable=True)  # Remaining reply metrics, e.g. queueing and routing
     
     chat = relationship("Chat", back_populates="messages")
+    
+    __table_args__ = (
+        Index("ix_messages_chat_id_created_at", "chat_id", "created_at", "id"),
+    )
 
 class AIModel(Base):
     __tablename__ = "ai_models"
@@ -33,4 +51,83 @@ class AIModel(Base):
     provider = Column(String)  # 'openai', 'anthropic', 'deepseek'
     model_id = Column(String)  # e.g., 'gpt-4', 'claude-2'
     capabilities = Column(JSON)  # List of tasks this model can handle
-    priority = Column(Integer)  # Ranking for task routing
\ No newline at end of file
+    priority = Column(Integer)  # Ranking for task routing
+    input_price_per_1k = Column(Float, default=0.0)  # USD per 1k prompt tokens
+    output_price_per_1k = Column(Float, default=0.0)  # USD per 1k completion tokens
+    context_tokens = Column(Integer, default=4000)  # History budget sent with a query
+    enabled = Column(Boolean, default=True)  # Disabled models are priced but never routed to
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class IdSequence(Base):
+    __tablename__ = "id_sequences"
+    
+    name = Column(String, primary_key=True)  # Table the ids are for
+    next_id = Column(Integer, nullable=False)  # First id not yet handed out to a worker
+
+class BatchJob(Base):
+    __tablename__ = "batch_jobs"
+    
+    id = Column(String, primary_key=True)  # Random hex id handed to the client
+    created_at = Column(DateTime, default=datetime.utcnow)
+    status = Column(String, index=True)  # 'pending', 'running', 'completed' or 'cancelled'
+    task_type = Column(String)
+    model = Column(String, nullable=True)  # Fixed model, or routed per item when empty
+    total = Column(Integer)
+    completed = Column(Integer, default=0)  # Items with a result, successful or not
+    failed = Column(Integer, default=0)
+    tokens_used = Column(Integer, default=0)
+    cost_usd = Column(Float, default=0.0)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    lease_owner = Column(String, nullable=True)  # Worker running the job
+    lease_expires_at = Column(DateTime, nullable=True)  # Another worker may take over after this
+
+class BatchItem(Base):
+    __tablename__ = "batch_items"
+    
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String, ForeignKey("batch_jobs.id"))
+    position = Column(Integer)  # Index in the submitted list
+    custom_id = Column(String, nullable=True)  # Caller's own reference, echoed in results
+    prompt = Column(Text)
+    status = Column(String)  # 'pending', 'submitted', 'succeeded' or 'failed'
+    model = Column(String, nullable=True)
+    provider_batch = Column(String, nullable=True)  # '<provider>:<batch id>' while submitted
+    response = Column(CompressedText(), nullable=True)
+    error = Column(Text, nullable=True)
+    tokens_used = Column(Integer, nullable=True)
+    cost_usd = Column(Float, nullable=True)
+    latency_ms = Column(Float, nullable=True)
+    seq = Column(Integer, nullable=True)  # Order results were recorded in; resumes result streams
+    
+    __table_args__ = (
+        Index("ix_batch_items_job_id_status", "job_id", "status"),
+        Index("ix_batch_items_job_id_seq", "job_id", "seq"),
+    )
+
+# Usage rollups, updated in the same transaction that stores replies and
+# bulk-job results so that stats never scan api_calls or messages
+class UsageRollup(Base):
+    __tablename__ = "usage_rollups_daily"
+    
+    day = Column(Date, primary_key=True)  # UTC
+    provider = Column(String, primary_key=True)
+    model = Column(String, primary_key=True)
+    requests = Column(Integer, default=0)
+    tokens_used = Column(Integer, default=0)
+    cost_usd = Column(Float, default=0.0)
+    latency_ms_total = Column(Float, default=0.0)  # Divide by requests for the mean
+    cache_hits = Column(Integer, default=0)
+    cost_saved_usd = Column(Float, default=0.0)
+
+class ChatUsage(Base):
+    __tablename__ = "chat_usage"
+    
+    chat_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)  # UTC
+    provider = Column(String, primary_key=True)
+    model = Column(String, primary_key=True)
+    requests = Column(Integer, default=0)
+    tokens_used = Column(Integer, default=0)
+    cost_usd = Column(Float, default=0.0)
+    last_at = Column(DateTime)
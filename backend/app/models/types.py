@@ -0,0 +1,88 @@
+import threading
+import zlib
+from typing import Optional, Union
+from sqlalchemy.types import Text, TypeDecorator
+from ..core.config import get_settings
+
+settings = get_settings()
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressed values are stored as bytes starting with a codec marker; plain
+# values stay text, so rows written before compression read back unchanged
+ZLIB = b"\x01"
+ZSTD = b"\x02"
+
+_local = threading.local()
+
+def _zstd():
+    # Contexts are costly to create and not thread-safe; keep a pair per thread
+    contexts = getattr(_local, "zstd", None)
+    if contexts is None:
+        contexts = _local.zstd = (zstandard.ZstdCompressor(level=3), zstandard.ZstdDecompressor())
+    return contexts
+
+def resolve_codec(codec: str = settings.MESSAGE_COMPRESSION) -> str:
+    """The codec actually used for ``codec``: "zstd", "zlib" or "none"."""
+    if codec == "auto":
+        return "zstd" if zstandard is not None else "zlib"
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("MESSAGE_COMPRESSION is zstd but the zstandard package is not installed")
+    if codec not in ("zstd", "zlib", "none"):
+        raise ValueError(f"Unknown compression codec: {codec}")
+    return codec
+
+def compress(text: str, codec: str, min_bytes: int) -> Union[str, bytes]:
+    """``text`` compressed with a codec marker, or unchanged when it is
+    short or does not get smaller"""
+    raw = text.encode("utf-8")
+    if codec == "none" or len(raw) < min_bytes:
+        return text
+    if codec == "zstd":
+        packed = ZSTD + _zstd()[0].compress(raw)
+    else:
+        packed = ZLIB + zlib.compress(raw)
+    return packed if len(packed) < len(raw) else text
+
+def decompress(value: Union[str, bytes, None]) -> Optional[str]:
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    value = bytes(value)
+    marker, payload = value[:1], value[1:]
+    if marker == ZLIB:
+        return zlib.decompress(payload).decode("utf-8")
+    if marker == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Message stored with zstd; install the zstandard package to read it")
+        return _zstd()[1].decompress(payload).decode("utf-8")
+    return value.decode("utf-8")
+
+class CompressedText(TypeDecorator):
+    """Text column whose longer values are stored compressed.
+    
+    Only applies on SQLite, where a TEXT column can hold BLOBs; Postgres
+    already compresses large values itself (TOAST). Reads decompress
+    transparently, so SQL that inspects the stored value (LIKE, length())
+    sees bytes for compressed rows.
+    """
+    
+    impl = Text
+    cache_ok = True
+    
+    def __init__(self, codec: str = settings.MESSAGE_COMPRESSION,
+                 min_bytes: int = settings.MESSAGE_COMPRESSION_MIN_BYTES):
+        super().__init__()
+        self.codec = codec
+        self.min_bytes = min_bytes
+        self._resolved = resolve_codec(codec)
+    
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "sqlite":
+            return value
+        return compress(value, self._resolved, self.min_bytes)
+    
+    def process_result_value(self, value, dialect):
+        return decompress(value)
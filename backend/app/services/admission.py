@@ -0,0 +1,280 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional
+from sqlalchemy import func, select
+from ..core.config import get_settings
+from ..core.database import SessionLocal
+from ..core import metrics
+from ..models.models import UsageRollup, ChatUsage
+from .router import percentile
+
+settings = get_settings()
+
+# Tokens a chat message costs beyond its content (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+class BudgetExceeded(Exception):
+    """No model can serve the request within the remaining budget"""
+
+class Tokenizer:
+    """Input token counts for budgeting.
+    
+    Uses tiktoken's cl100k_base once ``load`` succeeds, and a byte-length
+    heuristic before that or without tiktoken. ``load`` may download the
+    encoding, so it runs off the request path. Counts are cached per text:
+    the history resent with every turn is only counted once.
+    """
+    
+    def __init__(self, mode: str = settings.ADMISSION_TOKENIZER, cache_size: int = 4096):
+        self.mode = mode
+        self._encoding = None
+        self.count = lru_cache(maxsize=cache_size)(self._count)
+    
+    @property
+    def name(self) -> str:
+        return "tiktoken" if self._encoding is not None else "heuristic"
+    
+    def load(self):
+        if self.mode == "heuristic":
+            return
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding("cl100k_base")
+            self.count.cache_clear()
+        except Exception as e:
+            print(f"tiktoken unavailable, estimating tokens from text length: {str(e)}")
+    
+    def _count(self, text: str) -> int:
+        if self._encoding is not None and len(text) <= settings.ADMISSION_EXACT_MAX_CHARS:
+            return len(self._encoding.encode_ordinary(text))
+        # About four characters per token for English and code; text outside
+        # ASCII tokenizes more densely, roughly one token per two extra bytes
+        chars = len(text)
+        extra = len(text.encode("utf-8")) - chars
+        return (chars + 3) // 4 + (extra + 1) // 2
+    
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        count = self.count
+        return sum(count(m["content"]) for m in messages) + MESSAGE_OVERHEAD_TOKENS * len(messages)
+
+@dataclass
+class Admission:
+    """An admitted call: the model and output limit to use, and the
+    worst-case cost reserved against the budgets until it is settled"""
+    model: str
+    max_tokens: int
+    input_tokens: int
+    reserved_usd: float
+    chat_id: Optional[int] = None
+    task_type: str = "general"
+
+class AdmissionController:
+    """Checks each call against the chat and daily budgets before dispatch.
+    
+    The worst case of a call is its counted input plus ``max_tokens`` of
+    output at the model's prices. ``max_tokens`` follows the output lengths
+    recently seen for the task type, with headroom. A call whose worst case
+    does not fit the remaining budget moves to the best-ranked candidate
+    that fits; failing that to the cheapest one with ``max_tokens`` cut to
+    what the budget allows, or it is rejected. Admitted calls hold their
+    worst case until ``settle`` replaces it with the actual cost, so
+    concurrent calls cannot overrun a budget together. Without a budget
+    calls are admitted as they are, still with the adaptive ``max_tokens``.
+    
+    Spend is kept in memory, so a decision does no I/O. Chats are seeded
+    from the chat_usage rollup on first use; the daily total is raised to
+    the rollup's by ``sync``, which also picks up other workers' spend.
+    """
+    
+    def __init__(self, registry, router, tokenizer: Optional[Tokenizer] = None,
+                 chat_budget_usd: float = settings.ADMISSION_CHAT_BUDGET_USD,
+                 daily_budget_usd: float = settings.ADMISSION_DAILY_BUDGET_USD,
+                 max_chats: int = settings.CONTEXT_CACHE_CHATS,
+                 session_factory=SessionLocal):
+        self.registry = registry
+        self.router = router
+        self.tokenizer = tokenizer or Tokenizer()
+        self.enabled = settings.ADMISSION_ENABLED
+        self.chat_budget_usd = chat_budget_usd
+        self.daily_budget_usd = daily_budget_usd
+        self.max_chats = max_chats
+        self.session_factory = session_factory
+        
+        # Recent output tokens and the resulting max_tokens per task type
+        self._outputs: Dict[str, deque] = {}
+        self._caps: Dict[str, int] = {}
+        # Chat spend including reservations, least recently used first
+        self._chats: "OrderedDict[int, float]" = OrderedDict()
+        self._day = datetime.utcnow().date()
+        self._day_spend = 0.0
+        self._day_reserved = 0.0
+    
+    def output_cap(self, task_type: str) -> int:
+        return self._caps.get(task_type, settings.DEFAULT_MAX_OUTPUT_TOKENS)
+    
+    def remaining(self, chat_id: Optional[int] = None) -> Optional[float]:
+        """Budget left for a call, or None when no budget applies"""
+        limits = []
+        if self.daily_budget_usd > 0:
+            self._roll_day()
+            limits.append(self.daily_budget_usd - self._day_spend - self._day_reserved)
+        if self.chat_budget_usd > 0 and chat_id is not None:
+            limits.append(self.chat_budget_usd - self._chats.get(chat_id, 0.0))
+        return min(limits) if limits else None
+    
+    def worst_case(self, model: str, input_tokens: int, output_tokens: int, price_factor: float = 1.0) -> float:
+        input_price, output_price = self.registry.snapshot.prices[model]
+        return (input_tokens * input_price + output_tokens * output_price) * price_factor
+    
+    def admit(self, messages: List[Dict[str, str]], model: str, task_type: str,
+              chat_id: Optional[int] = None) -> Admission:
+        """Admit a call to ``model`` or a cheaper candidate; raises
+        BudgetExceeded when none fits"""
+        start = time.perf_counter()
+        max_tokens = self.output_cap(task_type)
+        remaining = self.remaining(chat_id) if self.enabled else None
+        if remaining is None:
+            return Admission(model, max_tokens, 0, 0.0, chat_id, task_type)
+        
+        input_tokens = self.tokenizer.count_messages(messages)
+        decision = "admitted"
+        if self.worst_case(model, input_tokens, max_tokens) > remaining:
+            candidates = [name for name in self.router.ranked(task_type) if self.router.breakers[name].available()]
+            fitting = [name for name in candidates if self.worst_case(name, input_tokens, max_tokens) <= remaining]
+            if fitting:
+                model, decision = fitting[0], "downgraded"
+            else:
+                cheapest = min(candidates or [model], key=lambda name: self.worst_case(name, input_tokens, max_tokens))
+                input_price, output_price = self.registry.snapshot.prices[cheapest]
+                left = remaining - input_tokens * input_price
+                affordable = int(left / output_price) if output_price > 0 else max_tokens
+                if left <= 0 or affordable < settings.ADMISSION_MIN_OUTPUT_TOKENS:
+                    metrics.ADMISSION_DECISIONS.labels("rejected").inc()
+                    raise BudgetExceeded(
+                        f"Budget exhausted: ${max(remaining, 0.0):.4f} left, "
+                        f"the cheapest model needs ${self.worst_case(cheapest, input_tokens, settings.ADMISSION_MIN_OUTPUT_TOKENS):.4f}"
+                    )
+                decision = "capped" if cheapest == model else "downgraded"
+                model, max_tokens = cheapest, min(max_tokens, affordable)
+        
+        admission = Admission(
+            model, max_tokens, input_tokens, self.worst_case(model, input_tokens, max_tokens), chat_id, task_type
+        )
+        self._reserve(admission, admission.reserved_usd)
+        metrics.ADMISSION_DECISIONS.labels(decision).inc()
+        metrics.ADMISSION_LATENCY.observe(time.perf_counter() - start)
+        return admission
+    
+    def admit_bulk(self, prompts: List[str], model: str, task_type: str,
+                   price_factor: float = 1.0) -> Admission:
+        """Admit a provider batch as a whole at its discounted price, without
+        changing the model; raises BudgetExceeded when it does not fit"""
+        max_tokens = self.output_cap(task_type)
+        remaining = self.remaining() if self.enabled else None
+        if remaining is None:
+            return Admission(model, max_tokens, 0, 0.0, None, task_type)
+        count = self.tokenizer.count
+        input_tokens = sum(count(prompt) for prompt in prompts) + MESSAGE_OVERHEAD_TOKENS * len(prompts)
+        worst = self.worst_case(model, input_tokens, max_tokens * len(prompts), price_factor)
+        if worst > remaining:
+            raise BudgetExceeded(f"Budget exhausted: ${max(remaining, 0.0):.4f} left, the batch needs up to ${worst:.4f}")
+        admission = Admission(model, max_tokens, input_tokens, worst, None, task_type)
+        self._reserve(admission, worst)
+        metrics.ADMISSION_DECISIONS.labels("admitted").inc()
+        return admission
+    
+    def settle(self, admission: Admission, cost_usd: float = 0.0, output_tokens: Optional[int] = None,
+               truncated: bool = False):
+        """Replace a call's reservation with what it actually cost, and
+        feed its output length into the task's ``max_tokens``"""
+        self._reserve(admission, -admission.reserved_usd)
+        admission.reserved_usd = 0.0
+        self.record_spend(cost_usd, admission.chat_id)
+        if output_tokens:
+            self.record_output(admission.task_type, output_tokens, truncated)
+    
+    def record_spend(self, cost_usd: float, chat_id: Optional[int] = None):
+        """Count spend that was not admitted through ``admit``"""
+        if not cost_usd:
+            return
+        self._roll_day()
+        self._day_spend += cost_usd
+        if chat_id in self._chats:
+            self._chats[chat_id] += cost_usd
+    
+    async def ensure_chat(self, chat_id: int):
+        """Load a chat's spend so far before its first admission"""
+        if self.chat_budget_usd <= 0 or not self.enabled:
+            return
+        if chat_id in self._chats:
+            self._chats.move_to_end(chat_id)
+            return
+        spent = await asyncio.to_thread(self._read_chat_spend, chat_id)
+        # Another request of the chat may have loaded it meanwhile
+        if chat_id not in self._chats:
+            self._chats[chat_id] = spent
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+    
+    async def sync(self):
+        """Raise today's spend to the total recorded in the rollups"""
+        today = datetime.utcnow().date()
+        total = await asyncio.to_thread(self._read_day_spend, today)
+        self._roll_day()
+        if self._day == today:
+            self._day_spend = max(self._day_spend, total)
+    
+    async def sync_forever(self, interval_s: float = settings.ADMISSION_SYNC_INTERVAL_S):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"Error syncing daily spend: {str(e)}")
+            await asyncio.sleep(interval_s)
+    
+    def _reserve(self, admission: Admission, amount: float):
+        if not amount:
+            return
+        self._roll_day()
+        self._day_reserved = max(0.0, self._day_reserved + amount)
+        if admission.chat_id in self._chats:
+            self._chats[admission.chat_id] += amount
+    
+    def _roll_day(self):
+        today = datetime.utcnow().date()
+        if today != self._day:
+            self._day, self._day_spend = today, 0.0
+    
+    def record_output(self, task_type: str, output_tokens: int, truncated: bool = False):
+        # A reply cut off at max_tokens only shows the cap itself; learning
+        # from it would ratchet the cap down
+        if truncated:
+            return
+        outputs = self._outputs.get(task_type)
+        if outputs is None:
+            outputs = self._outputs[task_type] = deque(maxlen=settings.ADMISSION_OUTPUT_WINDOW)
+        outputs.append(output_tokens)
+        if len(outputs) < settings.ADMISSION_OUTPUT_MIN_SAMPLES:
+            return
+        p95 = percentile(sorted(outputs), 95)
+        self._caps[task_type] = min(
+            settings.ADMISSION_MAX_OUTPUT_TOKENS,
+            max(settings.ADMISSION_MIN_OUTPUT_TOKENS, math.ceil(p95 * settings.ADMISSION_OUTPUT_HEADROOM))
+        )
+    
+    def _read_chat_spend(self, chat_id: int) -> float:
+        with self.session_factory() as session:
+            return session.execute(
+                select(func.sum(ChatUsage.cost_usd)).where(ChatUsage.chat_id == chat_id)
+            ).scalar() or 0.0
+    
+    def _read_day_spend(self, day) -> float:
+        with self.session_factory() as session:
+            return session.execute(
+                select(func.sum(UsageRollup.cost_usd)).where(UsageRollup.day == day)
+            ).scalar() or 0.0
@@ -1,167 +1,641 @@
-from openai import OpenAI
-from anthropic import Anthropic
 import aiohttp
+import httpx
 from ..core.config import get_settings
-from typing import List, Dict, Any, Optional
+from ..database import log_api_call
+from ..core import metrics
+from .response_cache import ResponseCache
+from .single_flight import SingleFlight
+from .router import AdaptiveRouter
+from .resilience import HedgeBudget
+from .scheduler import Scheduler, PRIORITY_INTERACTIVE
+from .context import build_messages
+from .model_registry import ModelRegistry, RegistrySnapshot
+from .classifier import load_classifier
+from .admission import AdmissionController
+import asyncio
+import json
+import logging
+import time
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Called with each text delta as it arrives from a streaming provider
+TokenCallback = Callable[[str], Awaitable[None]]
+
+def _httpx_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.PROVIDER_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.PROVIDER_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.PROVIDER_KEEPALIVE_EXPIRY_S
+    )
+
+def _httpx_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        settings.PROVIDER_READ_TIMEOUT_S,
+        connect=settings.PROVIDER_CONNECT_TIMEOUT_S
+    )
 
 class AIService:
     def __init__(self):
-        self.openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        self.anthropic_client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+        # Each provider gets one long-lived, bounded connection pool that is
+        # reused by every request instead of a handshake per call. The SDK
+        # clients are built by ``start``: importing the SDKs is the largest
+        # share of the server's import time
+        self._openai_client = None
+        self._anthropic_client = None
+        self._http_clients: Dict[str, httpx.AsyncClient] = {}
         self.deepseek_api_key = settings.DEEPSEEK_API_KEY
+        self._deepseek_session: Optional[aiohttp.ClientSession] = None
+        self.cache = ResponseCache.from_settings() if settings.RESPONSE_CACHE_ENABLED else None
+        self.single_flight = SingleFlight()
         
-        # Model configurations
-        self.models = {
-            "gpt-4-turbo": {
-                "provider": "openai",
-                "capabilities": ["general"],
-                "priority": 5
-            },
-            "gpt-3.5-turbo": {
-                "provider": "openai",
-                "capabilities": ["general"],
-                "priority": 4
-            },
-            "claude-3-opus": {
-                "provider": "anthropic",
-                "capabilities": ["general"],
-                "priority": 5
-            },
-            "claude-2.1": {
-                "provider": "anthropic",
-                "capabilities": ["general"],
-                "priority": 4
-            }
-        }
+        # Model catalogue and pricing come from the ai_models table; the
+        # router follows every snapshot the registry swaps in
+        self.registry = ModelRegistry()
+        snapshot = self.registry.snapshot
+        self.router = AdaptiveRouter(snapshot.models, snapshot.cost_per_1k(), candidates=snapshot.by_capability)
+        self.registry.add_listener(self._on_registry_changed)
+        self.classifier = None
+        self.hedge_budget = HedgeBudget()
+        self.scheduler = Scheduler()
+        self.admission = AdmissionController(self.registry, self.router)
     
-    async def route_query(self, query: str, task_type: str) -> str:
-        """Route the query to the most suitable model based on task type"""
-        model = self._select_model(task_type)
-        return await self.generate_response(query, model)
+    async def start(self):
+        """Build the SDK clients and load the task classifier in a thread.
+        
+        Importing the SDKs takes hundreds of milliseconds, which would stall
+        every socket on the worker if it happened on the event loop during
+        a request; the lifespan awaits this before the app serves.
+        """
+        if self._openai_client is None:
+            await asyncio.to_thread(self._build)
     
-    def _select_model(self, task_type: str) -> str:
-        """Select the best model for the given task type"""
-        suitable_models = [
-            (name, config) for name, config in self.models.items()
-            if task_type in config["capabilities"]
+    def _build(self):
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient as OpenAIHttpxClient
+        from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient as AnthropicHttpxClient
+        self._http_clients["openai"] = OpenAIHttpxClient(limits=_httpx_limits(), timeout=_httpx_timeout())
+        self._http_clients["anthropic"] = AnthropicHttpxClient(limits=_httpx_limits(), timeout=_httpx_timeout())
+        self.classifier = load_classifier()
+        self._anthropic_client = AsyncAnthropic(
+            api_key=settings.ANTHROPIC_API_KEY,
+            base_url=settings.ANTHROPIC_BASE_URL,
+            http_client=self._http_clients["anthropic"]
+        )
+        # Set last: start() checks it to tell whether the build ran
+        self._openai_client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=self._http_clients["openai"]
+        )
+    
+    @property
+    def openai_client(self):
+        if self._openai_client is None:
+            raise RuntimeError("AIService.start() has not been awaited")
+        return self._openai_client
+    
+    @property
+    def anthropic_client(self):
+        if self._anthropic_client is None:
+            raise RuntimeError("AIService.start() has not been awaited")
+        return self._anthropic_client
+    
+    @property
+    def models(self):
+        """Enabled models of the current registry snapshot"""
+        return self.registry.snapshot.models
+    
+    def _on_registry_changed(self, snapshot: RegistrySnapshot):
+        # Price a balanced 1k-token call to seed the router for new models
+        self.router.update_models(snapshot.models, snapshot.cost_per_1k(), snapshot.by_capability)
+    
+    def _get_deepseek_session(self) -> aiohttp.ClientSession:
+        """Return the shared Deepseek session, creating it on the running loop"""
+        if self._deepseek_session is None or self._deepseek_session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.PROVIDER_MAX_CONNECTIONS,
+                limit_per_host=settings.PROVIDER_MAX_CONNECTIONS,
+                keepalive_timeout=settings.PROVIDER_KEEPALIVE_EXPIRY_S
+            )
+            self._deepseek_session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=settings.PROVIDER_CONNECT_TIMEOUT_S,
+                    sock_read=settings.PROVIDER_READ_TIMEOUT_S
+                ),
+                headers={"Authorization": f"Bearer {self.deepseek_api_key}"}
+            )
+        return self._deepseek_session
+    
+    async def warmup(self, connections: Optional[int] = None):
+        """Open ``connections`` (PROVIDER_WARMUP_CONNECTIONS by default)
+        keep-alive connections to every provider at once, so the first
+        requests skip DNS, TCP and TLS setup. A provider that cannot be
+        reached is skipped; its requests connect on demand."""
+        if connections is None:
+            connections = settings.PROVIDER_WARMUP_CONNECTIONS
+        async def warm_httpx(client: httpx.AsyncClient, url: str):
+            # Any response will do; the connection stays in the pool
+            await client.head(url, timeout=settings.PROVIDER_CONNECT_TIMEOUT_S)
+        
+        async def warm_aiohttp(session: aiohttp.ClientSession, url: str):
+            async with session.head(url):
+                pass
+        
+        await self.start()
+        targets = [
+            ("openai", warm_httpx, self._http_clients["openai"], settings.OPENAI_BASE_URL),
+            ("anthropic", warm_httpx, self._http_clients["anthropic"], settings.ANTHROPIC_BASE_URL),
+            ("deepseek", warm_aiohttp, self._get_deepseek_session(), settings.DEEPSEEK_BASE_URL)
         ]
+        results = await asyncio.gather(*(
+            warm(client, url) for _, warm, client, url in targets for _ in range(connections)
+        ), return_exceptions=True)
+        for index, (provider, _, _, _) in enumerate(targets):
+            errors = [r for r in results[index * connections:(index + 1) * connections] if isinstance(r, Exception)]
+            if errors:
+                logger.warning("Could not warm up %s connections: %s",
+                               provider, str(errors[0]) or type(errors[0]).__name__)
+    
+    async def aclose(self):
+        """Close all provider connection pools"""
+        if self._openai_client is not None:
+            await self._openai_client.close()
+        if self._anthropic_client is not None:
+            await self._anthropic_client.close()
+        if self._deepseek_session is not None and not self._deepseek_session.closed:
+            await self._deepseek_session.close()
+        self._deepseek_session = None
+        if self.cache is not None:
+            await self.cache.aclose()
+    
+    async def route_query(self, query: str, task_type: str,
+                          on_token: Optional[TokenCallback] = None,
+                          priority: int = PRIORITY_INTERACTIVE,
+                          history: Optional[List[Dict[str, str]]] = None,
+                          chat_id: Optional[int] = None) -> Dict[str, Any]:
+        """Route the query to the most suitable model based on task type.
+        
+        A ``task_type`` of "general" is refined by the task classifier; see
+        ``_resolve_task_type``. ``history`` holds earlier turns of the chat,
+        oldest first; only the most recent turns that fit the selected
+        model's context budget are sent. Calls that miss the cache are
+        checked against the budgets of ``chat_id`` and the day, which may
+        pick a cheaper model or raise BudgetExceeded.
+        """
+        task_type, task_confidence = self._resolve_task_type(query, task_type)
+        model = self._select_model(task_type)
+        model_config = self.registry.snapshot.entries[model]
+        context_tokens = model_config["context_tokens"]
+        messages = build_messages(history or [], query, context_tokens)
+        
+        key = None
+        if self.cache is not None:
+            start_time = time.perf_counter()
+            key = self.cache.make_key(messages, model, task_type)
+            cached = await self.cache.get(key)
+            provider = model_config["provider"]
+            metrics.CACHE_REQUESTS.labels(provider, model, "miss" if cached is None else "hit").inc()
+            if cached is not None:
+                if on_token:
+                    await on_token(cached["content"])
+                lookup_ms = (time.perf_counter() - start_time) * 1000
+                cached["metrics"] = {
+                    "tokens_used": 0,
+                    "cost_usd": 0.0,
+                    "latency_ms": lookup_ms,
+                    "time_to_first_token_ms": lookup_ms,
+                    "cache_hit": True,
+                    "cost_saved_usd": cached["metrics"].get("cost_usd", 0.0),
+                    "task_type": task_type,
+                    "task_confidence": task_confidence,
+                    **self.cache.stats()
+                }
+                return cached
+        
+        if chat_id is not None:
+            await self.admission.ensure_chat(chat_id)
+        admission = self.admission.admit(messages, model, task_type, chat_id)
+        if admission.model != model:
+            # Keep to the history the budget was checked against
+            model = admission.model
+            context_tokens = min(context_tokens, self.registry.snapshot.entries[model]["context_tokens"])
+            messages = build_messages(history or [], query, context_tokens)
+            if key is not None:
+                key = self.cache.make_key(messages, model, task_type)
+        
+        async def generate(stream_to: Optional[TokenCallback]) -> Dict[str, Any]:
+            response = await self._generate_with_failover(
+                messages, task_type, model, stream_to, priority, admission.max_tokens
+            )
+            if key is not None:
+                await self.cache.set(key, response)
+            return response
         
-        if not suitable_models:
-            return "gpt-4"  # Default to GPT-4 if no specific model is suitable
+        # Identical in-flight requests share a single upstream call
+        flight_key = self.single_flight.make_key(model, messages, on_token is not None)
+        try:
+            response, joined = await self.single_flight.do(flight_key, generate, on_token)
+        except BaseException:
+            self.admission.settle(admission)
+            raise
+        # A request that joined another's call was not billed for it
+        self.admission.settle(
+            admission,
+            0.0 if joined else response["metrics"]["cost_usd"],
+            None if joined else response["metrics"].get("output_tokens"),
+            response["metrics"].get("truncated", False)
+        )
+        response["metrics"]["max_tokens"] = admission.max_tokens
+        response["metrics"]["coalesced"] = joined
+        response["metrics"].update(task_type=task_type, task_confidence=task_confidence)
+        response["metrics"]["coalesced_requests"] = self.single_flight.coalesced[flight_key]
+        if self.cache is not None:
+            response["metrics"].update(cache_hit=False, cost_saved_usd=0.0, **self.cache.stats())
+        return response
+    
+    async def _generate_with_failover(self, messages: List[Dict[str, str]], task_type: str, model_name: str,
+                                      on_token: Optional[TokenCallback] = None,
+                                      priority: int = PRIORITY_INTERACTIVE,
+                                      max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Generate with the primary model, hedging to a backup model when the
+        first token is late and failing over to it on a hard error.
+        
+        Whichever attempt streams a token first (or completes first, when not
+        streaming) wins and the other attempt is cancelled.
+        """
+        breakers = self.router.breakers
+        self.hedge_budget.earn()
+        if not breakers[model_name].allow():
+            model_name = self.router.backup_for(task_type, model_name) or model_name
+        backup = self.router.backup_for(task_type, model_name)
+        
+        winner = None
+        attempts: Dict[asyncio.Future, str] = {}
+        first_signal = asyncio.Event()
+        
+        def start(name: str):
+            async def emit(text: str):
+                nonlocal winner
+                if winner is None:
+                    winner = name
+                    first_signal.set()
+                    for task, other in attempts.items():
+                        if other != name:
+                            task.cancel()
+                if winner == name and on_token:
+                    await on_token(text)
             
-        # Sort by priority and return the highest priority model
-        return max(suitable_models, key=lambda x: x[1]["priority"])[0]
-    
-    def _calculate_openai_cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
-        """Calculate cost for OpenAI API usage"""
-        pricing = {
-            "gpt-4-turbo": {"input": 0.01/1000, "output": 0.03/1000},
-            "gpt-4": {"input": 0.03/1000, "output": 0.06/1000},
-            "gpt-3.5-turbo": {"input": 0.0005/1000, "output": 0.0015/1000}
-        }
-        if model in pricing:
-            return (input_tokens * pricing[model]["input"] + 
-                    output_tokens * pricing[model]["output"])
-        return 0.0
-
-    def _calculate_anthropic_cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
-        """Calculate cost for Anthropic API usage"""
-        pricing = {
-            "claude-3-opus": {"input": 0.015/1000, "output": 0.075/1000},
-            "claude-3-sonnet": {"input": 0.003/1000, "output": 0.015/1000},
-            "claude-2.1": {"input": 0.008/1000, "output": 0.024/1000}
-        }
-        if model in pricing:
-            return (input_tokens * pricing[model]["input"] + 
-                    output_tokens * pricing[model]["output"])
-        return 0.0
-
-    async def generate_response(self, query: str, model_name: str) -> Dict[str, Any]:
-        """Generate response using the specified model"""
-        import time
-        start_time = time.time()
+            def done(task: asyncio.Future):
+                first_signal.set()
+                if task.cancelled():
+                    breakers[name].release()
+            
+            # Hedging races on the first token, so attempts always stream then
+            stream = emit if on_token or settings.HEDGING_ENABLED else None
+            task = asyncio.ensure_future(
+                self.generate_response(messages, name, on_token=stream, priority=priority, max_tokens=max_tokens)
+            )
+            task.add_done_callback(done)
+            attempts[task] = name
         
-        model_config = self.models[model_name]
-        provider = model_config["provider"]
+        start(model_name)
+        tried = {model_name}
+        hedged = failover = False
+        if settings.HEDGING_ENABLED and backup is not None:
+            delay_ms = max(
+                settings.HEDGE_MIN_DELAY_MS,
+                self.router.stats[model_name].ttft_percentile(settings.HEDGE_PERCENTILE)
+            )
+            try:
+                await asyncio.wait_for(first_signal.wait(), delay_ms / 1000)
+            except asyncio.TimeoutError:
+                if (winner is None and breakers[backup].available()
+                        and self.hedge_budget.try_spend() and breakers[backup].allow()):
+                    start(backup)
+                    tried.add(backup)
+                    hedged = True
         
+        last_error = None
         try:
-            if provider == "openai":
-                response, usage = await self._generate_openai_response(query, model_name)
-                cost = self._calculate_openai_cost(
-                    model_name,
-                    usage["prompt_tokens"],
-                    usage["completion_tokens"]
-                )
-                total_tokens = usage["total_tokens"]
-            elif provider == "anthropic":
-                response, usage = await self._generate_anthropic_response(query, model_name)
-                cost = self._calculate_anthropic_cost(
-                    model_name,
-                    usage["input_tokens"],
-                    usage["output_tokens"]
-                )
-                total_tokens = usage["input_tokens"] + usage["output_tokens"]
-            elif provider == "deepseek":
-                response = await self._generate_deepseek_response(query, model_name)
-                cost = 0.0
-                total_tokens = 0
-            else:
-                raise ValueError(f"Unknown provider: {provider}")
-        except Exception as e:
-            raise e
+            while attempts:
+                done, _ = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = attempts.pop(task)
+                    if task.cancelled():
+                        continue
+                    error = task.exception()
+                    if error is None:
+                        if winner in (None, name):
+                            result = task.result()
+                            result["metrics"]["hedged"] = hedged
+                            result["metrics"]["failover"] = failover
+                            return result
+                        continue
+                    last_error = error
+                    logger.warning("Model %s failed: %s", name, error)
+                    # Once tokens reached the client a retry would repeat them
+                    if winner == name:
+                        raise error
+                    if (not attempts and winner is None and backup is not None
+                            and backup not in tried and breakers[backup].allow()):
+                        start(backup)
+                        tried.add(backup)
+                        failover = True
+            raise last_error or RuntimeError("All model attempts were cancelled")
         finally:
-            end_time = time.time()
-            
-        return {
+            for task in attempts:
+                task.cancel()
+    
+    def _resolve_task_type(self, query: str, task_type: str) -> Tuple[str, float]:
+        """Task type to route on, with the classifier's confidence in it.
+        
+        A specific task type chosen by the client is kept. A general query is
+        classified, and routed as the predicted task when the prediction is at
+        least TASK_CLASSIFIER_MIN_CONFIDENCE likely, so cheaper models that
+        handle that task can serve it. Less certain queries stay general.
+        """
+        if task_type != "general" or self.classifier is None:
+            metrics.TASK_CLASSIFICATIONS.labels(task_type, "client").inc()
+            return task_type, 1.0
+        predicted, confidence = self.classifier.classify(query)
+        if confidence < settings.TASK_CLASSIFIER_MIN_CONFIDENCE:
+            predicted = "general"
+        metrics.TASK_CLASSIFICATIONS.labels(predicted, "classifier").inc()
+        return predicted, confidence
+    
+    def select_model_for(self, query: str, task_type: str) -> str:
+        """Model ``route_query`` would pick for ``query``"""
+        return self._select_model(self._resolve_task_type(query, task_type)[0])
+    
+    def _select_model(self, task_type: str) -> str:
+        """Select the best model for the given task type"""
+        return self.router.select(task_type)
+    
+    def _calculate_cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        """Calculate cost for any provider's API usage"""
+        return self.registry.snapshot.cost(model, input_tokens, output_tokens)
+    
+    async def generate_response(self, messages: List[Dict[str, str]], model_name: str,
+                                on_token: Optional[TokenCallback] = None,
+                                priority: int = PRIORITY_INTERACTIVE,
+                                job_id: Optional[str] = None,
+                                max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Generate response using the specified model for a list of
+        ``{"role", "content"}`` messages ending with the user's query.
+        
+        When ``on_token`` is given the provider is called in streaming mode and
+        the callback receives every text delta as soon as it arrives. Calls
+        wait for the provider's scheduler, which serves lower ``priority``
+        values first. ``job_id`` tags the call's telemetry with a bulk job.
+        ``max_tokens`` limits the reply; without it providers that require
+        a limit get DEFAULT_MAX_OUTPUT_TOKENS.
+        """
+        first_token_time = None
+        
+        # Entries include disabled models, so a call started before a model
+        # was disabled still completes
+        model_config = self.registry.snapshot.entries[model_name]
+        provider = model_config["provider"]
+        model_id = model_config["model_id"]
+        
+        async def emit(text: str):
+            nonlocal first_token_time
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+            await on_token(text)
+        
+        # Reserve the prompt plus a typical completion against the TPM quota
+        estimated_tokens = (
+            sum(len(m["content"]) for m in messages) // 4 + settings.SCHEDULER_OUTPUT_TOKEN_ESTIMATE
+        )
+        async with self.scheduler.slot(provider, estimated_tokens, priority) as slot:
+            # Provider latency is timed from admission; queueing is reported separately
+            start_time = time.perf_counter()
+            try:
+                if provider == "openai":
+                    if on_token:
+                        response, usage = await self._stream_openai_response(messages, model_id, emit, max_tokens)
+                    else:
+                        response, usage = await self._generate_openai_response(messages, model_id, max_tokens)
+                    cost = self._calculate_cost(
+                        model_name,
+                        usage["prompt_tokens"],
+                        usage["completion_tokens"]
+                    )
+                    total_tokens = usage["total_tokens"]
+                    output_tokens = usage["completion_tokens"]
+                    truncated = usage["truncated"]
+                elif provider == "anthropic":
+                    if on_token:
+                        response, usage = await self._stream_anthropic_response(messages, model_id, emit, max_tokens)
+                    else:
+                        response, usage = await self._generate_anthropic_response(messages, model_id, max_tokens)
+                    cost = self._calculate_cost(
+                        model_name,
+                        usage["input_tokens"],
+                        usage["output_tokens"]
+                    )
+                    total_tokens = usage["input_tokens"] + usage["output_tokens"]
+                    output_tokens = usage["output_tokens"]
+                    truncated = usage["truncated"]
+                elif provider == "deepseek":
+                    if on_token:
+                        response, truncated = await self._stream_deepseek_response(messages, model_id, emit, max_tokens)
+                    else:
+                        response, truncated = await self._generate_deepseek_response(messages, model_id, max_tokens)
+                    # Usage is not reported; estimate it with the admission tokenizer
+                    tokenizer = self.admission.tokenizer
+                    input_tokens = tokenizer.count_messages(messages)
+                    output_tokens = tokenizer.count(response)
+                    cost = self._calculate_cost(model_name, input_tokens, output_tokens)
+                    total_tokens = input_tokens + output_tokens
+                else:
+                    raise ValueError(f"Unknown provider: {provider}")
+            except Exception as e:
+                self.router.record(model_name, error=True)
+                metrics.ERRORS.labels(provider, model_name).inc()
+                log_api_call(provider, {
+                    "success": False,
+                    "model": model_name,
+                    "prompt": messages[-1]["content"],
+                    "error": str(e),
+                    "job_id": job_id
+                })
+                raise e
+            finally:
+                end_time = time.perf_counter()
+            if total_tokens:
+                slot.used_tokens = total_tokens
+        
+        # Without streaming the whole completion is the first token
+        if first_token_time is None:
+            first_token_time = end_time
+        
+        result = {
             "content": response,
             "model": model_name,
             "provider": provider,
             "metrics": {
                 "tokens_used": total_tokens,
+                "output_tokens": output_tokens,
+                "truncated": truncated,
                 "cost_usd": cost,
-                "latency_ms": (end_time - start_time) * 1000
+                "latency_ms": (end_time - start_time) * 1000,
+                "time_to_first_token_ms": (first_token_time - start_time) * 1000,
+                "queue_wait_ms": slot.queue_wait_ms,
+                "queue_depth": slot.queue_depth
             }
         }
+        self.router.record(model_name, result["metrics"])
+        metrics.PROVIDER_LATENCY.labels(provider, model_name).observe(end_time - start_time)
+        metrics.TIME_TO_FIRST_TOKEN.labels(provider, model_name).observe(first_token_time - start_time)
+        metrics.QUEUE_WAIT.labels(provider).observe(slot.queue_wait_ms / 1000)
+        metrics.TOKENS.labels(provider, model_name).inc(total_tokens)
+        metrics.COST.labels(provider, model_name).inc(cost)
+        log_api_call(provider, {
+            "success": True,
+            "model": model_name,
+            "prompt": messages[-1]["content"],
+            "response": response,
+            "metrics": {
+                "latency": result["metrics"]["latency_ms"] / 1000,
+                "tokens": total_tokens,
+                "cost_usd": cost
+            },
+            "job_id": job_id
+        })
+        return result
     
-    async def _generate_openai_response(self, query: str, model_name: str) -> tuple[str, dict]:
+    async def _generate_openai_response(self, messages: List[Dict[str, str]], model_name: str,
+                                        max_tokens: Optional[int] = None) -> tuple[str, dict]:
         """Generate response using OpenAI's API"""
         response = await self.openai_client.chat.completions.create(
             model=model_name,
-            messages=[{"role": "user", "content": query}]
+            messages=messages,
+            **({"max_tokens": max_tokens} if max_tokens else {})
         )
         return response.choices[0].message.content, {
             "prompt_tokens": response.usage.prompt_tokens,
             "completion_tokens": response.usage.completion_tokens,
-            "total_tokens": response.usage.total_tokens
+            "total_tokens": response.usage.total_tokens,
+            "truncated": response.choices[0].finish_reason == "length"
         }
     
-    async def _generate_anthropic_response(self, query: str, model_name: str) -> tuple[str, dict]:
+    async def _generate_anthropic_response(self, messages: List[Dict[str, str]], model_name: str,
+                                           max_tokens: Optional[int] = None) -> tuple[str, dict]:
         """Generate response using Anthropic's API"""
         message = await self.anthropic_client.messages.create(
             model=model_name,
-            max_tokens=1024,
-            messages=[{"role": "user", "content": query}]
+            max_tokens=max_tokens or settings.DEFAULT_MAX_OUTPUT_TOKENS,
+            messages=messages
         )
         return message.content[0].text, {
             "input_tokens": message.usage.input_tokens,
-            "output_tokens": message.usage.output_tokens
+            "output_tokens": message.usage.output_tokens,
+            "truncated": message.stop_reason == "max_tokens"
         }
     
-    async def _generate_deepseek_response(self, query: str, model_name: str) -> str:
-        """Generate response using Deepseek's API"""
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.deepseek.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {self.deepseek_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": model_name,
-                    "messages": [{"role": "user", "content": query}]
-                }
-            ) as response:
-                data = await response.json()
-                return data["choices"][0]["message"]["content"]
\ No newline at end of file
+    async def _generate_deepseek_response(self, messages: List[Dict[str, str]], model_name: str,
+                                          max_tokens: Optional[int] = None) -> tuple[str, bool]:
+        """Generate response using Deepseek's API; also whether it was cut off at max_tokens"""
+        async with self._get_deepseek_session().post(
+            f"{settings.DEEPSEEK_BASE_URL}/chat/completions",
+            json={
+                "model": model_name,
+                "messages": messages,
+                **({"max_tokens": max_tokens} if max_tokens else {})
+            }
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
+            choice = data["choices"][0]
+            return choice["message"]["content"], choice.get("finish_reason") == "length"
+    
+    async def _stream_openai_response(self, messages: List[Dict[str, str]], model_name: str,
+                                      on_token: TokenCallback, max_tokens: Optional[int] = None) -> tuple[str, dict]:
+        """Stream a response from OpenAI's API, forwarding each delta"""
+        stream = await self.openai_client.chat.completions.create(
+            model=model_name,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **({"max_tokens": max_tokens} if max_tokens else {})
+        )
+        parts = []
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        finish_reason = None
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    text = chunk.choices[0].delta.content
+                    parts.append(text)
+                    await on_token(text)
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                if chunk.usage:
+                    usage = {
+                        "prompt_tokens": chunk.usage.prompt_tokens,
+                        "completion_tokens": chunk.usage.completion_tokens,
+                        "total_tokens": chunk.usage.total_tokens
+                    }
+        finally:
+            # On cancellation this drops the connection, which stops generation upstream
+            await stream.close()
+        return "".join(parts), {**usage, "truncated": finish_reason == "length"}
+    
+    async def _stream_anthropic_response(self, messages: List[Dict[str, str]], model_name: str,
+                                         on_token: TokenCallback, max_tokens: Optional[int] = None) -> tuple[str, dict]:
+        """Stream a response from Anthropic's API, forwarding each delta"""
+        async with self.anthropic_client.messages.stream(
+            model=model_name,
+            max_tokens=max_tokens or settings.DEFAULT_MAX_OUTPUT_TOKENS,
+            messages=messages
+        ) as stream:
+            async for text in stream.text_stream:
+                await on_token(text)
+            message = await stream.get_final_message()
+        return "".join(block.text for block in message.content if block.type == "text"), {
+            "input_tokens": message.usage.input_tokens,
+            "output_tokens": message.usage.output_tokens,
+            "truncated": message.stop_reason == "max_tokens"
+        }
+    
+    async def _stream_deepseek_response(self, messages: List[Dict[str, str]], model_name: str,
+                                        on_token: TokenCallback, max_tokens: Optional[int] = None) -> tuple[str, bool]:
+        """Stream a response from Deepseek's server-sent events API; also
+        whether it was cut off at max_tokens"""
+        parts = []
+        finish_reason = None
+        async with self._get_deepseek_session().post(
+            f"{settings.DEEPSEEK_BASE_URL}/chat/completions",
+            json={
+                "model": model_name,
+                "messages": messages,
+                "stream": True,
+                **({"max_tokens": max_tokens} if max_tokens else {})
+            }
+        ) as response:
+            response.raise_for_status()
+            try:
+                async for line in response.content:
+                    line = line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    choices = json.loads(payload).get("choices") or []
+                    text = choices[0].get("delta", {}).get("content") if choices else None
+                    if text:
+                        parts.append(text)
+                        await on_token(text)
+                    if choices and choices[0].get("finish_reason"):
+                        finish_reason = choices[0]["finish_reason"]
+            except asyncio.CancelledError:
+                # Close rather than release, so the unread stream is not reused
+                response.close()
+                raise
+        return "".join(parts), finish_reason == "length"
\ No newline at end of file
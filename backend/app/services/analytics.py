@@ -0,0 +1,233 @@
+import math
+import os
+import re
+from typing import Dict, List, Optional
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.ipc as ipc
+
+# CSVs are parsed in blocks of this size, so conversion memory stays flat
+# regardless of file size
+CSV_BLOCK_BYTES = 16 * 1024 * 1024
+TOP_VALUES = 5
+MAX_RESULT_ROWS = 20
+
+AGGREGATE_WORDS = {
+    "mean": ("average", "avg", "mean"),
+    "sum": ("total", "sum"),
+    "max": ("max", "maximum", "highest", "largest", "most"),
+    "min": ("min", "minimum", "lowest", "smallest", "least"),
+    "count": ("count", "how many", "number of")
+}
+
+OPERATORS = {
+    "==": pc.equal,
+    "!=": pc.not_equal,
+    ">": pc.greater,
+    ">=": pc.greater_equal,
+    "<": pc.less,
+    "<=": pc.less_equal
+}
+
+def csv_to_arrow(csv_path: str, arrow_path: str) -> int:
+    """Convert a CSV to an Arrow IPC file in one streaming pass; returns the row count.
+
+    Column types are inferred from the first block. If a later block does not
+    fit them the file is converted again with every column read as text.
+    """
+    tmp_path = arrow_path + ".part"
+    read_options = pacsv.ReadOptions(block_size=CSV_BLOCK_BYTES)
+    try:
+        rows = _write_batches(pacsv.open_csv(csv_path, read_options=read_options), tmp_path)
+    except pa.ArrowInvalid:
+        header = pacsv.open_csv(csv_path, read_options=read_options).schema.names
+        convert_options = pacsv.ConvertOptions(column_types={name: pa.string() for name in header})
+        rows = _write_batches(
+            pacsv.open_csv(csv_path, read_options=read_options, convert_options=convert_options),
+            tmp_path
+        )
+    os.replace(tmp_path, arrow_path)
+    return rows
+
+def _write_batches(reader, path: str) -> int:
+    rows = 0
+    with ipc.new_file(path, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+def open_table(arrow_path: str) -> pa.Table:
+    """Memory-map a converted file; columns are paged in only when touched"""
+    return ipc.open_file(pa.memory_map(arrow_path)).read_all()
+
+def _is_numeric(data_type) -> bool:
+    return pa.types.is_integer(data_type) or pa.types.is_floating(data_type)
+
+def _scalar(value):
+    value = value.as_py() if isinstance(value, pa.Scalar) else value
+    if isinstance(value, float):
+        return None if math.isnan(value) else float(f"{value:.6g}")
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+def profile(table: pa.Table) -> List[Dict]:
+    """Per-column summary computed with vectorized kernels"""
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        summary = {"name": name, "type": str(column.type), "nulls": column.null_count}
+        if _is_numeric(column.type):
+            min_max = pc.min_max(column)
+            summary.update(
+                min=_scalar(min_max["min"]),
+                max=_scalar(min_max["max"]),
+                mean=_scalar(pc.mean(column)),
+                std=_scalar(pc.stddev(column))
+            )
+        elif pa.types.is_temporal(column.type):
+            min_max = pc.min_max(column)
+            summary.update(min=_scalar(min_max["min"]), max=_scalar(min_max["max"]))
+        else:
+            counts = pc.value_counts(column.drop_null() if column.null_count else column)
+            top = pc.sort_indices(counts.field("counts"), sort_keys=[("", "descending")])[:TOP_VALUES]
+            summary.update(
+                distinct=len(counts),
+                top=[
+                    [_scalar(counts.field("values")[i]), counts.field("counts")[i].as_py()]
+                    for i in top.to_pylist()
+                ]
+            )
+        columns.append(summary)
+    return columns
+
+def describe(rows: int, columns: List[Dict], head: Optional[pa.Table] = None) -> str:
+    lines = [f"{rows} rows, {len(columns)} columns"]
+    for column in columns:
+        line = f"- {column['name']} ({column['type']}): {column['nulls']} empty"
+        if "mean" in column:
+            line += f", min {column['min']}, max {column['max']}, mean {column['mean']}, std {column['std']}"
+        elif "min" in column:
+            line += f", from {column['min']} to {column['max']}"
+        elif "distinct" in column:
+            top = ", ".join(f"{value} ({count})" for value, count in column["top"])
+            line += f", {column['distinct']} distinct, most common: {top}"
+        lines.append(line)
+    if head is not None and head.num_rows:
+        lines.append(f"First {head.num_rows} rows:")
+        lines.extend(_format_rows(head))
+    return "\n".join(lines)
+
+def _format_rows(table: pa.Table) -> List[str]:
+    lines = [",".join(table.column_names)]
+    for row in table.to_pylist():
+        lines.append(",".join("" if value is None else str(_scalar(value)) for value in row.values()))
+    return lines
+
+def _mentions(text: str, name: str) -> bool:
+    variants = {name.lower(), name.lower().replace("_", " ")}
+    return any(re.search(rf"(?<!\w){re.escape(v)}(?!\w)", text) for v in variants if v)
+
+def plan(question: str, schema: pa.Schema) -> Optional[Dict]:
+    """Derive a query from the column names and keywords in ``question``.
+
+    Returns ``None`` when the question does not mention any column, in which
+    case the profile alone is sent to the model.
+    """
+    text = question.lower()
+    mentioned = [field for field in schema if _mentions(text, field.name)]
+    if not mentioned:
+        return None
+
+    filters = []
+    for field in mentioned:
+        names = "|".join(re.escape(v) for v in {field.name.lower(), field.name.lower().replace("_", " ")})
+        match = re.search(
+            rf"(?<!\w)(?:{names})\s*(==|!=|>=|<=|=|>|<|is not|is|equals)\s*['\"]?([\w.\-:]+)",
+            text
+        )
+        if match:
+            op = {"=": "==", "is": "==", "equals": "==", "is not": "!="}.get(match.group(1), match.group(1))
+            filters.append({"column": field.name, "op": op, "value": match.group(2)})
+    filtered = {f["column"] for f in filters}
+
+    group_by = [
+        field.name for field in mentioned
+        if re.search(rf"\b(?:by|per|each|across)\s+(?:the\s+)?{re.escape(field.name.lower())}(?!\w)", text)
+        or (field.name not in filtered and not _is_numeric(field.type))
+    ]
+    functions = [fn for fn, words in AGGREGATE_WORDS.items() if any(re.search(rf"\b{w}\b", text) for w in words)]
+    metrics = [
+        {"column": field.name, "fn": fn}
+        for field in mentioned
+        if _is_numeric(field.type) and field.name not in group_by and field.name not in filtered
+        for fn in (functions or ["sum", "mean"]) if fn != "count"
+    ]
+    if "count" in functions or not metrics:
+        metrics.append({"column": None, "fn": "count"})
+    return {"filters": filters, "group_by": group_by, "metrics": metrics, "limit": MAX_RESULT_ROWS}
+
+def _filter_expression(table: pa.Table, spec: Dict):
+    column = table[spec["column"]]
+    op = spec["op"]
+    value = spec["value"]
+    if _is_numeric(column.type):
+        value = float(value)
+    elif pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        # Text comparisons are case-insensitive
+        column = pc.utf8_lower(column)
+        value = str(value).lower()
+    else:
+        value = pa.scalar(value).cast(column.type)
+    return OPERATORS[op](column, value)
+
+def run_query(table: pa.Table, spec: Dict) -> pa.Table:
+    """Apply filters, then group and aggregate; results are sorted by the
+    first metric, largest first, and capped at ``limit`` rows"""
+    for condition in spec.get("filters", []):
+        table = table.filter(_filter_expression(table, condition))
+
+    aggregations = [
+        ([], "count_all") if metric["fn"] == "count" else (metric["column"], metric["fn"])
+        for metric in spec.get("metrics", [])
+    ]
+    group_by = spec.get("group_by", [])
+    if group_by:
+        result = table.group_by(group_by).aggregate(aggregations)
+    else:
+        result = pa.table({
+            "count_all" if fn == "count_all" else f"{column}_{fn}":
+                [table.num_rows if fn == "count_all" else getattr(pc, fn)(table[column]).as_py()]
+            for column, fn in aggregations
+        })
+    metric_columns = [name for name in result.column_names if name not in group_by]
+    if group_by and metric_columns:
+        result = result.sort_by([(metric_columns[0], "descending")])
+    return result.slice(0, spec.get("limit", MAX_RESULT_ROWS))
+
+def _describe_query(spec: Dict) -> str:
+    parts = []
+    metrics = ", ".join("count" if m["fn"] == "count" else f"{m['fn']}({m['column']})" for m in spec["metrics"])
+    parts.append(metrics)
+    if spec["filters"]:
+        parts.append("where " + " and ".join(f"{f['column']} {f['op']} {f['value']}" for f in spec["filters"]))
+    if spec["group_by"]:
+        parts.append("grouped by " + ", ".join(spec["group_by"]))
+    return " ".join(parts)
+
+def answer(arrow_path: str, question: str, columns: List[Dict], rows: int, max_chars: int) -> str:
+    """Compact context for ``question``: the stored profile plus the result
+    of the query planned from the question, computed over the whole file"""
+    table = open_table(arrow_path)
+    text = describe(rows, columns)
+    spec = plan(question, table.schema)
+    if spec is not None:
+        try:
+            result = run_query(table, spec)
+            text += f"\nComputed over all rows: {_describe_query(spec)}\n" + "\n".join(_format_rows(result))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, ValueError, KeyError) as e:
+            text += f"\nCould not compute {_describe_query(spec)}: {str(e)}"
+    if len(text) > max_chars:
+        text = text[:max_chars] + "\n[truncated]"
+    return text
@@ -0,0 +1,688 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy import insert, select, update, func, or_
+from ..core.config import get_settings
+from ..core.database import SessionLocal
+from ..core import metrics
+from ..database import log_api_call
+from ..models.models import BatchJob, BatchItem
+from .scheduler import PRIORITY_BATCH
+from .admission import BudgetExceeded
+from .usage import usage_entry, record_usage
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("pending", "running")
+# Providers whose batch API is used for large groups of items
+BATCH_API_PROVIDERS = ("openai", "anthropic")
+RESULT_FIELDS = (
+    "status", "model", "provider_batch", "response", "error",
+    "tokens_used", "cost_usd", "latency_ms"
+)
+
+class BatchService:
+    """Runs bulk jobs: many independent prompts submitted at once and
+    answered in the background, with results streamed back as they land.
+    
+    Items and results live in batch_items, so jobs survive restarts. The
+    worker holding a job's lease runs it and renews the lease while it
+    does; another worker resumes the job once the lease lapses. Each model's
+    items go to the provider's batch API when there are enough of them, and
+    are otherwise fanned out at batch priority with bounded concurrency, so
+    interactive traffic is served first.
+    """
+    
+    # How often a result stream re-reads the database when not woken by a
+    # local write; results written by another worker arrive this way
+    STREAM_POLL_S = 1.0
+    STREAM_PAGE_SIZE = 500
+    
+    def __init__(self, ai_service, session_factory=SessionLocal,
+                 concurrency: int = settings.BATCH_CONCURRENCY,
+                 lease_s: float = settings.BATCH_LEASE_S,
+                 write_interval_ms: int = settings.BATCH_WRITE_INTERVAL_MS):
+        self.ai_service = ai_service
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.lease_s = lease_s
+        self.write_interval = write_interval_ms / 1000
+        # Identifies this process as a lease holder
+        self.owner = uuid.uuid4().hex
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-writer")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._runners: Dict[str, asyncio.Task] = {}
+        # Results not yet written, the last sequence number used and an
+        # event set after each write, per running job
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._seq: Dict[str, int] = {}
+        self._written: Dict[str, asyncio.Event] = {}
+    
+    async def create_job(self, prompts: List[Tuple[str, Optional[str]]], task_type: str,
+                         model: Optional[str] = None) -> str:
+        """Store a job for ``(prompt, custom_id)`` pairs and start running it"""
+        job_id = uuid.uuid4().hex
+        await self._call(self._insert_job, job_id, prompts, task_type, model)
+        self.start(job_id)
+        return job_id
+    
+    def start(self, job_id: str):
+        """Run a job in this process unless it already is"""
+        runner = self._runners.get(job_id)
+        if runner is None or runner.done():
+            self._runners[job_id] = asyncio.get_running_loop().create_task(self._run(job_id))
+    
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._read_job, job_id)
+    
+    async def resume(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Retry a finished or cancelled job's failed and unfinished items"""
+        job = await self._call(self._reopen, job_id)
+        if job is not None and job["status"] == "pending":
+            self.start(job_id)
+        return job
+    
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Stop a job. Results so far are kept and the job can be resumed."""
+        job, remote_batches = await self._call(self._mark_cancelled, job_id)
+        runner = self._runners.get(job_id)
+        if runner is not None:
+            runner.cancel()
+        for remote in remote_batches:
+            try:
+                await self._cancel_remote(remote)
+            except Exception as e:
+                logger.warning("Error cancelling provider batch %s: %s", remote, e)
+        return job
+    
+    async def resume_forever(self):
+        """Take over jobs whose worker stopped renewing its lease"""
+        while True:
+            try:
+                for job_id in await asyncio.to_thread(self._orphaned_jobs):
+                    self.start(job_id)
+            except Exception as e:
+                logger.warning("Error looking for orphaned batch jobs: %s", e)
+            await asyncio.sleep(self.lease_s / 2)
+    
+    async def stop(self):
+        """Stop the jobs running here and hand their leases back"""
+        runners = [runner for runner in self._runners.values() if not runner.done()]
+        for runner in runners:
+            runner.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+    
+    async def stream_results(self, job_id: str, after_seq: int = 0,
+                             follow: bool = True) -> AsyncIterator[str]:
+        """Results as NDJSON lines in the order they were recorded, starting
+        after ``after_seq``, then a summary line.
+        
+        With ``follow`` the stream stays open until the job finishes. A
+        client that loses the stream reconnects with the last ``seq`` it saw.
+        """
+        try:
+            while True:
+                # Taken before reading so a write in between still wakes us
+                written = self._written.setdefault(job_id, asyncio.Event())
+                job, rows = await asyncio.to_thread(self._read_results, job_id, after_seq, self.STREAM_PAGE_SIZE)
+                if job is None:
+                    return
+                for row in rows:
+                    after_seq = row["seq"]
+                    yield json.dumps({"type": "result", **row}) + "\n"
+                if len(rows) == self.STREAM_PAGE_SIZE:
+                    continue
+                if not follow or job["status"] not in ACTIVE_STATUSES:
+                    yield json.dumps({"type": "summary", **job, "last_seq": after_seq}) + "\n"
+                    return
+                try:
+                    await asyncio.wait_for(written.wait(), self.STREAM_POLL_S)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Only this process's writes set the event; results of a job
+            # running elsewhere are found by polling
+            if job_id not in self._runners:
+                self._written.pop(job_id, None)
+    
+    async def _run(self, job_id: str):
+        if not await self._call(self._claim, job_id):
+            return
+        runner = asyncio.current_task()
+        heartbeat = asyncio.create_task(self._renew_lease(job_id, runner))
+        writer = asyncio.create_task(self._write_forever(job_id))
+        try:
+            job, items, last_seq = await asyncio.to_thread(self._read_work, job_id)
+            self._seq[job_id] = last_seq
+            await asyncio.gather(*(
+                self._run_group(job_id, job["task_type"], model, remote, group)
+                for (model, remote), group in self._group(job, items).items()
+            ))
+            await self._flush(job_id)
+            await self._call(self._finish, job_id)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("Error running batch job %s", job_id)
+        finally:
+            heartbeat.cancel()
+            writer.cancel()
+            # Keep whatever completed before a cancellation
+            try:
+                await self._flush(job_id)
+                await self._call(self._release, job_id)
+            except Exception as e:
+                logger.warning("Error releasing batch job %s: %s", job_id, e)
+            self._seq.pop(job_id, None)
+            self._pending.pop(job_id, None)
+            if self._runners.get(job_id) is runner:
+                del self._runners[job_id]
+            # Streams still following the job read its final status now
+            written = self._written.pop(job_id, None)
+            if written is not None:
+                written.set()
+    
+    def _group(self, job: Dict[str, Any], items: List[Dict[str, Any]]) -> Dict[Tuple[str, Optional[str]], List]:
+        """Items by (model, provider batch they were submitted in)"""
+        groups: Dict[Tuple[str, Optional[str]], List] = {}
+        for item in items:
+            model = item["model"] or job["model"] or self.ai_service.select_model_for(item["prompt"], job["task_type"])
+            groups.setdefault((model, item["provider_batch"]), []).append(item)
+        return groups
+    
+    async def _run_group(self, job_id: str, task_type: str, model: str,
+                         remote: Optional[str], items: List[Dict[str, Any]]):
+        entry = self.ai_service.registry.snapshot.entries.get(model)
+        if entry is None:
+            for item in items:
+                self._record(job_id, item, "failed", model, error=f"Unknown model: {model}")
+            return
+        provider = entry["provider"]
+        if remote is not None:
+            # Submitted before a restart: collect instead of paying twice
+            await self._collect_remote(job_id, task_type, model, remote, items)
+        elif (settings.BATCH_PROVIDER_API_ENABLED and provider in BATCH_API_PROVIDERS
+              and len(items) >= settings.BATCH_PROVIDER_MIN_ITEMS):
+            chunk = settings.BATCH_PROVIDER_CHUNK_ITEMS
+            await asyncio.gather(*(
+                self._run_remote(job_id, task_type, model, items[i:i + chunk])
+                for i in range(0, len(items), chunk)
+            ))
+        else:
+            await self._fan_out(job_id, task_type, model, items)
+    
+    async def _fan_out(self, job_id: str, task_type: str, model: str, items: List[Dict[str, Any]]):
+        # Shared by all jobs in this process, so concurrent jobs split the budget
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        try:
+            for item in items:
+                await self._semaphore.acquire()
+                task = asyncio.create_task(self._run_item(job_id, task_type, model, item))
+                tasks.add(task)
+                task.add_done_callback(lambda t: (tasks.discard(t), self._semaphore.release()))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _run_item(self, job_id: str, task_type: str, model: str, item: Dict[str, Any]):
+        messages = [{"role": "user", "content": item["prompt"]}]
+        admission = self.ai_service.admission
+        error = None
+        for _ in range(settings.BATCH_ITEM_ATTEMPTS):
+            try:
+                admitted = admission.admit(messages, model, task_type)
+            except BudgetExceeded as e:
+                error = str(e)
+                break
+            model = admitted.model
+            result = None
+            try:
+                result = await self.ai_service.generate_response(
+                    messages, model, priority=PRIORITY_BATCH, job_id=job_id, max_tokens=admitted.max_tokens
+                )
+            except Exception as e:
+                error = str(e)
+                model = self.ai_service.router.backup_for(task_type, model) or model
+            finally:
+                if result is None:
+                    admission.settle(admitted)
+                else:
+                    admission.settle(
+                        admitted, result["metrics"]["cost_usd"], result["metrics"]["output_tokens"],
+                        result["metrics"]["truncated"]
+                    )
+            if result is None:
+                continue
+            self._record(job_id, item, "succeeded", model, response=result["content"],
+                         tokens_used=result["metrics"]["tokens_used"],
+                         cost_usd=result["metrics"]["cost_usd"],
+                         latency_ms=result["metrics"]["latency_ms"])
+            return
+        self._record(job_id, item, "failed", model, error=error)
+    
+    async def _run_remote(self, job_id: str, task_type: str, model: str, items: List[Dict[str, Any]]):
+        entry = self.ai_service.registry.snapshot.entries[model]
+        provider = entry["provider"]
+        requests = [(f"item-{item['id']}", item["prompt"]) for item in items]
+        admission = self.ai_service.admission
+        try:
+            # Reserved as a whole; items that do not fit together are
+            # admitted one at a time, possibly on a cheaper model
+            admitted = admission.admit_bulk(
+                [item["prompt"] for item in items], model, task_type, settings.BATCH_PROVIDER_PRICE_FACTOR
+            )
+        except BudgetExceeded as e:
+            logger.info("Not submitting %d items to the %s batch API: %s", len(items), provider, e)
+            await self._fan_out(job_id, task_type, model, items)
+            return
+        remote = None
+        try:
+            if provider == "openai":
+                remote = f"openai:{await self._submit_openai(entry['model_id'], requests, admitted.max_tokens)}"
+            else:
+                remote = f"anthropic:{await self._submit_anthropic(entry['model_id'], requests, admitted.max_tokens)}"
+            await self._call(self._mark_submitted, [item["id"] for item in items], model, remote)
+            await self._collect_remote(job_id, task_type, model, remote, items)
+        except Exception as e:
+            if remote is not None:
+                raise
+            logger.warning("Error submitting %d items to the %s batch API, fanning out instead: %s",
+                           len(items), provider, e)
+        finally:
+            # Spend is counted per item as results are collected
+            admission.settle(admitted)
+        if remote is None:
+            # Only once the batch's reservation is released, so the items
+            # are admitted against the whole remaining budget
+            await self._fan_out(job_id, task_type, model, items)
+    
+    async def _collect_remote(self, job_id: str, task_type: str, model: str, remote: str,
+                              items: List[Dict[str, Any]]):
+        provider, batch_id = remote.split(":", 1)
+        if provider == "openai":
+            outcomes = await self._collect_openai(batch_id)
+        else:
+            outcomes = await self._collect_anthropic(batch_id)
+        
+        for item in items:
+            outcome = outcomes.get(f"item-{item['id']}")
+            if outcome is None:
+                self._record(job_id, item, "failed", model, error=f"No result in provider batch {batch_id}")
+                continue
+            content, input_tokens, output_tokens, truncated, error = outcome
+            if error is not None:
+                self._record(job_id, item, "failed", model, error=error)
+                log_api_call(provider, {
+                    "success": False, "model": model, "prompt": item["prompt"],
+                    "error": error, "job_id": job_id
+                })
+                continue
+            tokens = input_tokens + output_tokens
+            cost = (
+                self.ai_service.registry.snapshot.cost(model, input_tokens, output_tokens)
+                * settings.BATCH_PROVIDER_PRICE_FACTOR
+            )
+            self._record(job_id, item, "succeeded", model, response=content, tokens_used=tokens, cost_usd=cost)
+            self.ai_service.admission.record_spend(cost)
+            self.ai_service.admission.record_output(task_type, output_tokens, truncated)
+            metrics.TOKENS.labels(provider, model).inc(tokens)
+            metrics.COST.labels(provider, model).inc(cost)
+            log_api_call(provider, {
+                "success": True, "model": model, "prompt": item["prompt"], "response": content,
+                "metrics": {"latency": 0, "tokens": tokens, "cost_usd": cost},
+                "job_id": job_id
+            })
+    
+    async def _submit_openai(self, model_id: str, requests: List[Tuple[str, str]],
+                             max_tokens: Optional[int] = None) -> str:
+        client = self.ai_service.openai_client
+        lines = "\n".join(
+            json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model_id,
+                    "messages": [{"role": "user", "content": prompt}],
+                    **({"max_tokens": max_tokens} if max_tokens else {})
+                }
+            })
+            for custom_id, prompt in requests
+        )
+        upload = await client.files.create(file=("batch.jsonl", lines.encode()), purpose="batch")
+        batch = await client.batches.create(
+            input_file_id=upload.id, endpoint="/v1/chat/completions", completion_window="24h"
+        )
+        return batch.id
+    
+    async def _collect_openai(self, batch_id: str) -> Dict[str, tuple]:
+        """``custom_id -> (content, input_tokens, output_tokens, truncated, error)``
+        once the batch has ended"""
+        client = self.ai_service.openai_client
+        batch = await client.batches.retrieve(batch_id)
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(settings.BATCH_POLL_INTERVAL_S)
+            batch = await client.batches.retrieve(batch_id)
+        
+        outcomes = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await client.files.content(file_id)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                response = row.get("response") or {}
+                if row.get("error") or response.get("status_code") != 200:
+                    error = row.get("error") or response.get("body", {}).get("error")
+                    outcomes[row["custom_id"]] = (None, 0, 0, False, json.dumps(error))
+                    continue
+                body = response["body"]
+                outcomes[row["custom_id"]] = (
+                    body["choices"][0]["message"]["content"],
+                    body["usage"]["prompt_tokens"],
+                    body["usage"]["completion_tokens"],
+                    body["choices"][0].get("finish_reason") == "length",
+                    None
+                )
+        return outcomes
+    
+    async def _submit_anthropic(self, model_id: str, requests: List[Tuple[str, str]],
+                                max_tokens: Optional[int] = None) -> str:
+        batch = await self.ai_service.anthropic_client.messages.batches.create(requests=[
+            {
+                "custom_id": custom_id,
+                "params": {
+                    "model": model_id,
+                    "max_tokens": max_tokens or settings.DEFAULT_MAX_OUTPUT_TOKENS,
+                    "messages": [{"role": "user", "content": prompt}]
+                }
+            }
+            for custom_id, prompt in requests
+        ])
+        return batch.id
+    
+    async def _collect_anthropic(self, batch_id: str) -> Dict[str, tuple]:
+        batches = self.ai_service.anthropic_client.messages.batches
+        batch = await batches.retrieve(batch_id)
+        while batch.processing_status != "ended":
+            await asyncio.sleep(settings.BATCH_POLL_INTERVAL_S)
+            batch = await batches.retrieve(batch_id)
+        
+        outcomes = {}
+        async for entry in await batches.results(batch_id):
+            result = entry.result
+            if result.type == "succeeded":
+                message = result.message
+                outcomes[entry.custom_id] = (
+                    message.content[0].text,
+                    message.usage.input_tokens,
+                    message.usage.output_tokens,
+                    message.stop_reason == "max_tokens",
+                    None
+                )
+            else:
+                error = str(result.error) if result.type == "errored" else result.type
+                outcomes[entry.custom_id] = (None, 0, 0, False, error)
+        return outcomes
+    
+    async def _cancel_remote(self, remote: str):
+        provider, batch_id = remote.split(":", 1)
+        if provider == "openai":
+            await self.ai_service.openai_client.batches.cancel(batch_id)
+        elif provider == "anthropic":
+            await self.ai_service.anthropic_client.messages.batches.cancel(batch_id)
+    
+    def _record(self, job_id: str, item: Dict[str, Any], status: str, model: str, **values):
+        """Queue an item's result for the next write"""
+        row = dict.fromkeys(RESULT_FIELDS)
+        row.update(values, id=item["id"], status=status, model=model)
+        self._pending.setdefault(job_id, []).append(row)
+    
+    async def _write_forever(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.write_interval)
+            try:
+                await self._flush(job_id)
+            except Exception as e:
+                logger.warning("Error writing results of batch job %s: %s", job_id, e)
+    
+    async def _flush(self, job_id: str):
+        rows = self._pending.pop(job_id, None)
+        if not rows:
+            return
+        now = datetime.utcnow()
+        entries = self.ai_service.registry.snapshot.entries
+        usage = []
+        for row in rows:
+            self._seq[job_id] += 1
+            row["seq"] = self._seq[job_id]
+            if row["status"] == "succeeded" and row["model"] in entries:
+                usage.append(usage_entry(now, entries[row["model"]]["provider"], row["model"], row))
+        try:
+            await self._call(self._write_results, job_id, rows, usage)
+        except BaseException:
+            # Retried with the next write; sequence numbers may skip
+            self._pending.setdefault(job_id, [])[:0] = rows
+            raise
+        written = self._written.pop(job_id, None)
+        if written is not None:
+            written.set()
+    
+    async def _renew_lease(self, job_id: str, runner: asyncio.Task):
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            try:
+                held = await self._call(self._extend_lease, job_id)
+            except Exception as e:
+                logger.warning("Error renewing lease of batch job %s: %s", job_id, e)
+                continue
+            if not held:
+                # Cancelled, or taken over after we failed to renew in time
+                runner.cancel()
+                return
+    
+    async def _call(self, fn, *args):
+        """Run ``fn(session, *args)`` in one transaction on the writer thread"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._transaction, fn, args)
+    
+    def _transaction(self, fn, args):
+        start = time.perf_counter()
+        session = self.session_factory()
+        try:
+            result = fn(session, *args)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+            metrics.DB_WRITE.labels("batches").observe(time.perf_counter() - start)
+    
+    def _lease_held(self):
+        return (BatchJob.lease_owner == self.owner) & (BatchJob.status == "running")
+    
+    def _insert_job(self, session, job_id, prompts, task_type, model):
+        session.execute(insert(BatchJob).values(
+            id=job_id, created_at=datetime.utcnow(), status="pending", task_type=task_type,
+            model=model, total=len(prompts), completed=0, failed=0, tokens_used=0, cost_usd=0.0
+        ))
+        session.execute(insert(BatchItem), [
+            {"job_id": job_id, "position": position, "custom_id": custom_id,
+             "prompt": prompt, "status": "pending"}
+            for position, (prompt, custom_id) in enumerate(prompts)
+        ])
+    
+    def _claim(self, session, job_id) -> bool:
+        now = datetime.utcnow()
+        claimed = session.execute(
+            update(BatchJob)
+            .where(
+                BatchJob.id == job_id,
+                BatchJob.status.in_(ACTIVE_STATUSES),
+                or_(BatchJob.lease_owner.is_(None), BatchJob.lease_owner == self.owner,
+                    BatchJob.lease_expires_at < now)
+            )
+            .values(status="running", lease_owner=self.owner,
+                    lease_expires_at=now + timedelta(seconds=self.lease_s),
+                    started_at=func.coalesce(BatchJob.started_at, now))
+        ).rowcount
+        return claimed == 1
+    
+    def _extend_lease(self, session, job_id) -> bool:
+        return session.execute(
+            update(BatchJob)
+            .where(BatchJob.id == job_id, self._lease_held())
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=self.lease_s))
+        ).rowcount == 1
+    
+    def _release(self, session, job_id):
+        session.execute(
+            update(BatchJob)
+            .where(BatchJob.id == job_id, BatchJob.lease_owner == self.owner)
+            .values(lease_owner=None, lease_expires_at=None)
+        )
+    
+    def _finish(self, session, job_id):
+        session.execute(
+            update(BatchJob)
+            .where(BatchJob.id == job_id, self._lease_held())
+            .values(status="completed", finished_at=datetime.utcnow(), lease_owner=None, lease_expires_at=None)
+        )
+    
+    def _mark_submitted(self, session, item_ids, model, remote):
+        session.execute(
+            update(BatchItem)
+            .where(BatchItem.id.in_(item_ids))
+            .values(status="submitted", model=model, provider_batch=remote)
+        )
+    
+    def _write_results(self, session, job_id, rows, usage):
+        failed = sum(row["status"] == "failed" for row in rows)
+        # Results of a worker that lost its lease are dropped; the new
+        # holder redoes those items. A cancelled job keeps its lease until
+        # the runner has written what it finished.
+        counted = session.execute(
+            update(BatchJob)
+            .where(BatchJob.id == job_id, BatchJob.lease_owner == self.owner)
+            .values(
+                completed=BatchJob.completed + len(rows),
+                failed=BatchJob.failed + failed,
+                tokens_used=BatchJob.tokens_used + sum(row["tokens_used"] or 0 for row in rows),
+                cost_usd=BatchJob.cost_usd + sum(row["cost_usd"] or 0 for row in rows)
+            )
+        ).rowcount
+        if counted:
+            session.execute(update(BatchItem), rows)
+            record_usage(session, usage)
+    
+    def _mark_cancelled(self, session, job_id):
+        session.execute(
+            update(BatchJob)
+            .where(BatchJob.id == job_id, BatchJob.status.in_(ACTIVE_STATUSES))
+            .values(status="cancelled", finished_at=datetime.utcnow())
+        )
+        remote = session.execute(
+            select(BatchItem.provider_batch).distinct()
+            .where(BatchItem.job_id == job_id, BatchItem.status == "submitted")
+        ).scalars().all()
+        return self._job_row(session, job_id), remote
+    
+    def _reopen(self, session, job_id):
+        job = session.get(BatchJob, job_id)
+        if job is None or job.status in ACTIVE_STATUSES:
+            return self._job_row(session, job_id)
+        retried = session.execute(
+            update(BatchItem)
+            .where(BatchItem.job_id == job_id, BatchItem.status == "failed")
+            .values(status="pending", error=None, model=None, seq=None)
+        ).rowcount
+        job.status = "pending"
+        job.finished_at = None
+        job.completed -= retried
+        job.failed -= retried
+        session.flush()
+        return self._job_row(session, job_id)
+    
+    def _orphaned_jobs(self) -> List[str]:
+        session = self.session_factory()
+        try:
+            return session.execute(
+                select(BatchJob.id).where(
+                    BatchJob.status.in_(ACTIVE_STATUSES),
+                    or_(BatchJob.lease_owner.is_(None), BatchJob.lease_expires_at < datetime.utcnow())
+                )
+            ).scalars().all()
+        finally:
+            session.close()
+    
+    def _read_work(self, job_id):
+        session = self.session_factory()
+        try:
+            items = session.execute(
+                select(BatchItem.id, BatchItem.prompt, BatchItem.model, BatchItem.provider_batch)
+                .where(BatchItem.job_id == job_id, BatchItem.status.in_(("pending", "submitted")))
+                .order_by(BatchItem.position)
+            ).mappings().all()
+            last_seq = session.execute(
+                select(func.max(BatchItem.seq)).where(BatchItem.job_id == job_id)
+            ).scalar() or 0
+            return self._job_row(session, job_id), [dict(item) for item in items], last_seq
+        finally:
+            session.close()
+    
+    def _read_job(self, job_id):
+        session = self.session_factory()
+        try:
+            return self._job_row(session, job_id)
+        finally:
+            session.close()
+    
+    def _read_results(self, job_id, after_seq, limit):
+        session = self.session_factory()
+        try:
+            rows = session.execute(
+                select(
+                    BatchItem.seq, BatchItem.position, BatchItem.custom_id, BatchItem.status,
+                    BatchItem.model, BatchItem.response, BatchItem.error, BatchItem.tokens_used,
+                    BatchItem.cost_usd, BatchItem.latency_ms
+                )
+                .where(BatchItem.job_id == job_id, BatchItem.seq > after_seq)
+                .order_by(BatchItem.seq)
+                .limit(limit)
+            ).mappings().all()
+            return self._job_row(session, job_id), [dict(row) for row in rows]
+        finally:
+            session.close()
+    
+    @staticmethod
+    def _job_row(session, job_id) -> Optional[Dict[str, Any]]:
+        job = session.get(BatchJob, job_id, populate_existing=True)
+        if job is None:
+            return None
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "task_type": job.task_type,
+            "model": job.model,
+            "total": job.total,
+            "completed": job.completed,
+            "failed": job.failed,
+            "tokens_used": job.tokens_used,
+            "cost_usd": job.cost_usd,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None
+        }
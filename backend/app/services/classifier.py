@@ -0,0 +1,225 @@
+import json
+import math
+import os
+import random
+import re
+import time
+import zlib
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from ..core.config import get_settings
+from .router import percentile
+
+settings = get_settings()
+
+LABELS = ("general", "math", "programming", "translation", "creative", "analytics")
+WEIGHTS_PATH = os.path.join(os.path.dirname(__file__), "task_classifier.json")
+
+# Words, numbers and single symbols; symbols such as "=", "{" or "`" are
+# strong hints for math and code
+TOKEN_PATTERN = re.compile(r"[a-z]+|\d+|[^\sa-z\d]")
+
+# Cheap signals the hashed words miss, added as pseudo-tokens: layout and
+# notation patterns, and keyword lists that generalise beyond the training
+# examples (e.g. to languages or frameworks never seen in training)
+SIGNALS = (
+    ("<code_fence>", re.compile(r"```|^\s{4}\S", re.MULTILINE)),
+    ("<call>", re.compile(r"\w\(.*?\)|\w\.\w+\(")),
+    ("<equation>", re.compile(r"\d\s*[-+*/^=<>]\s*[\d(a-z]|[a-z]\s*\^\s*\d|\d[a-z]\b")),
+    ("<non_ascii>", re.compile(r"[^\x00-\x7f]{3,}")),
+    ("<quoted>", re.compile(r"[\"“«'].{3,}[\"”»']")),
+)
+KEYWORDS = {
+    "<language>": (
+        "english spanish french german italian portuguese dutch russian chinese mandarin cantonese "
+        "japanese korean arabic hindi hebrew greek turkish polish swedish norwegian danish finnish thai "
+        "vietnamese indonesian latin irish ukrainian czech persian urdu bengali swahili"
+    ),
+    "<code_word>": (
+        "python java javascript typescript sql rust go golang kotlin swift ruby php bash html css react "
+        "node django flask docker git api function class method variable compile runtime exception error "
+        "bug debug regex json yaml npm pip"
+    ),
+    "<stat_word>": (
+        "average mean median sum total count percentage rate trend distribution correlation group "
+        "grouped column columns rows dataset data csv spreadsheet table per by"
+    ),
+    "<math_word>": (
+        "solve equation derivative integral integrate probability prove matrix limit factor polynomial "
+        "fraction root roots calculate compute formula angle area volume"
+    ),
+    "<write_word>": (
+        "write poem story haiku lyrics song limerick sonnet novel character fairy fable verse rhyme scene "
+        "monologue slogan creative"
+    ),
+}
+# Keywords are matched per token, which is far cheaper than a regex per list
+KEYWORD_SIGNALS = {word: name for name, words in KEYWORDS.items() for word in words.split()}
+
+@lru_cache(maxsize=65536)
+def _hash(token: str) -> int:
+    # Stable across processes, unlike hash()
+    return zlib.crc32(token.encode())
+
+def features(text: str, buckets: int, max_chars: int = settings.TASK_CLASSIFIER_MAX_CHARS) -> List[int]:
+    """Hashed buckets of the words of ``text``, their 4-letter prefixes
+    (a cheap stemmer) and word bigrams.
+    
+    Only the last ``max_chars`` characters are read: attachment context is
+    prepended to the question, and it bounds the cost of long queries.
+    """
+    text = text[-max_chars:].lower()
+    tokens = TOKEN_PATTERN.findall(text)
+    signals = {KEYWORD_SIGNALS[token] for token in tokens if token in KEYWORD_SIGNALS}
+    signals.update(name for name, pattern in SIGNALS if pattern.search(text))
+    tokens.extend(sorted(signals))
+    found = set()
+    previous = 0
+    for token in tokens:
+        current = _hash(token)
+        found.add(current % buckets)
+        if len(token) > 4:
+            found.add(_hash(token[:4] + "~") % buckets)
+        # Bigrams combine the two word hashes instead of hashing a new string
+        found.add((previous * 1000003 ^ current) % buckets)
+        previous = current
+    return list(found)
+
+class TaskClassifier:
+    """Multinomial logistic regression over hashed n-grams.
+    
+    Weights are kept sparse, one score vector per hash bucket seen in
+    training, so classifying a query costs one dictionary lookup per feature
+    and stays well under a millisecond.
+    """
+    
+    def __init__(self, labels: Sequence[str], buckets: int,
+                 bias: List[float], weights: Dict[int, List[float]]):
+        self.labels = tuple(labels)
+        self.buckets = buckets
+        self.bias = bias
+        self.weights = weights
+    
+    @classmethod
+    def load(cls, path: str = WEIGHTS_PATH) -> "TaskClassifier":
+        with open(path) as f:
+            data = json.load(f)
+        weights = {int(bucket): scores for bucket, scores in data["weights"].items()}
+        return cls(data["labels"], data["buckets"], data["bias"], weights)
+    
+    def save(self, path: str = WEIGHTS_PATH, precision: int = 4):
+        weights = {
+            str(bucket): [round(w, precision) for w in scores]
+            for bucket, scores in sorted(self.weights.items())
+            if max(abs(w) for w in scores) >= 10 ** -precision
+        }
+        with open(path, "w") as f:
+            json.dump({
+                "labels": self.labels,
+                "buckets": self.buckets,
+                "bias": [round(b, precision) for b in self.bias],
+                "weights": weights
+            }, f, separators=(",", ":"))
+    
+    def probabilities(self, text: str) -> List[float]:
+        get = self.weights.get
+        rows = [row for row in map(get, features(text, self.buckets)) if row is not None]
+        # Column sums run in C rather than a Python loop per label
+        scores = [sum(column) for column in zip(self.bias, *rows)]
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+    
+    def classify(self, text: str) -> Tuple[str, float]:
+        """Most likely task category and its probability"""
+        probabilities = self.probabilities(text)
+        best = max(range(len(probabilities)), key=probabilities.__getitem__)
+        return self.labels[best], probabilities[best]
+
+def load_classifier(path: str = WEIGHTS_PATH) -> Optional[TaskClassifier]:
+    """The shipped classifier, or None when routing should use the
+    client's task type as is"""
+    if not settings.TASK_CLASSIFIER_ENABLED:
+        return None
+    try:
+        return TaskClassifier.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Task classifier unavailable, routing on client task types: {str(e)}")
+        return None
+
+def train(examples: Sequence[Tuple[str, str]], labels: Sequence[str] = LABELS,
+          buckets: int = 2 ** 18, epochs: int = 30, learning_rate: float = 0.5,
+          l2: float = 1e-4, seed: int = 0) -> TaskClassifier:
+    """Fit the classifier to ``(text, label)`` pairs with plain SGD"""
+    index = {label: i for i, label in enumerate(labels)}
+    n = len(labels)
+    encoded = [(features(text, buckets), index[label]) for text, label in examples]
+    bias = [0.0] * n
+    weights: Dict[int, List[float]] = {}
+    model = TaskClassifier(labels, buckets, bias, weights)
+    rng = random.Random(seed)
+    for epoch in range(epochs):
+        rng.shuffle(encoded)
+        rate = learning_rate / (1 + epoch * 0.1)
+        for found, target in encoded:
+            scores = list(bias)
+            rows = [weights.setdefault(bucket, [0.0] * n) for bucket in found]
+            for row in rows:
+                for i in range(n):
+                    scores[i] += row[i]
+            top = max(scores)
+            exps = [math.exp(s - top) for s in scores]
+            total = sum(exps)
+            gradient = [e / total - (1.0 if i == target else 0.0) for i, e in enumerate(exps)]
+            for i in range(n):
+                bias[i] -= rate * gradient[i]
+            for row in rows:
+                for i in range(n):
+                    row[i] -= rate * (gradient[i] + l2 * row[i])
+    return model
+
+def evaluate(model: TaskClassifier, examples: Iterable[Tuple[str, str]],
+             min_confidence: float = settings.TASK_CLASSIFIER_MIN_CONFIDENCE) -> Dict:
+    """Accuracy, per-label precision and recall, the confusion matrix and
+    classification latency percentiles.
+    
+    ``routed`` covers what routing acts on: the share of queries given a
+    specific task with at least ``min_confidence``, and how often that task
+    was right.
+    """
+    confusion = {label: {other: 0 for other in model.labels} for label in model.labels}
+    latencies = []
+    routed = routed_correct = 0
+    for text, label in examples:
+        start = time.perf_counter()
+        predicted, confidence = model.classify(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+        confusion[label][predicted] += 1
+        if predicted != "general" and confidence >= min_confidence:
+            routed += 1
+            routed_correct += predicted == label
+    
+    total = sum(sum(row.values()) for row in confusion.values())
+    correct = sum(confusion[label][label] for label in model.labels)
+    per_label = {}
+    for label in model.labels:
+        predicted = sum(confusion[other][label] for other in model.labels)
+        actual = sum(confusion[label].values())
+        per_label[label] = {
+            "precision": confusion[label][label] / predicted if predicted else 0.0,
+            "recall": confusion[label][label] / actual if actual else 0.0,
+            "support": actual
+        }
+    latencies.sort()
+    return {
+        "examples": total,
+        "accuracy": correct / total if total else 0.0,
+        "labels": per_label,
+        "routed": {
+            "coverage": routed / total if total else 0.0,
+            "precision": routed_correct / routed if routed else 0.0
+        },
+        "confusion": confusion,
+        "latency_ms": {"p50": percentile(latencies, 50), "p99": percentile(latencies, 99)}
+    }
@@ -0,0 +1,37 @@
+from typing import Optional
+from ..core.shared_state import shared_state_from_settings
+from .ai_service import AIService
+from .persistence import PersistenceService
+from .batch import BatchService
+from .context import ContextBuilder
+from .file_ingest import FileIngestService
+from .generations import GenerationTracker
+
+class Services:
+    """The services shared by every route and socket handler of a worker.
+    
+    Built by ``create_app``, so importing the app constructs nothing; the
+    lifespan then starts them.
+    """
+    
+    def __init__(self):
+        self.shared_state = shared_state_from_settings()
+        self.ai_service = AIService()
+        self.persistence = PersistenceService()
+        self.context_builder = ContextBuilder(self.persistence, self.shared_state)
+        self.file_ingest = FileIngestService()
+        self.generations = GenerationTracker()
+        self.batches = BatchService(self.ai_service)
+
+_services: Optional[Services] = None
+
+def build_services() -> Services:
+    global _services
+    _services = Services()
+    return _services
+
+def get_services() -> Services:
+    """The services of the running app; also usable as a FastAPI dependency"""
+    if _services is None:
+        raise RuntimeError("Services are built by create_app()")
+    return _services
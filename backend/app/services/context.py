@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from ..core.config import get_settings
+from ..core.shared_state import LocalState
+from ..models.models import Message
+from .persistence import WriteFailed
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token plus message overhead)"""
+    return len(text) // 4 + 4
+
+def build_messages(history: List[Dict[str, str]], query: str, budget_tokens: int) -> List[Dict[str, str]]:
+    """Append the query to the most recent history that fits ``budget_tokens``.
+    
+    Consecutive turns with the same role are merged and a leading assistant
+    turn is dropped, since providers expect alternating roles starting with
+    the user.
+    """
+    picked = []
+    used = 0
+    for message in reversed(history):
+        used += estimate_tokens(message["content"])
+        if used > budget_tokens:
+            break
+        picked.append(message)
+    picked.reverse()
+    while picked and picked[0]["role"] != "user":
+        picked.pop(0)
+    
+    messages: List[Dict[str, str]] = []
+    for message in picked + [{"role": "user", "content": query}]:
+        if messages and messages[-1]["role"] == message["role"]:
+            messages[-1] = {"role": message["role"], "content": messages[-1]["content"] + "\n\n" + message["content"]}
+        else:
+            messages.append({"role": message["role"], "content": message["content"]})
+    return messages
+
+class ChatWindow:
+    """The most recent turns of one chat, bounded by message count and tokens"""
+    
+    def __init__(self, max_messages: int, max_tokens: int):
+        self.max_tokens = max_tokens
+        self.turns: "deque[Tuple[str, str, int]]" = deque(maxlen=max_messages)
+        self.tokens = 0
+        # Messages appended to the chat, as counted in shared state, and
+        # when that count was last read
+        self.version = 0
+        self.synced_at = time.monotonic()
+    
+    def append(self, role: str, content: str):
+        if len(self.turns) == self.turns.maxlen:
+            self.tokens -= self.turns[0][2]
+        tokens = estimate_tokens(content)
+        self.turns.append((role, content, tokens))
+        self.tokens += tokens
+        while self.tokens > self.max_tokens and len(self.turns) > 1:
+            self.tokens -= self.turns.popleft()[2]
+    
+    def messages(self) -> List[Dict[str, str]]:
+        return [{"role": role, "content": content} for role, content, _ in self.turns]
+
+class ContextBuilder:
+    """Serves recent chat history from a per-chat in-memory window.
+    
+    Windows are kept current by listening to the persistence service, so a
+    turn only touches the database when a chat is not cached; the cold load
+    reads a bounded slice through the (chat_id, created_at) index.
+    
+    Every worker counts the messages it adds to a chat in ``state``; a
+    window whose count is behind was extended by another worker and is
+    reloaded. Counts expire after ``version_ttl`` seconds unused, so a
+    window not checked for as long is reloaded too.
+    """
+    
+    def __init__(self, persistence, state=None,
+                 max_chats: int = settings.CONTEXT_CACHE_CHATS,
+                 max_messages: int = settings.CONTEXT_WINDOW_MESSAGES,
+                 max_tokens: int = settings.CONTEXT_WINDOW_TOKENS,
+                 version_ttl: int = settings.CONTEXT_VERSION_TTL_S):
+        self.persistence = persistence
+        self.state = state or LocalState()
+        self._pending_versions = set()
+        self.max_chats = max_chats
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.version_ttl = version_ttl
+        self._windows: "OrderedDict[int, ChatWindow]" = OrderedDict()
+        persistence.add_listener(self)
+    
+    async def history(self, chat_id: Optional[int]) -> List[Dict[str, str]]:
+        """Recent turns of a chat, oldest first"""
+        if chat_id is None:
+            return []
+        version = await self.state.get_int(f"chat:{chat_id}:version", ttl=self.version_ttl)
+        now = time.monotonic()
+        window = self._windows.get(chat_id)
+        if window is None or window.version != version or now - window.synced_at >= self.version_ttl:
+            # Make sure turns still queued for this chat are on disk first
+            try:
+                await self.persistence.flush()
+            except WriteFailed as e:
+                # Logged by the writer; build the history from what was stored
+                logger.warning("Loading chat %d after failed writes: %s", chat_id, e)
+            rows = await asyncio.to_thread(self._load, chat_id)
+            window = self._new_window(chat_id)
+            window.version = version
+            for role, content in reversed(rows):
+                window.append(role, content or "")
+        window.synced_at = now
+        self._windows.move_to_end(chat_id)
+        return window.messages()
+    
+    def on_chat_created(self, chat_id: int):
+        self._new_window(chat_id)
+    
+    def on_message(self, chat_id: int, role: str, content: str):
+        window = self._windows.get(chat_id)
+        if window is not None:
+            window.append(role, content or "")
+            window.version += 1
+        task = asyncio.get_running_loop().create_task(
+            self.state.incr(f"chat:{chat_id}:version", ttl=self.version_ttl)
+        )
+        self._pending_versions.add(task)
+        task.add_done_callback(self._pending_versions.discard)
+    
+    def _new_window(self, chat_id: int) -> ChatWindow:
+        window = ChatWindow(self.max_messages, self.max_tokens)
+        self._windows[chat_id] = window
+        while len(self._windows) > self.max_chats:
+            self._windows.popitem(last=False)
+        return window
+    
+    def _load(self, chat_id: int) -> List[Tuple[str, str]]:
+        session = self.persistence.session_factory()
+        try:
+            return session.execute(
+                select(Message.role, Message.content)
+                .where(Message.chat_id == chat_id)
+                .order_by(Message.created_at.desc(), Message.id.desc())
+                .limit(self.max_messages)
+            ).all()
+        finally:
+            session.close()
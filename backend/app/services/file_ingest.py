@@ -0,0 +1,321 @@
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterable, Dict, List, Optional
+from ..core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+KINDS = {
+    ".pdf": "pdf",
+    ".csv": "csv",
+    ".png": "image",
+    ".jpg": "image",
+    ".jpeg": "image"
+}
+
+# Uploaded chunks are coalesced into writes of this size
+WRITE_BUFFER_BYTES = 1024 * 1024
+
+FILE_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+class UploadError(ValueError):
+    """Raised for uploads that are rejected before extraction"""
+
+class UploadTooLarge(UploadError):
+    """Raised once an upload grows past ``max_bytes``"""
+
+def kind_for(filename: str) -> Optional[str]:
+    return KINDS.get(os.path.splitext(filename)[1].lower())
+
+def _truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "\n[truncated]"
+
+# Extractors run in worker processes, so they are module-level functions that
+# take plain arguments and return JSON-serialisable dicts.
+
+def extract_pdf(path: str, max_chars: int, max_pages: int) -> Dict:
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    parts = []
+    used = 0
+    pages_read = 0
+    for page in reader.pages[:max_pages]:
+        text = page.extract_text() or ""
+        parts.append(text)
+        used += len(text)
+        pages_read += 1
+        if used >= max_chars:
+            break
+    return {
+        "text": _truncate("\n".join(parts).strip(), max_chars),
+        "meta": {"pages": len(reader.pages), "pages_read": pages_read}
+    }
+
+def extract_csv(path: str, arrow_path: str, max_chars: int, sample_rows: int) -> Dict:
+    """Convert to a memory-mappable Arrow file and profile every column"""
+    from . import analytics
+
+    rows = analytics.csv_to_arrow(path, arrow_path)
+    table = analytics.open_table(arrow_path)
+    columns = analytics.profile(table)
+    return {
+        "text": _truncate(analytics.describe(rows, columns, table.slice(0, sample_rows)), max_chars),
+        "meta": {"rows": rows, "columns": columns, "arrow": os.path.basename(arrow_path)}
+    }
+
+def analyze_csv(arrow_path: str, question: str, meta: Dict, max_chars: int) -> str:
+    from . import analytics
+
+    return analytics.answer(arrow_path, question, meta["columns"], meta["rows"], max_chars)
+
+def extract_image(path: str, max_side: int, preview_path: str) -> Dict:
+    """Record image metadata and keep a downscaled JPEG preview next to the upload"""
+    from PIL import Image
+
+    with Image.open(path) as image:
+        width, height = image.size
+        image_format, mode = image.format, image.mode
+        image.thumbnail((max_side, max_side))
+        image.convert("RGB").save(preview_path, "JPEG", quality=85)
+        preview_size = image.size
+    return {
+        "text": f"{image_format} image, {width}x{height} pixels, mode {mode}",
+        "meta": {
+            "width": width,
+            "height": height,
+            "format": image_format,
+            "preview": os.path.basename(preview_path),
+            "preview_size": list(preview_size)
+        }
+    }
+
+def _extract(path: str, kind: str, upload_dir: str, file_id: str) -> Dict:
+    if kind == "pdf":
+        return extract_pdf(path, settings.EXTRACT_MAX_CHARS, settings.PDF_MAX_PAGES)
+    if kind == "csv":
+        arrow_path = os.path.join(upload_dir, f"{file_id}.arrow")
+        return extract_csv(path, arrow_path, settings.EXTRACT_MAX_CHARS, settings.CSV_SAMPLE_ROWS)
+    preview_path = os.path.join(upload_dir, f"{file_id}.preview.jpg")
+    return extract_image(path, settings.IMAGE_MAX_SIDE, preview_path)
+
+class FileIngestService:
+    """Content-addressed attachment store.
+
+    Uploads are streamed to disk while being hashed, so the file id is the
+    SHA-256 of the content and identical uploads share one file and one
+    extraction. Extraction runs in a process pool and its result is cached in
+    memory and as ``<file_id>.extract.json`` next to the upload.
+    """
+
+    def __init__(self, upload_dir: str = settings.UPLOAD_DIR,
+                 max_bytes: int = settings.UPLOAD_MAX_BYTES,
+                 workers: int = settings.EXTRACTION_WORKERS,
+                 cache_entries: int = settings.EXTRACTION_CACHE_ENTRIES):
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.cache_entries = cache_entries
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._results: "OrderedDict[str, Dict]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn keeps the workers free of the server's threads and sockets
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _path(self, file_id: str) -> Optional[str]:
+        if not FILE_ID_PATTERN.match(file_id):
+            return None
+        for ext in KINDS:
+            path = os.path.join(self.upload_dir, file_id + ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    async def save(self, filename: str, chunks: AsyncIterable[bytes]) -> Dict:
+        """Stream ``chunks`` to disk and return the upload's descriptor"""
+        kind = kind_for(filename)
+        if kind is None:
+            raise UploadError(f"Unsupported file type: {filename}")
+        os.makedirs(self.upload_dir, exist_ok=True)
+
+        tmp_path = os.path.join(self.upload_dir, f".{uuid.uuid4().hex}.part")
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        digest = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise UploadTooLarge(f"File exceeds {self.max_bytes} bytes")
+                digest.update(chunk)
+                buffer += chunk
+                if len(buffer) >= WRITE_BUFFER_BYTES:
+                    await asyncio.to_thread(f.write, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await asyncio.to_thread(f.write, bytes(buffer))
+            await asyncio.to_thread(f.close)
+        except BaseException:
+            f.close()
+            os.remove(tmp_path)
+            raise
+
+        file_id = digest.hexdigest()
+        ext = os.path.splitext(filename)[1].lower()
+        path = self._path(file_id)
+        if path is None:
+            os.replace(tmp_path, os.path.join(self.upload_dir, file_id + ext))
+        else:
+            # Already uploaded; keep the existing copy and its extraction
+            os.remove(tmp_path)
+        return {"file_id": file_id, "filename": filename, "kind": kind, "size": size}
+
+    def start_extraction(self, file_id: str):
+        """Begin extracting in the background; the result is awaited by ``extract``.
+        A failed extraction is retried, so uploading the file again retries it."""
+        if self._results.get(file_id, {}).get("status") == "failed":
+            del self._results[file_id]
+        if file_id not in self._results and file_id not in self._pending:
+            task = asyncio.create_task(self._extract(file_id))
+            self._pending[file_id] = task
+            task.add_done_callback(lambda _: self._pending.pop(file_id, None))
+
+    def status(self, file_id: str) -> Optional[Dict]:
+        if file_id in self._results:
+            return self._results[file_id]
+        if file_id in self._pending:
+            return {"status": "processing"}
+        if self._path(file_id) is None:
+            return None
+        cached = self._load_cached(file_id)
+        if cached is not None:
+            return cached
+        return {"status": "pending"}
+
+    async def extract(self, file_id: str) -> Dict:
+        if file_id in self._results:
+            self._results.move_to_end(file_id)
+            return self._results[file_id]
+        self.start_extraction(file_id)
+        # Shielded so one cancelled waiter does not abort a shared extraction
+        return await asyncio.shield(self._pending[file_id])
+
+    def _load_cached(self, file_id: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.upload_dir, f"{file_id}.extract.json")) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember(file_id, result)
+        return result
+
+    def _remember(self, file_id: str, result: Dict):
+        self._results[file_id] = result
+        self._results.move_to_end(file_id)
+        while len(self._results) > self.cache_entries:
+            self._results.popitem(last=False)
+
+    async def _extract(self, file_id: str) -> Dict:
+        path = self._path(file_id)
+        if path is None:
+            raise UploadError(f"Unknown file: {file_id}")
+        cached = await asyncio.to_thread(self._load_cached, file_id)
+        if cached is not None:
+            return cached
+
+        kind = kind_for(path)
+        loop = asyncio.get_running_loop()
+        try:
+            extracted = await loop.run_in_executor(
+                self._get_pool(), _extract, path, kind, self.upload_dir, file_id
+            )
+            result = {"status": "ready", "kind": kind, **extracted}
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # A worker died (e.g. out of memory on a hostile file); start
+                # a fresh pool for the next extraction
+                self.shutdown()
+            logger.warning("Error extracting %s: %s", file_id, e)
+            # Failures are kept in memory for status() but not cached on
+            # disk; start_extraction drops them so a later upload can retry
+            result = {"status": "failed", "kind": kind, "text": "", "error": str(e)}
+            self._remember(file_id, result)
+            return result
+
+        def write():
+            cache_path = os.path.join(self.upload_dir, f"{file_id}.extract.json")
+            tmp_path = cache_path + ".part"
+            with open(tmp_path, "w") as f:
+                json.dump(result, f)
+            os.replace(tmp_path, cache_path)
+
+        await asyncio.to_thread(write)
+        self._remember(file_id, result)
+        return result
+
+    async def _analyze(self, file_id: str, question: str) -> Dict:
+        """CSV attachments are answered from their Arrow copy: the profile plus
+        aggregates computed for ``question`` replace the sampled rows"""
+        result = await self.extract(file_id)
+        arrow = result.get("meta", {}).get("arrow") if result["status"] == "ready" else None
+        if result["kind"] != "csv" or not arrow or not question:
+            return result
+        loop = asyncio.get_running_loop()
+        try:
+            text = await loop.run_in_executor(
+                self._get_pool(), analyze_csv, os.path.join(self.upload_dir, arrow),
+                question, result["meta"], settings.EXTRACT_MAX_CHARS
+            )
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self.shutdown()
+            logger.warning("Error analyzing %s: %s", file_id, e)
+            return result
+        return {**result, "text": text}
+
+    async def context_for(self, attachments: List[Dict], question: str = "") -> str:
+        """Render the extracted content of ``attachments`` as a prompt preamble.
+
+        Each attachment is ``{"fileId": ..., "filename": ...}``; entries
+        without a file id and unknown ids are skipped.
+        """
+        attachments = [a for a in attachments if isinstance(a, dict) and isinstance(a.get("fileId"), str)]
+        results = await asyncio.gather(
+            *(self._analyze(a["fileId"], question) for a in attachments),
+            return_exceptions=True
+        )
+        parts = []
+        for attachment, result in zip(attachments, results):
+            name = attachment.get("filename") or attachment["fileId"][:12]
+            if isinstance(result, UploadError):
+                continue
+            if isinstance(result, Exception) or result["status"] != "ready":
+                parts.append(f"[Attachment: {name} could not be read]")
+                continue
+            parts.append(f"[Attachment: {name} ({result['kind']})]\n{result['text']}")
+        return "\n\n".join(parts)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,142 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+from ..core.config import get_settings
+from ..core import metrics
+
+settings = get_settings()
+
+class TooManyGenerations(Exception):
+    """Raised when a socket already has its limit of generations in flight"""
+
+class _Generation:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.reason: Optional[str] = None
+
+class GenerationTracker:
+    """In-flight generations per socket, keyed by chat.
+    
+    A new message for a chat supersedes the generation still running for it;
+    other chats run side by side up to ``max_inflight`` per socket.
+    Cancelling a generation cancels its task, which propagates through
+    single-flight, hedging and the provider call down to the upstream stream.
+    """
+    
+    def __init__(self, max_inflight: int = settings.SOCKET_MAX_INFLIGHT):
+        self.max_inflight = max_inflight
+        self._by_sid: Dict[str, Dict[Hashable, _Generation]] = {}
+    
+    def start(self, sid: str, key: Hashable, coro: Awaitable) -> _Generation:
+        generations = self._by_sid.setdefault(sid, {})
+        previous = generations.get(key)
+        if previous is not None:
+            self._cancel(previous, "superseded")
+        elif len(generations) >= self.max_inflight:
+            coro.close()
+            raise TooManyGenerations(f"At most {self.max_inflight} messages can be in flight")
+        
+        generation = _Generation(asyncio.ensure_future(coro))
+        generations[key] = generation
+        
+        def done(_):
+            if generations.get(key) is generation:
+                del generations[key]
+            if not generations and self._by_sid.get(sid) is generations:
+                del self._by_sid[sid]
+        
+        generation.task.add_done_callback(done)
+        return generation
+    
+    def cancel(self, sid: str, key: Optional[Hashable] = None, reason: str = "cancelled") -> int:
+        """Cancel one chat's generation, or every generation of the socket
+        when ``key`` is None; returns how many were cancelled"""
+        generations = self._by_sid.get(sid, {})
+        targets = list(generations.values()) if key is None else [generations[key]] if key in generations else []
+        for generation in targets:
+            self._cancel(generation, reason)
+        return len(targets)
+    
+    def inflight(self, sid: str) -> int:
+        return len(self._by_sid.get(sid, {}))
+    
+    def _cancel(self, generation: _Generation, reason: str):
+        if not generation.task.done():
+            generation.reason = reason
+            generation.task.cancel()
+            metrics.GENERATIONS_CANCELLED.labels(reason).inc()
+
+class ChunkStream:
+    """Bounded outbound buffer for one streamed reply.
+    
+    Tokens are appended without waiting on the socket; a sender task emits
+    them coalesced into one chunk per ``interval_ms`` and holds off while
+    the socket's outbound queue is backed up. If a slow client lets more
+    than ``max_chars`` pile up, streaming stops and the client relies on the
+    final message, which carries the whole reply. ``text`` is everything
+    pushed so far, so a reply cut short can still be stored.
+    """
+    
+    def __init__(self, emit: Callable[[str, int], Awaitable[None]],
+                 backlog: Callable[[], int],
+                 max_chars: int = settings.SOCKET_STREAM_BUFFER_CHARS,
+                 max_backlog: int = settings.SOCKET_MAX_QUEUED_PACKETS,
+                 interval_ms: float = settings.SOCKET_STREAM_INTERVAL_MS):
+        self.emit = emit
+        self.backlog = backlog
+        self.max_chars = max_chars
+        self.max_backlog = max_backlog
+        self.interval = interval_ms / 1000
+        self.overflowed = False
+        self._parts = []
+        self._pending = []
+        self._pending_chars = 0
+        self._seq = 0
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._sender: Optional[asyncio.Task] = None
+    
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+    
+    async def push(self, text: str):
+        self._parts.append(text)
+        if self.overflowed:
+            return
+        self._pending.append(text)
+        self._pending_chars += len(text)
+        if self._pending_chars > self.max_chars:
+            self.overflowed = True
+            self._pending.clear()
+            return
+        if self._sender is None:
+            self._sender = asyncio.ensure_future(self._run())
+        self._ready.set()
+    
+    async def close(self):
+        """Send what is still buffered and stop the sender"""
+        self._closed = True
+        self._ready.set()
+        if self._sender is not None:
+            await self._sender
+    
+    def abort(self):
+        if self._sender is not None:
+            self._sender.cancel()
+    
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self.backlog() > self.max_backlog and not (self.overflowed or self._closed):
+                await asyncio.sleep(self.interval)
+            if self._pending and not self.overflowed:
+                text = "".join(self._pending)
+                self._pending.clear()
+                self._pending_chars = 0
+                await self.emit(text, self._seq)
+                self._seq += 1
+            if self._closed:
+                return
+            # Let tokens arriving meanwhile join the next chunk
+            await asyncio.sleep(self.interval)
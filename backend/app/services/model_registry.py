@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from ..core.config import get_settings
+from ..core.database import SessionLocal
+from ..models.models import AIModel
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Seeded into an empty ai_models table; prices are USD per 1k tokens.
+# Capabilities are the task types (see classifier.LABELS) a model may be
+# routed for; cheaper models take the tasks they handle well
+DEFAULT_MODELS = [
+    {"name": "gpt-4-turbo", "provider": "openai", "model_id": "gpt-4-turbo",
+     "capabilities": ["general", "math", "programming", "analytics", "creative", "translation"],
+     "priority": 5, "context_tokens": 16000, "input_price_per_1k": 0.01, "output_price_per_1k": 0.03},
+    {"name": "gpt-4", "provider": "openai", "model_id": "gpt-4",
+     "capabilities": ["general", "math", "programming", "analytics"],
+     "priority": 5, "context_tokens": 8000, "input_price_per_1k": 0.03, "output_price_per_1k": 0.06,
+     "enabled": False},
+    {"name": "gpt-3.5-turbo", "provider": "openai", "model_id": "gpt-3.5-turbo",
+     "capabilities": ["general", "translation", "creative", "analytics"],
+     "priority": 4, "context_tokens": 4000, "input_price_per_1k": 0.0005, "output_price_per_1k": 0.0015},
+    {"name": "claude-3-opus", "provider": "anthropic", "model_id": "claude-3-opus",
+     "capabilities": ["general", "math", "programming", "analytics", "creative"],
+     "priority": 5, "context_tokens": 16000, "input_price_per_1k": 0.015, "output_price_per_1k": 0.075},
+    {"name": "claude-3-sonnet", "provider": "anthropic", "model_id": "claude-3-sonnet",
+     "capabilities": ["general", "programming", "translation", "creative", "analytics"],
+     "priority": 4, "context_tokens": 16000, "input_price_per_1k": 0.003, "output_price_per_1k": 0.015,
+     "enabled": False},
+    {"name": "claude-2.1", "provider": "anthropic", "model_id": "claude-2.1",
+     "capabilities": ["general", "translation", "creative"],
+     "priority": 4, "context_tokens": 16000, "input_price_per_1k": 0.008, "output_price_per_1k": 0.024}
+]
+
+class RegistrySnapshot:
+    """Immutable, precompiled view of the model catalogue.
+    
+    ``entries`` holds every model, ``models`` only the enabled ones,
+    ``by_capability`` the enabled models per capability by descending
+    priority and ``prices`` the per-token (input, output) price, so routing
+    and pricing are dictionary lookups. A snapshot is never modified; the
+    registry replaces it as a whole.
+    """
+    
+    def __init__(self, rows: List[Dict[str, Any]], version: int = 0):
+        self.version = version
+        entries = {}
+        for row in rows:
+            entries[row["name"]] = MappingProxyType({
+                "provider": row["provider"],
+                "model_id": row.get("model_id") or row["name"],
+                "capabilities": tuple(row.get("capabilities") or ("general",)),
+                "priority": row.get("priority") or 0,
+                "context_tokens": row.get("context_tokens") or 4000,
+                "input_price_per_1k": row.get("input_price_per_1k") or 0.0,
+                "output_price_per_1k": row.get("output_price_per_1k") or 0.0,
+                "enabled": row.get("enabled", True) is not False
+            })
+        self.entries: Mapping[str, Mapping[str, Any]] = MappingProxyType(entries)
+        self.models: Mapping[str, Mapping[str, Any]] = MappingProxyType(
+            {name: entry for name, entry in entries.items() if entry["enabled"]}
+        )
+        
+        by_capability: Dict[str, List[str]] = {}
+        for name, entry in self.models.items():
+            for capability in entry["capabilities"]:
+                by_capability.setdefault(capability, []).append(name)
+        self.by_capability: Mapping[str, Tuple[str, ...]] = MappingProxyType({
+            capability: tuple(sorted(names, key=lambda n: -self.models[n]["priority"]))
+            for capability, names in by_capability.items()
+        })
+        self.prices: Mapping[str, Tuple[float, float]] = MappingProxyType({
+            name: (entry["input_price_per_1k"] / 1000, entry["output_price_per_1k"] / 1000)
+            for name, entry in entries.items()
+        })
+    
+    def cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        price = self.prices.get(model)
+        if price is None:
+            return 0.0
+        return input_tokens * price[0] + output_tokens * price[1]
+    
+    def cost_per_1k(self) -> Dict[str, float]:
+        """Price of a balanced 1k-token call per model, the router's prior"""
+        return {name: self.cost(name, 500, 500) for name in self.models}
+
+class NoEnabledModels(ValueError):
+    """Raised for a catalogue in which every model is disabled"""
+
+class ModelRegistry:
+    """Model catalogue loaded from the ai_models table.
+    
+    Rows are compiled into a ``RegistrySnapshot`` that is swapped in with a
+    single assignment, so readers always see one consistent catalogue. The
+    table is polled for changes and can be reloaded on demand; listeners
+    are called with every new snapshot. A catalogue without any enabled
+    model is rejected and the current snapshot stays live.
+    """
+    
+    def __init__(self, session_factory=SessionLocal,
+                 poll_interval_s: float = settings.MODEL_REGISTRY_POLL_S):
+        self.session_factory = session_factory
+        self.poll_interval_s = poll_interval_s
+        # Until the table has been read, route with the built-in defaults
+        self.snapshot = RegistrySnapshot(DEFAULT_MODELS)
+        self.listeners = []
+        self._rows: Optional[Tuple] = None
+    
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+    
+    def load(self) -> bool:
+        """Read the table (seeding it when empty) and swap in a new snapshot
+        if anything changed; returns whether it did"""
+        return self._apply(self._read_rows())
+    
+    async def reload(self) -> bool:
+        # Only the query runs in a thread; listeners are called on the loop
+        return self._apply(await asyncio.to_thread(self._read_rows))
+    
+    def _apply(self, rows: List[Dict[str, Any]]) -> bool:
+        key = tuple(tuple(sorted((k, repr(v)) for k, v in row.items())) for row in rows)
+        if key == self._rows:
+            return False
+        snapshot = RegistrySnapshot(rows, self.snapshot.version + 1)
+        if not snapshot.models:
+            logger.warning("Every model in ai_models is disabled; keeping catalogue version %d",
+                           self.snapshot.version)
+            raise NoEnabledModels("At least one model must stay enabled")
+        self._rows = key
+        self.snapshot = snapshot
+        for listener in self.listeners:
+            listener(snapshot)
+        return True
+    
+    async def poll_forever(self):
+        while True:
+            await asyncio.sleep(self.poll_interval_s)
+            try:
+                await self.reload()
+            except NoEnabledModels:
+                # Logged when rejected; keep polling for a fixed catalogue
+                pass
+            except Exception as e:
+                logger.warning("Error reloading model registry: %s", e)
+    
+    def _read_rows(self) -> List[Dict[str, Any]]:
+        columns = [
+            AIModel.name, AIModel.provider, AIModel.model_id, AIModel.capabilities, AIModel.priority,
+            AIModel.context_tokens, AIModel.input_price_per_1k, AIModel.output_price_per_1k, AIModel.enabled
+        ]
+        session = self.session_factory()
+        try:
+            rows = session.execute(select(*columns).order_by(AIModel.name)).mappings().all()
+            if not rows:
+                now = datetime.utcnow()
+                session.add_all(AIModel(**{"enabled": True, **row, "updated_at": now}) for row in DEFAULT_MODELS)
+                try:
+                    session.commit()
+                except IntegrityError:
+                    # Another worker seeded the table first
+                    session.rollback()
+                rows = session.execute(select(*columns).order_by(AIModel.name)).mappings().all()
+            return [dict(row) for row in rows]
+        finally:
+            session.close()
@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import insert, func, select, update
+from ..core.config import get_settings
+from ..core.database import SessionLocal
+from ..core import metrics
+from ..models.models import Chat, Message, IdSequence, MESSAGE_METRIC_COLUMNS
+from .usage import usage_entry, record_usage
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class WriteFailed(Exception):
+    """Rows queued before a ``flush`` could not be written"""
+
+class PersistenceService:
+    """Queues chat and message inserts and writes them in batched
+    transactions on a dedicated writer thread, off the event loop.
+    
+    A batch that fails is retried, then written one row at a time so a
+    bad row cannot take the others with it. Rows that still fail are
+    logged and reported to the next ``flush``.
+    """
+    
+    def __init__(self, session_factory=SessionLocal,
+                 batch_size: int = settings.DB_WRITE_BATCH_SIZE,
+                 flush_interval_ms: int = settings.DB_WRITE_FLUSH_INTERVAL_MS,
+                 id_block_size: int = settings.CHAT_ID_BLOCK_SIZE,
+                 retries: int = settings.DB_WRITE_RETRIES,
+                 retry_delay_ms: int = settings.DB_WRITE_RETRY_DELAY_MS):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.retries = retries
+        self.retry_delay = retry_delay_ms / 1000
+        # Why rows were lost since the last flush, if any were
+        self._write_error: Optional[Exception] = None
+        self.id_block_size = id_block_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        # Chat ids are reserved from the id_sequences row in blocks, so
+        # several worker processes can allocate without colliding
+        self._id_lock = threading.Lock()
+        self._next_chat_id = 0
+        self._chat_id_limit = 0
+        self._spare_block: Optional[Tuple[int, int]] = None
+        self._reserving = False
+        self.listeners = []
+    
+    def add_listener(self, listener):
+        """Register an object notified through ``on_chat_created(chat_id)`` and
+        ``on_message(chat_id, role, content)`` as rows are queued"""
+        self.listeners.append(listener)
+    
+    async def start(self):
+        """Reserve the first block of chat ids and start the background writer"""
+        if self._next_chat_id >= self._chat_id_limit:
+            loop = asyncio.get_running_loop()
+            block = await loop.run_in_executor(self._executor, self._reserve_ids)
+            with self._id_lock:
+                self._next_chat_id, self._chat_id_limit = block
+        self._ensure_writer()
+    
+    async def stop(self):
+        """Flush everything queued so far and stop the writer"""
+        if self._writer is not None:
+            try:
+                await self.flush()
+            except WriteFailed as e:
+                logger.error("Some rows were not written before shutdown: %s", e)
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        self._executor.shutdown(wait=True)
+    
+    async def new_chat(self) -> int:
+        """Allocate a chat id and queue the chat row. Only waits for the
+        database when the prefetched block of ids has not arrived yet."""
+        while True:
+            with self._id_lock:
+                if self._next_chat_id < self._chat_id_limit:
+                    chat_id = self._next_chat_id
+                    self._next_chat_id += 1
+                    running_low = self._chat_id_limit - self._next_chat_id < self.id_block_size // 2
+                    break
+                block, self._spare_block = self._spare_block, None
+            if block is None:
+                loop = asyncio.get_running_loop()
+                block = await loop.run_in_executor(self._executor, self._reserve_ids)
+            with self._id_lock:
+                if self._next_chat_id >= self._chat_id_limit:
+                    self._next_chat_id, self._chat_id_limit = block
+                elif self._spare_block is None:
+                    # Another chat refilled the ids meanwhile; keep this block for later
+                    self._spare_block = block
+        if running_low:
+            self._prefetch_ids()
+        self._enqueue(("chat", {"id": chat_id, "created_at": datetime.utcnow()}))
+        for listener in self.listeners:
+            listener.on_chat_created(chat_id)
+        return chat_id
+    
+    def add_message(self, chat_id: int, role: str, content: str,
+                    model: Optional[str] = None,
+                    provider: Optional[str] = None,
+                    metrics: Optional[Dict[str, Any]] = None):
+        """Queue a message row; created_at is stamped now so ordering
+        reflects arrival rather than flush time. The typed ``metrics`` go to
+        their own columns and the rest to message_metadata."""
+        extra = dict(metrics or {})
+        typed = {name: extra.pop(name, None) for name in MESSAGE_METRIC_COLUMNS}
+        self._enqueue(("message", {
+            "chat_id": chat_id,
+            "role": role,
+            "content": content,
+            "model": model,
+            "provider": provider,
+            **typed,
+            "message_metadata": {"metrics": extra} if extra else None,
+            "created_at": datetime.utcnow()
+        }))
+        for listener in self.listeners:
+            listener.on_message(chat_id, role, content)
+    
+    async def flush(self):
+        """Wait until everything queued before this call is committed;
+        raises WriteFailed if some of it could not be written"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._enqueue(("barrier", waiter))
+        await waiter
+    
+    def _enqueue(self, item: Tuple[str, Any]):
+        self._ensure_writer()
+        self._queue.put_nowait(item)
+    
+    def _ensure_writer(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.get_running_loop().create_task(self._run())
+    
+    def _prefetch_ids(self):
+        with self._id_lock:
+            if self._spare_block is not None or self._reserving:
+                return
+            self._reserving = True
+        
+        def done(future):
+            with self._id_lock:
+                self._reserving = False
+                if future.exception() is None:
+                    self._spare_block = future.result()
+        
+        self._executor.submit(self._reserve_ids).add_done_callback(done)
+    
+    def _reserve_ids(self) -> Tuple[int, int]:
+        """Atomically take the next ``id_block_size`` chat ids as ``[start, limit)``"""
+        session = self.session_factory()
+        try:
+            bump = (
+                update(IdSequence)
+                .where(IdSequence.name == "chats")
+                .values(next_id=IdSequence.next_id + self.id_block_size)
+            )
+            if session.execute(bump).rowcount == 0:
+                # Databases created without the migration: seed from existing rows
+                max_id = session.execute(select(func.max(Chat.id))).scalar() or 0
+                session.execute(insert(IdSequence).values(name="chats", next_id=max_id + 1))
+                session.execute(bump)
+            limit = session.execute(
+                select(IdSequence.next_id).where(IdSequence.name == "chats")
+            ).scalar()
+            session.commit()
+            return limit - self.id_block_size, limit
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            # Give concurrent sockets a short window to join this transaction
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            
+            chats = [row for kind, row in batch if kind == "chat"]
+            messages = [row for kind, row in batch if kind == "message"]
+            if chats or messages:
+                await self._write(chats, messages)
+            barriers = [waiter for kind, waiter in batch if kind == "barrier"]
+            for waiter in barriers:
+                if waiter.done():
+                    continue
+                if self._write_error is not None:
+                    waiter.set_exception(WriteFailed(str(self._write_error)))
+                else:
+                    waiter.set_result(None)
+            if barriers:
+                self._write_error = None
+    
+    async def _write(self, chats: List[Dict[str, Any]], messages: List[Dict[str, Any]]):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            try:
+                await loop.run_in_executor(self._executor, self._write_batch, chats, messages)
+                return
+            except Exception as e:
+                logger.warning("Error writing batch of %d rows (attempt %d): %s",
+                               len(chats) + len(messages), attempt + 1, e)
+                if attempt < self.retries:
+                    await asyncio.sleep(self.retry_delay * 2 ** attempt)
+        
+        # Chats first, so that their messages can follow
+        rows = [([chat], []) for chat in chats] + [([], [message]) for message in messages]
+        for row_chats, row_messages in rows:
+            try:
+                await loop.run_in_executor(self._executor, self._write_batch, row_chats, row_messages)
+            except Exception as e:
+                row = (row_chats or row_messages)[0]
+                logger.error("Dropping %s row of chat %s: %s", "chat" if row_chats else "message",
+                             row.get("chat_id", row.get("id")), e)
+                self._write_error = e
+    
+    def _write_batch(self, chats: List[Dict[str, Any]], messages: List[Dict[str, Any]]):
+        start = time.perf_counter()
+        session = self.session_factory()
+        try:
+            if chats:
+                session.execute(insert(Chat), chats)
+            if messages:
+                session.execute(insert(Message), messages)
+                # Rollups commit with the replies they count
+                record_usage(session, [
+                    usage_entry(
+                        row["created_at"], row["provider"], row["model"],
+                        {**(row["message_metadata"] or {}).get("metrics", {}),
+                         **{name: row[name] for name in MESSAGE_METRIC_COLUMNS}},
+                        row["chat_id"]
+                    )
+                    for row in messages if row["provider"] is not None
+                ])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+            metrics.DB_WRITE.labels("messages").observe(time.perf_counter() - start)
@@ -0,0 +1,81 @@
+import time
+from ..core.config import get_settings
+
+settings = get_settings()
+
+class CircuitBreaker:
+    """Stops sending traffic to a model after repeated hard failures.
+    
+    After ``reset_s`` in the open state a single trial call is let through;
+    its outcome closes the breaker again or re-opens it.
+    """
+    
+    def __init__(self, failure_threshold: int = settings.CIRCUIT_FAILURE_THRESHOLD,
+                 reset_s: float = settings.CIRCUIT_RESET_S):
+        self.failure_threshold = failure_threshold
+        self.reset_s = reset_s
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_s:
+            return "half_open"
+        return "open"
+    
+    def available(self) -> bool:
+        """Whether a call would currently be let through, without claiming it"""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.trial_in_flight)
+    
+    def allow(self) -> bool:
+        """Claim permission for one call"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+    
+    def release(self):
+        """Give back a claimed trial whose call was cancelled before finishing"""
+        self.trial_in_flight = False
+    
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+    
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+class HedgeBudget:
+    """Token bucket that caps hedged requests to a fraction of all requests.
+    
+    Every request earns ``ratio`` tokens (up to ``burst``) and every hedge
+    spends one, so extra spend stays within roughly ``ratio`` of traffic.
+    """
+    
+    def __init__(self, ratio: float = settings.HEDGE_BUDGET_RATIO,
+                 burst: float = settings.HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.hedges = 0
+    
+    def earn(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+    
+    def try_spend(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        self.hedges += 1
+        return True
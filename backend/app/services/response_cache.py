@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from ..core.config import get_settings
+
+settings = get_settings()
+
+def normalize_prompt(text: str) -> str:
+    """Fold case, unicode forms and whitespace so near-verbatim repeats share a key"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+class LRUCache:
+    """In-memory LRU with per-entry TTL, bounded by entry count and payload bytes"""
+    
+    def __init__(self, max_entries: int, max_bytes: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.bytes_used = 0
+        self._entries: "OrderedDict[str, tuple[float, int, str]]" = OrderedDict()
+    
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, size, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: str):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_s, size, value)
+        self.bytes_used += size
+        while len(self._entries) > self.max_entries or self.bytes_used > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+    
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.bytes_used -= size
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class RedisCacheTier:
+    """Persistent tier shared by every worker through REDIS_URL"""
+    
+    def __init__(self, url: str, ttl_s: int, prefix: str = "onetap:cache:"):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.ttl_s = ttl_s
+        self.prefix = prefix
+    
+    async def get(self, key: str) -> Optional[str]:
+        value = await self.client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+    
+    async def set(self, key: str, value: str):
+        await self.client.set(self.prefix + key, value, ex=self.ttl_s)
+    
+    async def aclose(self):
+        await self.client.aclose()
+
+class SQLiteCacheTier:
+    """Local stand-in for the Redis tier, backed by a SQLite file"""
+    
+    def __init__(self, path: str, ttl_s: int):
+        self.ttl_s = ttl_s
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+    
+    def _get(self, key: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT value FROM response_cache WHERE key = ? AND expires_at > ?",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+    
+    def _set(self, key: str, value: str):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + self.ttl_s)
+        )
+        self._conn.commit()
+    
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+    
+    async def set(self, key: str, value: str):
+        await asyncio.to_thread(self._set, key, value)
+    
+    async def aclose(self):
+        self._conn.close()
+
+class ResponseCache:
+    """Two-level exact-match cache for generated responses"""
+    
+    def __init__(self, persistent=None):
+        self.memory = LRUCache(
+            settings.RESPONSE_CACHE_MAX_ENTRIES,
+            settings.RESPONSE_CACHE_MAX_BYTES,
+            settings.RESPONSE_CACHE_TTL_S
+        )
+        self.persistent = persistent
+        self.hits = 0
+        self.misses = 0
+        self.saved_usd = 0.0
+    
+    @classmethod
+    def from_settings(cls) -> "ResponseCache":
+        backend = settings.RESPONSE_CACHE_BACKEND
+        if backend == "redis":
+            return cls(RedisCacheTier(settings.REDIS_URL, settings.RESPONSE_CACHE_TTL_S))
+        if backend == "sqlite":
+            return cls(SQLiteCacheTier(settings.RESPONSE_CACHE_SQLITE_PATH, settings.RESPONSE_CACHE_TTL_S))
+        return cls()
+    
+    @staticmethod
+    def make_key(messages: List[Dict[str, str]], model: str, task_type: str) -> str:
+        normalized = [(m["role"], normalize_prompt(m["content"])) for m in messages]
+        raw = json.dumps([normalized, model, task_type])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            try:
+                value = await self.persistent.get(key)
+            except Exception as e:
+                print(f"Response cache lookup failed: {str(e)}")
+            if value is not None:
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        response = json.loads(value)
+        self.saved_usd += response["metrics"].get("cost_usd", 0.0)
+        return response
+    
+    async def set(self, key: str, response: Dict[str, Any]):
+        value = json.dumps(response)
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            try:
+                await self.persistent.set(key, value)
+            except Exception as e:
+                print(f"Response cache store failed: {str(e)}")
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_saved_usd": self.saved_usd
+        }
+    
+    async def aclose(self):
+        if self.persistent is not None:
+            await self.persistent.aclose()
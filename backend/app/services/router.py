@@ -0,0 +1,258 @@
+import asyncio
+import json
+import logging
+import math
+import random
+from collections import deque
+from typing import Dict, Any, List, Mapping, Optional, Tuple
+from ..core.config import get_settings
+from .resilience import CircuitBreaker
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct * len(sorted_values) / 100) - 1))
+    return sorted_values[index]
+
+class ModelStats:
+    """Rolling window of observed performance for one model"""
+    
+    # Pseudo-successes that keep a single early failure from looking like an outage
+    ERROR_PRIOR_SAMPLES = 5
+    
+    def __init__(self, window: int, prior_latency_ms: float, prior_cost_per_1k: float):
+        self.latencies = deque(maxlen=window)
+        self.ttfts = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # 1 for error, 0 for success
+        self.usage = deque(maxlen=window)  # (tokens, cost_usd)
+        self.prior_latency_ms = prior_latency_ms
+        self.prior_cost_per_1k = prior_cost_per_1k
+        self.p50_ms = self.p95_ms = prior_latency_ms
+        self.ttft_p50_ms = self.ttft_p95_ms = prior_latency_ms
+        self.error_rate = 0.0
+        self.cost_per_1k = prior_cost_per_1k
+        self._sorted_ttfts: List[float] = []
+    
+    @staticmethod
+    def sample(metrics: Optional[Dict[str, Any]] = None, error: bool = False) -> list:
+        """One outcome as ``[error, latency_ms, ttft_ms, tokens, cost_usd]``"""
+        if error or metrics is None:
+            return [1 if error else 0, None, None, 0, 0.0]
+        return [
+            0,
+            metrics["latency_ms"],
+            metrics.get("time_to_first_token_ms", metrics["latency_ms"]),
+            metrics.get("tokens_used") or 0,
+            metrics.get("cost_usd", 0.0)
+        ]
+    
+    def record(self, metrics: Optional[Dict[str, Any]] = None, error: bool = False) -> list:
+        sample = self.sample(metrics, error)
+        self._append(sample)
+        self._refresh()
+        return sample
+    
+    def load(self, samples: List[list]):
+        """Replace the window with ``samples``, e.g. merged from every worker"""
+        for values in (self.latencies, self.ttfts, self.outcomes, self.usage):
+            values.clear()
+        for sample in samples:
+            self._append(sample)
+        self._refresh()
+    
+    def _append(self, sample: list):
+        error, latency_ms, ttft_ms, tokens, cost_usd = sample
+        self.outcomes.append(error)
+        if latency_ms is not None:
+            self.latencies.append(latency_ms)
+            self.ttfts.append(ttft_ms)
+            if tokens:
+                self.usage.append((tokens, cost_usd))
+    
+    def _refresh(self):
+        # Summaries are recomputed here, off the routing path, so that
+        # a routing decision only reads precomputed numbers
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            self.p50_ms = percentile(ordered, 50)
+            self.p95_ms = percentile(ordered, 95)
+            ordered = self._sorted_ttfts = sorted(self.ttfts)
+            self.ttft_p50_ms = percentile(ordered, 50)
+            self.ttft_p95_ms = percentile(ordered, 95)
+        self.error_rate = sum(self.outcomes) / (len(self.outcomes) + self.ERROR_PRIOR_SAMPLES)
+        tokens = sum(t for t, _ in self.usage)
+        if tokens:
+            self.cost_per_1k = sum(c for _, c in self.usage) / tokens * 1000
+    
+    def ttft_percentile(self, pct: float) -> float:
+        if not self._sorted_ttfts:
+            return self.prior_latency_ms
+        return percentile(self._sorted_ttfts, pct)
+    
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "p50_ms": self.p50_ms,
+            "p95_ms": self.p95_ms,
+            "ttft_p50_ms": self.ttft_p50_ms,
+            "ttft_p95_ms": self.ttft_p95_ms,
+            "error_rate": self.error_rate,
+            "cost_per_1k": self.cost_per_1k,
+            "samples": len(self.outcomes)
+        }
+
+class AdaptiveRouter:
+    """Chooses a model per task type from rolling latency, cost, error and
+    static quality (priority) signals.
+    
+    Candidates per capability are indexed up front and the best choice per
+    capability is recomputed whenever a model reports a result, so
+    ``select`` is a dictionary lookup.
+    """
+    
+    def __init__(self, models: Mapping[str, Mapping[str, Any]], prior_cost_per_1k: Dict[str, float],
+                 latency_weight: float = settings.ROUTER_LATENCY_WEIGHT,
+                 cost_weight: float = settings.ROUTER_COST_WEIGHT,
+                 quality_weight: float = settings.ROUTER_QUALITY_WEIGHT,
+                 error_weight: float = settings.ROUTER_ERROR_WEIGHT,
+                 exploration_rate: float = settings.ROUTER_EXPLORATION_RATE,
+                 window: int = settings.ROUTER_WINDOW,
+                 candidates: Optional[Mapping[str, Tuple[str, ...]]] = None):
+        self.latency_weight = latency_weight
+        self.cost_weight = cost_weight
+        self.quality_weight = quality_weight
+        self.error_weight = error_weight
+        self.exploration_rate = exploration_rate
+        self.window = window
+        self.stats: Dict[str, ModelStats] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # Outcomes recorded since the last ``sync``
+        self._outbox: Dict[str, deque] = {}
+        self.update_models(models, prior_cost_per_1k, candidates)
+    
+    def update_models(self, models: Mapping[str, Mapping[str, Any]], prior_cost_per_1k: Dict[str, float],
+                      candidates: Optional[Mapping[str, Tuple[str, ...]]] = None):
+        """Adopt a new model catalogue. Statistics of models that remain are
+        kept; those of removed models stay around for calls still in flight
+        but are no longer routed to. A catalogue without models is ignored,
+        since there would be nothing to route to."""
+        if not models:
+            logger.warning("Ignoring a model catalogue without enabled models")
+            return
+        for name in models:
+            if name not in self.stats:
+                self.stats[name] = ModelStats(
+                    self.window, settings.ROUTER_DEFAULT_LATENCY_MS, prior_cost_per_1k.get(name, 0.0)
+                )
+                self.breakers[name] = CircuitBreaker()
+                self._outbox[name] = deque(maxlen=self.window)
+        
+        if candidates is None:
+            candidates = {}
+            for name, config in models.items():
+                for capability in config["capabilities"]:
+                    candidates[capability] = candidates.get(capability, ()) + (name,)
+        self.models = models
+        self._candidates = dict(candidates)
+        self._fallback = max(models, key=lambda name: models[name]["priority"])
+        self._ranked: Dict[str, Tuple[str, ...]] = {}
+        for capability in self._candidates:
+            self._rank(capability)
+    
+    def select(self, task_type: str) -> str:
+        """Return the best model for a task type whose circuit is not open"""
+        ranked = self.ranked(task_type)
+        # Occasionally probe the others so a recovered model can win back traffic
+        if len(ranked) > 1 and random.random() < self.exploration_rate:
+            probe = random.choice(ranked[1:])
+            if self.breakers[probe].available():
+                return probe
+        for name in ranked:
+            if self.breakers[name].available():
+                return name
+        return ranked[0]
+    
+    def ranked(self, task_type: str) -> Tuple[str, ...]:
+        """All candidates for a task type, best first. A task type no model
+        lists as a capability is served by the general-purpose models."""
+        return self._ranked.get(task_type) or self._ranked.get("general") or (self._fallback,)
+    
+    def backup_for(self, task_type: str, model_name: str) -> Optional[str]:
+        """Best available alternative to ``model_name``, preferring another provider"""
+        alternatives = [
+            name for name in self.ranked(task_type)
+            if name != model_name and self.breakers[name].available()
+        ]
+        provider = self.models.get(model_name, {}).get("provider")
+        for name in alternatives:
+            if self.models[name]["provider"] != provider:
+                return name
+        return alternatives[0] if alternatives else None
+    
+    def record(self, model_name: str, metrics: Optional[Dict[str, Any]] = None, error: bool = False):
+        """Feed the outcome of a provider call back into the statistics"""
+        stats = self.stats.get(model_name)
+        if stats is None:
+            return
+        self._outbox[model_name].append(stats.record(metrics, error))
+        if error:
+            self.breakers[model_name].record_failure()
+        else:
+            self.breakers[model_name].record_success()
+        config = self.models.get(model_name)
+        if config is not None:
+            for capability in config["capabilities"]:
+                self._rank(capability)
+    
+    async def sync(self, state):
+        """Publish outcomes recorded here and adopt the window merged from all
+        workers, so every process routes on the same statistics.
+        
+        Circuit breakers stay per process: they must react to failures
+        immediately rather than at the next sync.
+        """
+        pending = {}
+        for name, outbox in self._outbox.items():
+            pending[f"router:{name}"] = [json.dumps(sample) for sample in outbox]
+            outbox.clear()
+        merged = await state.exchange(pending, self.window)
+        for name, stats in self.stats.items():
+            samples = merged.get(f"router:{name}")
+            if samples:
+                stats.load([json.loads(sample) for sample in samples])
+        for capability in self._candidates:
+            self._rank(capability)
+    
+    async def sync_forever(self, state, interval_s: float = settings.ROUTER_SYNC_INTERVAL_S):
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                await self.sync(state)
+            except Exception as e:
+                logger.warning("Error syncing router statistics: %s", e)
+    
+    def _rank(self, capability: str):
+        candidates = self._candidates[capability]
+        max_latency = max(self.stats[n].p95_ms for n in candidates) or 1.0
+        max_cost = max(self.stats[n].cost_per_1k for n in candidates) or 1.0
+        max_priority = max(self.models[n]["priority"] for n in candidates) or 1
+        
+        def score(name: str) -> float:
+            stats = self.stats[name]
+            return (
+                self.latency_weight * stats.p95_ms / max_latency
+                + self.cost_weight * stats.cost_per_1k / max_cost
+                + self.quality_weight * (1 - self.models[name]["priority"] / max_priority)
+                + self.error_weight * stats.error_rate
+            )
+        
+        self._ranked[capability] = tuple(sorted(candidates, key=score))
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {**self.stats[name].snapshot(), "circuit": self.breakers[name].state}
+            for name in self.models
+        }
@@ -0,0 +1,161 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, Any, List, Optional
+from ..core.config import get_settings
+
+settings = get_settings()
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+class TokenBucket:
+    """Continuously refilling bucket sized to one minute of quota"""
+    
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` can be taken (a request larger than the
+        bucket only has to wait for a full bucket)"""
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+    
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+    
+    def refund(self, amount: float):
+        """Return (or, when negative, charge) the difference between an estimate and actual usage"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class _Slot:
+    def __init__(self, scheduler: "ProviderScheduler", tokens: int, priority: int):
+        self.scheduler = scheduler
+        self.estimated_tokens = tokens
+        self.used_tokens: Optional[int] = None
+        self.priority = priority
+        self.queue_wait_ms = 0.0
+        self.queue_depth = 0
+    
+    async def __aenter__(self) -> "_Slot":
+        start = time.monotonic()
+        self.queue_depth = await self.scheduler.acquire(self.estimated_tokens, self.priority)
+        self.queue_wait_ms = (time.monotonic() - start) * 1000
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        used = self.used_tokens if self.used_tokens is not None else self.estimated_tokens
+        self.scheduler.release(self.estimated_tokens - used)
+
+class ProviderScheduler:
+    """Admits calls to one provider within its requests-per-minute,
+    tokens-per-minute and concurrency limits, highest priority first"""
+    
+    def __init__(self, name: str, rpm: int, tpm: int, concurrency: int):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = concurrency
+        self.active = 0
+        self._queue: List[list] = []
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+    
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+    
+    def slot(self, tokens: int, priority: int = PRIORITY_INTERACTIVE) -> _Slot:
+        return _Slot(self, tokens, priority)
+    
+    async def acquire(self, tokens: int, priority: int) -> int:
+        """Wait for admission; returns the queue depth seen on arrival"""
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, [priority, next(self._counter), tokens, waiter])
+        depth = len(self._queue) - 1
+        self._pump()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Admitted just as we were cancelled: hand the slot straight back
+            if waiter.done() and not waiter.cancelled():
+                self.release(tokens)
+            else:
+                waiter.cancel()
+                self._pump()
+            raise
+        return depth
+    
+    def release(self, unused_tokens: int = 0):
+        self.active -= 1
+        self.tokens.refund(unused_tokens)
+        self._pump()
+    
+    def _pump(self):
+        while self._queue and self.active < self.concurrency:
+            priority, _, tokens, waiter = self._queue[0]
+            if waiter.done():
+                heapq.heappop(self._queue)
+                continue
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+                return
+            heapq.heappop(self._queue)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            self.active += 1
+            waiter.set_result(None)
+    
+    def _on_timer(self):
+        self._timer = None
+        self._pump()
+
+class Scheduler:
+    """One ProviderScheduler per configured provider.
+    
+    ``limits`` are per node; with several workers each one enforces an
+    equal share of them. A provider without limits, such as one added to
+    the model registry at runtime, gets ``default_limits`` on first use.
+    """
+    
+    def __init__(self, limits: Dict[str, Dict[str, Any]] = settings.PROVIDER_LIMITS,
+                 workers: int = settings.WORKERS,
+                 default_limits: Dict[str, Any] = settings.DEFAULT_PROVIDER_LIMITS):
+        self.share = 1 / max(1, workers)
+        self.default_limits = default_limits
+        self.providers = {name: self._build(name, limit) for name, limit in limits.items()}
+    
+    def _build(self, name: str, limit: Dict[str, Any]) -> ProviderScheduler:
+        return ProviderScheduler(
+            name,
+            max(1, limit["rpm"] * self.share),
+            max(1, limit["tpm"] * self.share),
+            max(1, int(limit["concurrency"] * self.share))
+        )
+    
+    def slot(self, provider: str, tokens: int, priority: int = PRIORITY_INTERACTIVE) -> _Slot:
+        scheduler = self.providers.get(provider)
+        if scheduler is None:
+            scheduler = self.providers[provider] = self._build(provider, self.default_limits)
+        return scheduler.slot(tokens, priority)
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {"active": p.active, "queued": p.depth}
+            for name, p in self.providers.items()
+        }
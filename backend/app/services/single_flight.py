@@ -0,0 +1,95 @@
+import asyncio
+import copy
+import hashlib
+import json
+from collections import Counter
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+from ..core import metrics
+from .response_cache import normalize_prompt
+
+TokenCallback = Callable[[str], Awaitable[None]]
+
+class _Flight:
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.chunks: List[str] = []
+        self.subscribers: List[TokenCallback] = []
+        self.waiters = 0
+
+class SingleFlight:
+    """Collapses identical concurrent requests into one upstream call and fans
+    the result (and, when streaming, every chunk) out to all waiters"""
+    
+    MAX_TRACKED_KEYS = 10000
+    
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.coalesced: Counter = Counter()
+        self.coalesced_total = 0
+    
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], streaming: bool) -> str:
+        normalized = [(m["role"], normalize_prompt(m["content"])) for m in messages]
+        raw = json.dumps([model, normalized, streaming])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    async def do(self, key: str, fn: Callable[[Optional[TokenCallback]], Awaitable[Dict[str, Any]]],
+                 on_token: Optional[TokenCallback] = None) -> Tuple[Dict[str, Any], bool]:
+        """Run ``fn`` once per key; returns the result and whether this call joined
+        an existing flight. ``fn`` receives the broadcast callback when streaming."""
+        flight = self._flights.get(key)
+        joined = flight is not None
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.ensure_future(
+                fn(self._broadcaster(flight) if on_token else None)
+            )
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+        else:
+            self._count(key)
+        
+        flight.waiters += 1
+        if on_token:
+            # Replay what the leader has already streamed, then subscribe; no
+            # await separates the final check from subscribing, so nothing is lost
+            sent = 0
+            while sent < len(flight.chunks):
+                await on_token(flight.chunks[sent])
+                sent += 1
+            flight.subscribers.append(on_token)
+        try:
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if on_token in flight.subscribers:
+                flight.subscribers.remove(on_token)
+            # Nobody is left to read the answer, so stop paying for it
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+        return copy.deepcopy(result), joined
+    
+    def _broadcaster(self, flight: _Flight) -> TokenCallback:
+        async def broadcast(text: str):
+            flight.chunks.append(text)
+            for subscriber in list(flight.subscribers):
+                try:
+                    await subscriber(text)
+                except Exception as e:
+                    print(f"Dropping stream subscriber: {str(e)}")
+                    flight.subscribers.remove(subscriber)
+        return broadcast
+    
+    def _finish(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Retrieve the exception so an abandoned flight does not log a warning
+        if not flight.task.cancelled():
+            flight.task.exception()
+    
+    def _count(self, key: str):
+        self.coalesced[key] += 1
+        self.coalesced_total += 1
+        metrics.SINGLE_FLIGHT_COALESCED.inc()
+        if len(self.coalesced) > self.MAX_TRACKED_KEYS:
+            self.coalesced = Counter(dict(self.coalesced.most_common(self.MAX_TRACKED_KEYS // 2)))
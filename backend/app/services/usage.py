@@ -0,0 +1,174 @@
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from ..models.models import UsageRollup, ChatUsage
+
+# Summed columns of each rollup table
+DAILY_SUMS = ("requests", "tokens_used", "cost_usd", "latency_ms_total", "cache_hits", "cost_saved_usd")
+CHAT_SUMS = ("requests", "tokens_used", "cost_usd")
+GROUP_COLUMNS = {
+    "day": UsageRollup.day,
+    "provider": UsageRollup.provider,
+    "model": UsageRollup.model
+}
+
+def usage_entry(at: datetime, provider: str, model: str, metrics: Dict[str, Any],
+                chat_id: Optional[int] = None) -> Dict[str, Any]:
+    """One reply's contribution to the rollups. A reply that joined another
+    request's upstream call counts as a request but not as spend."""
+    billed = not metrics.get("coalesced")
+    return {
+        "at": at,
+        "provider": provider,
+        "model": model,
+        "chat_id": chat_id,
+        "requests": 1,
+        "tokens_used": (metrics.get("tokens_used") or 0) if billed else 0,
+        "cost_usd": (metrics.get("cost_usd") or 0.0) if billed else 0.0,
+        "latency_ms_total": metrics.get("latency_ms") or 0.0,
+        "cache_hits": 1 if metrics.get("cache_hit") else 0,
+        "cost_saved_usd": metrics.get("cost_saved_usd") or 0.0
+    }
+
+def _insert(session: Session):
+    """The dialect's INSERT supporting ON CONFLICT DO UPDATE"""
+    # Migrations pass a Connection, which has its dialect at hand
+    dialect = getattr(session, "dialect", None) or session.get_bind().dialect
+    if dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+def _upsert(session: Session, model, keys: Sequence[str], sums: Sequence[str],
+            rows: List[Dict[str, Any]], latest: Sequence[str] = ()):
+    insert = _insert(session)(model)
+    table = model.__table__
+    session.execute(
+        insert.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={
+                **{name: table.c[name] + insert.excluded[name] for name in sums},
+                **{name: insert.excluded[name] for name in latest}
+            }
+        ),
+        rows
+    )
+
+def record_usage(session: Session, entries: Iterable[Dict[str, Any]], daily: bool = True):
+    """Add ``usage_entry`` results to the rollups within the caller's
+    transaction; each key is written once per call. ``daily=False`` only
+    updates the per-chat rollups."""
+    daily_rows: Dict[tuple, Dict[str, Any]] = {}
+    chats: Dict[tuple, Dict[str, Any]] = {}
+    for entry in entries:
+        key = (entry["at"].date(), entry["provider"], entry["model"])
+        row = daily_rows.get(key)
+        if row is None:
+            row = daily_rows[key] = {"day": key[0], "provider": key[1], "model": key[2], **dict.fromkeys(DAILY_SUMS, 0)}
+        for name in DAILY_SUMS:
+            row[name] += entry[name]
+        
+        if entry["chat_id"] is not None:
+            key = (entry["chat_id"], entry["at"].date(), entry["provider"], entry["model"])
+            row = chats.get(key)
+            if row is None:
+                row = chats[key] = {"chat_id": key[0], "day": key[1], "provider": key[2], "model": key[3],
+                                    "last_at": entry["at"], **dict.fromkeys(CHAT_SUMS, 0)}
+            for name in CHAT_SUMS:
+                row[name] += entry[name]
+            row["last_at"] = max(row["last_at"], entry["at"])
+    
+    if daily_rows and daily:
+        _upsert(session, UsageRollup, ("day", "provider", "model"), DAILY_SUMS, list(daily_rows.values()))
+    if chats:
+        _upsert(session, ChatUsage, ("chat_id", "day", "provider", "model"), CHAT_SUMS, list(chats.values()),
+                latest=("last_at",))
+
+def _totals(row) -> Dict[str, Any]:
+    requests = row.requests or 0
+    return {
+        "requests": requests,
+        "tokens_used": row.tokens_used or 0,
+        "cost_usd": row.cost_usd or 0.0,
+        "mean_latency_ms": (row.latency_ms_total or 0.0) / requests if requests else None,
+        "cache_hits": row.cache_hits or 0,
+        "cost_saved_usd": row.cost_saved_usd or 0.0
+    }
+
+def usage_stats(session: Session, start: Optional[date] = None, end: Optional[date] = None,
+                group_by: Sequence[str] = ("model",), provider: Optional[str] = None,
+                model: Optional[str] = None) -> Dict[str, Any]:
+    """Usage between ``start`` and ``end`` (inclusive UTC days), in total
+    and per ``group_by`` combination, read from the daily rollups only"""
+    filters = []
+    if start is not None:
+        filters.append(UsageRollup.day >= start)
+    if end is not None:
+        filters.append(UsageRollup.day <= end)
+    if provider is not None:
+        filters.append(UsageRollup.provider == provider)
+    if model is not None:
+        filters.append(UsageRollup.model == model)
+    sums = [func.sum(getattr(UsageRollup, name)).label(name) for name in DAILY_SUMS]
+    groups = [GROUP_COLUMNS[name].label(name) for name in group_by]
+    
+    total = session.execute(select(*sums).where(*filters)).one()
+    rows = session.execute(
+        select(*groups, *sums).where(*filters).group_by(*groups).order_by(*groups)
+    ).all() if groups else []
+    return {
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        "total": _totals(total),
+        "groups": [
+            {
+                **{name: getattr(row, name).isoformat() if name == "day" else getattr(row, name) for name in group_by},
+                **_totals(row)
+            }
+            for row in rows
+        ]
+    }
+
+def chat_usage(session: Session, chat_id: int, start: Optional[date] = None, end: Optional[date] = None,
+               provider: Optional[str] = None, model: Optional[str] = None) -> Dict[str, Any]:
+    """A chat's usage per model between ``start`` and ``end`` (inclusive
+    UTC days), read from the per-chat rollups"""
+    filters = [ChatUsage.chat_id == chat_id]
+    if start is not None:
+        filters.append(ChatUsage.day >= start)
+    if end is not None:
+        filters.append(ChatUsage.day <= end)
+    if provider is not None:
+        filters.append(ChatUsage.provider == provider)
+    if model is not None:
+        filters.append(ChatUsage.model == model)
+    rows = session.execute(
+        select(
+            ChatUsage.model,
+            *[func.sum(getattr(ChatUsage, name)).label(name) for name in CHAT_SUMS],
+            func.max(ChatUsage.last_at).label("last_at")
+        )
+        .where(*filters)
+        .group_by(ChatUsage.model)
+        .order_by(ChatUsage.model)
+    ).all()
+    models = {
+        row.model: {
+            "requests": row.requests,
+            "tokens_used": row.tokens_used,
+            "cost_usd": row.cost_usd,
+            "last_at": row.last_at.isoformat() if row.last_at else None
+        }
+        for row in rows
+    }
+    return {
+        "chat_id": chat_id,
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        "requests": sum(m["requests"] for m in models.values()),
+        "tokens_used": sum(m["tokens_used"] for m in models.values()),
+        "cost_usd": sum(m["cost_usd"] for m in models.values()),
+        "models": models
+    }
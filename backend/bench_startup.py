@@ -0,0 +1,4 @@
+from app.bench.startup import main
+
+if __name__ == "__main__":
+    main()
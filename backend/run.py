@@ -1,11 +1,56 @@
+import argparse
+import os
+import shutil
+import tempfile
 import uvicorn
+from app.core.config import get_settings
+
+settings = get_settings()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the OneTap API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=51692)
+    parser.add_argument(
+        "--workers", type=int, default=settings.WORKERS,
+        help="worker processes; more than one disables auto-reload "
+             "(set SHARED_STATE_BACKEND=redis so workers share state)"
+    )
+    return parser.parse_args()
+
+def prepare_workers(workers: int):
+    """Settings and metrics setup that must happen before workers are spawned"""
+    # Workers read WORKERS to take their share of the provider quotas
+    os.environ["WORKERS"] = str(workers)
+
+    # Each worker writes its metrics to this directory and /metrics
+    # aggregates them; it must start empty
+    metrics_dir = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "onetap-metrics")
+    )
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+    # Bring the schema up to date once, not concurrently from every worker
+    from app.core.database import init_db
+    init_db()
+    os.environ["SCHEMA_CHECK_ON_STARTUP"] = "false"
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.workers > 1:
+        prepare_workers(args.workers)
+        if settings.SHARED_STATE_BACKEND != "redis":
+            print("Warning: SHARED_STATE_BACKEND is not redis; router statistics "
+                  "and chat context caches stay per worker")
+
     uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=51692,
-        reload=True,
+        "app.main:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        reload=args.workers == 1,
+        workers=args.workers,
         ws_ping_interval=None,
         ws_ping_timeout=None
-    )
\ No newline at end of file
+    )
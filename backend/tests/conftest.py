@@ -0,0 +1,25 @@
+import os
+import tempfile
+import pytest
+
+# Settings are read when app modules are imported; keep the default
+# database files out of the working directory
+_data_dir = tempfile.mkdtemp(prefix="onetap-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_data_dir, 'onetap.db')}")
+os.environ.setdefault("RESPONSE_CACHE_SQLITE_PATH", os.path.join(_data_dir, "response_cache.db"))
+os.environ.setdefault("TELEMETRY_DATABASE_URL", f"sqlite:///{os.path.join(_data_dir, 'api_calls.db')}")
+
+@pytest.fixture
+def engine(tmp_path):
+    """A SQLite database with the current schema"""
+    from sqlalchemy import create_engine
+    from app.models.models import Base
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def session_factory(engine):
+    from sqlalchemy.orm import sessionmaker
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
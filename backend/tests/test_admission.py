@@ -0,0 +1,163 @@
+import asyncio
+from datetime import date, datetime
+from types import SimpleNamespace
+import pytest
+from app.core.config import get_settings
+from app.models.models import ChatUsage, UsageRollup
+from app.services.admission import MESSAGE_OVERHEAD_TOKENS, AdmissionController, BudgetExceeded, Tokenizer
+from app.services.model_registry import RegistrySnapshot
+from app.services.resilience import CircuitBreaker
+
+settings = get_settings()
+
+MODELS = [
+    {"name": "premium", "provider": "openai", "capabilities": ["general"], "priority": 5,
+     "input_price_per_1k": 0.01, "output_price_per_1k": 0.03},
+    {"name": "cheap", "provider": "openai", "capabilities": ["general"], "priority": 1,
+     "input_price_per_1k": 0.001, "output_price_per_1k": 0.002},
+]
+
+# 400 characters count as 100 tokens with the heuristic
+QUERY = [{"role": "user", "content": "x" * 400}]
+INPUT_TOKENS = 100 + MESSAGE_OVERHEAD_TOKENS
+
+class FakeRouter:
+    def __init__(self, ranked=("premium", "cheap")):
+        self._ranked = ranked
+        self.breakers = {name: CircuitBreaker() for name in ranked}
+    
+    def ranked(self, task_type):
+        return self._ranked
+
+def controller(session_factory=None, daily=0.0, chat=0.0) -> AdmissionController:
+    registry = SimpleNamespace(snapshot=RegistrySnapshot(MODELS))
+    admission = AdmissionController(
+        registry, FakeRouter(), Tokenizer("heuristic"),
+        chat_budget_usd=chat, daily_budget_usd=daily, session_factory=session_factory
+    )
+    admission.enabled = True
+    return admission
+
+def worst(model: str, output_tokens: int = settings.DEFAULT_MAX_OUTPUT_TOKENS) -> float:
+    return controller().worst_case(model, INPUT_TOKENS, output_tokens)
+
+def test_without_a_budget_calls_keep_the_adaptive_cap():
+    admission = controller()
+    for _ in range(settings.ADMISSION_OUTPUT_MIN_SAMPLES):
+        admission.record_output("general", 400)
+    cap = int(400 * settings.ADMISSION_OUTPUT_HEADROOM)
+    admitted = admission.admit(QUERY, "premium", "general")
+    assert admitted.model == "premium"
+    assert admitted.max_tokens == cap
+    assert admitted.reserved_usd == 0.0
+    assert admission.admit_bulk(["x" * 400], "premium", "general").max_tokens == cap
+    
+    admission.enabled = False
+    admission.daily_budget_usd = 1.0
+    assert admission.admit(QUERY, "premium", "general").max_tokens == cap
+
+def test_a_call_within_budget_is_admitted_and_reserved():
+    admission = controller(daily=1.0)
+    admitted = admission.admit(QUERY, "premium", "general")
+    assert admitted.model == "premium"
+    assert admitted.max_tokens == settings.DEFAULT_MAX_OUTPUT_TOKENS
+    assert admitted.input_tokens == INPUT_TOKENS
+    assert admitted.reserved_usd == pytest.approx(worst("premium"))
+    assert admission.remaining() == pytest.approx(1.0 - worst("premium"))
+
+def test_downgrades_to_a_model_that_fits():
+    admission = controller(daily=worst("premium") / 2)
+    assert admission.admit(QUERY, "premium", "general").model == "cheap"
+
+def test_concurrent_reservations_share_the_budget():
+    admission = controller(daily=worst("premium") * 1.5)
+    first = admission.admit(QUERY, "premium", "general")
+    second = admission.admit(QUERY, "premium", "general")
+    assert (first.model, second.model) == ("premium", "cheap")
+
+def test_caps_output_when_no_model_fits():
+    budget = worst("cheap", 500)
+    admission = controller(daily=budget)
+    admitted = admission.admit(QUERY, "cheap", "general")
+    assert admitted.model == "cheap"
+    assert admitted.max_tokens == 500
+    assert admitted.reserved_usd <= budget
+
+def test_rejects_when_even_the_minimum_output_does_not_fit():
+    admission = controller(daily=worst("cheap", settings.ADMISSION_MIN_OUTPUT_TOKENS) * 0.9)
+    with pytest.raises(BudgetExceeded):
+        admission.admit(QUERY, "premium", "general")
+    assert admission.remaining() == pytest.approx(admission.daily_budget_usd)
+
+def test_models_with_an_open_circuit_are_not_downgraded_to():
+    admission = controller(daily=worst("premium") / 2)
+    admission.router.breakers["cheap"].opened_at = float("inf")
+    admitted = admission.admit(QUERY, "premium", "general")
+    assert admitted.model == "premium"
+    assert admitted.max_tokens < settings.DEFAULT_MAX_OUTPUT_TOKENS
+
+def test_settle_replaces_the_reservation_with_the_actual_cost():
+    admission = controller(daily=1.0)
+    admitted = admission.admit(QUERY, "premium", "general")
+    admission.settle(admitted, 0.002, 300)
+    assert admitted.reserved_usd == 0.0
+    assert admission.remaining() == pytest.approx(0.998)
+    # Settling twice does not release the reservation again
+    admission.settle(admitted)
+    assert admission.remaining() == pytest.approx(0.998)
+
+def test_output_cap_follows_recent_replies():
+    admission = controller(daily=1.0)
+    for _ in range(settings.ADMISSION_OUTPUT_MIN_SAMPLES - 1):
+        admission.record_output("general", 400)
+    assert admission.output_cap("general") == settings.DEFAULT_MAX_OUTPUT_TOKENS
+    admission.record_output("general", 400)
+    assert admission.output_cap("general") == int(400 * settings.ADMISSION_OUTPUT_HEADROOM)
+    assert admission.output_cap("math") == settings.DEFAULT_MAX_OUTPUT_TOKENS
+    assert admission.admit(QUERY, "premium", "general").max_tokens == int(400 * settings.ADMISSION_OUTPUT_HEADROOM)
+
+def test_truncated_replies_do_not_lower_the_cap():
+    admission = controller(daily=1.0)
+    for _ in range(settings.ADMISSION_OUTPUT_MIN_SAMPLES * 2):
+        admission.record_output("general", 300, truncated=True)
+    assert admission.output_cap("general") == settings.DEFAULT_MAX_OUTPUT_TOKENS
+    admitted = admission.admit(QUERY, "premium", "general")
+    admission.settle(admitted, 0.01, admitted.max_tokens, truncated=True)
+    assert admission.output_cap("general") == settings.DEFAULT_MAX_OUTPUT_TOKENS
+
+def test_bulk_admission_reserves_the_whole_batch():
+    admission = controller(daily=1.0)
+    admitted = admission.admit_bulk(["x" * 400] * 10, "premium", "general", price_factor=0.5)
+    assert admitted.max_tokens == settings.DEFAULT_MAX_OUTPUT_TOKENS
+    assert admitted.reserved_usd == pytest.approx(worst("premium") * 10 * 0.5)
+    with pytest.raises(BudgetExceeded):
+        admission.admit_bulk(["x" * 400] * 100, "premium", "general")
+
+def test_chat_budget_is_seeded_from_recorded_usage(session_factory):
+    with session_factory() as session:
+        session.add_all([
+            ChatUsage(chat_id=7, day=date(2026, 1, 1), provider="openai", model="premium", requests=3, tokens_used=900, cost_usd=0.6, last_at=datetime.utcnow()),
+            ChatUsage(chat_id=7, day=date(2026, 1, 2), provider="openai", model="cheap", requests=1, tokens_used=100, cost_usd=0.3, last_at=datetime.utcnow()),
+        ])
+        session.commit()
+    admission = controller(session_factory, chat=1.0)
+    asyncio.run(admission.ensure_chat(7))
+    assert admission.remaining(7) == pytest.approx(0.1)
+    assert admission.remaining(8) == pytest.approx(1.0)
+    admitted = admission.admit(QUERY, "premium", "general", chat_id=7)
+    admission.settle(admitted, 0.05)
+    assert admission.remaining(7) == pytest.approx(0.05)
+
+def test_sync_raises_daily_spend_to_the_rollups(session_factory):
+    with session_factory() as session:
+        session.add(UsageRollup(day=datetime.utcnow().date(), provider="openai", model="premium",
+                                requests=10, tokens_used=5000, cost_usd=0.4))
+        session.commit()
+    admission = controller(session_factory, daily=1.0)
+    admission.record_spend(0.1)
+    asyncio.run(admission.sync())
+    assert admission.remaining() == pytest.approx(0.6)
+    # Spend already above the rollup's total is kept
+    admission.record_spend(0.5)
+    asyncio.run(admission.sync())
+    assert admission.remaining() == pytest.approx(0.1)
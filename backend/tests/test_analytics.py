@@ -0,0 +1,91 @@
+import pyarrow as pa
+import pytest
+from app.services import analytics
+from app.services.analytics import answer, csv_to_arrow, open_table, plan, profile, run_query
+
+SALES = pa.table({
+    "region": ["west", "east", "West", "north", "east", "west"],
+    "units": [10, 5, 7, 1, 3, 2],
+    "price": [2.0, 4.0, 2.5, 10.0, 4.0, 3.0],
+})
+
+@pytest.fixture
+def sales_csv(tmp_path):
+    path = tmp_path / "sales.csv"
+    path.write_text(
+        "region,units,price\n"
+        + "".join(f"{r},{u},{p}\n" for r, u, p in zip(*(SALES[c].to_pylist() for c in SALES.column_names)))
+    )
+    return str(path)
+
+def test_csv_round_trips_through_arrow(sales_csv, tmp_path):
+    arrow_path = str(tmp_path / "sales.arrow")
+    assert csv_to_arrow(sales_csv, arrow_path) == 6
+    table = open_table(arrow_path)
+    assert table.column_names == ["region", "units", "price"]
+    assert pa.types.is_integer(table["units"].type)
+    assert table["units"].to_pylist() == SALES["units"].to_pylist()
+
+def test_columns_typed_from_the_first_block_fall_back_to_text(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics, "CSV_BLOCK_BYTES", 64)
+    path = tmp_path / "mixed.csv"
+    path.write_text("id,code\n" + "".join(f"{i},{i}\n" for i in range(40)) + "40,A7\n")
+    arrow_path = str(tmp_path / "mixed.arrow")
+    assert csv_to_arrow(str(path), arrow_path) == 41
+    table = open_table(arrow_path)
+    assert pa.types.is_string(table["code"].type)
+    assert table["code"][-1].as_py() == "A7"
+
+def test_profile_summarizes_numbers_and_text():
+    columns = {column["name"]: column for column in profile(SALES)}
+    assert columns["units"]["min"] == 1
+    assert columns["units"]["max"] == 10
+    assert columns["price"]["mean"] == pytest.approx(25.5 / 6, rel=1e-5)
+    assert columns["region"]["distinct"] == 4
+    assert sorted(columns["region"]["top"][:2]) == [["east", 2], ["west", 2]]
+
+def test_plan_without_a_column_mentioned():
+    assert plan("what is in this file?", SALES.schema) is None
+
+def test_plan_groups_and_aggregates():
+    spec = plan("average price by region", SALES.schema)
+    assert spec["group_by"] == ["region"]
+    assert spec["filters"] == []
+    assert spec["metrics"] == [{"column": "price", "fn": "mean"}]
+
+def test_plan_filters_and_counts():
+    spec = plan("how many rows have region = west and units > 2", SALES.schema)
+    assert {"column": "region", "op": "==", "value": "west"} in spec["filters"]
+    assert {"column": "units", "op": ">", "value": "2"} in spec["filters"]
+    assert {"column": None, "fn": "count"} in spec["metrics"]
+
+def test_run_query_groups_sorted_by_the_first_metric():
+    result = run_query(SALES, {
+        "filters": [],
+        "group_by": ["region"],
+        "metrics": [{"column": "units", "fn": "sum"}],
+        "limit": 2
+    })
+    assert result.to_pylist() == [
+        {"region": "west", "units_sum": 12},
+        {"region": "east", "units_sum": 8},
+    ]
+
+def test_run_query_filters_text_case_insensitively():
+    result = run_query(SALES, {
+        "filters": [{"column": "region", "op": "==", "value": "WEST"}, {"column": "units", "op": ">=", "value": "7"}],
+        "group_by": [],
+        "metrics": [{"column": "units", "fn": "sum"}, {"column": None, "fn": "count"}]
+    })
+    assert result.to_pylist() == [{"units_sum": 17, "count_all": 2}]
+
+def test_answer_reports_the_computed_result(sales_csv, tmp_path):
+    arrow_path = str(tmp_path / "sales.arrow")
+    rows = csv_to_arrow(sales_csv, arrow_path)
+    text = answer(arrow_path, "total units by region", profile(open_table(arrow_path)), rows, max_chars=10000)
+    assert text.startswith("6 rows, 3 columns")
+    assert "Computed over all rows: sum(units) grouped by region" in text
+    assert "west,12" in text
+    
+    short = answer(arrow_path, "total units by region", profile(open_table(arrow_path)), rows, max_chars=20)
+    assert short.endswith("\n[truncated]")
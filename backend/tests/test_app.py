@@ -0,0 +1,31 @@
+from fastapi.testclient import TestClient
+from app.core.config import get_settings
+from app.main import create_app
+from app.services import container
+
+settings = get_settings()
+
+def test_app_starts_serves_and_shuts_down(monkeypatch):
+    # No provider is reachable from the tests
+    monkeypatch.setattr(settings, "PROVIDER_WARMUP_CONNECTIONS", 0)
+    app = create_app()
+    services = app.state.services
+    # Building the app only constructs the services; the lifespan starts them
+    assert container.get_services() is services
+    assert services.persistence._writer is None
+    
+    with TestClient(app) as client:
+        assert services.persistence._writer is not None
+        assert services.ai_service._openai_client is not None
+        assert client.get("/").json() == {"message": "Welcome to OneTap AI API"}
+        catalogue = client.get("/api/v1/models").json()
+        assert catalogue["models"]
+        assert client.get("/api/v1/usage").status_code == 200
+        assert client.get("/metrics").status_code == 200
+        # Socket.IO is mounted under /ws
+        assert client.get("/ws/socket.io/", params={"EIO": "4", "transport": "polling"}).status_code == 200
+    
+    assert services.persistence._writer is None
+    assert services.persistence._executor._shutdown
+    assert services.batches._executor._shutdown
+    assert services.file_ingest._pool is None
@@ -0,0 +1,174 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from app.api import batches
+from app.models.models import BatchJob
+from app.services.admission import AdmissionController, Tokenizer
+from app.services.batch import BatchService
+from app.services.container import get_services
+from app.services.model_registry import RegistrySnapshot
+
+MODELS = [{"name": "gpt-4", "provider": "openai", "capabilities": ["general"], "priority": 5,
+           "input_price_per_1k": 0.01, "output_price_per_1k": 0.03}]
+
+class Router:
+    def ranked(self, task_type):
+        return ("gpt-4",)
+    
+    def backup_for(self, task_type, model):
+        return None
+
+class FakeAI:
+    """Answers every prompt at once, except prompts in ``held`` which wait
+    until released"""
+    
+    def __init__(self, name: str = "ai"):
+        self.name = name
+        self.registry = SimpleNamespace(snapshot=RegistrySnapshot(MODELS))
+        self.router = Router()
+        self.admission = AdmissionController(self.registry, self.router, Tokenizer("heuristic"))
+        self.models = self.registry.snapshot.models
+        self.held = set()
+        self.release = asyncio.Event()
+        self.waiting = 0
+    
+    def select_model_for(self, prompt, task_type):
+        return "gpt-4"
+    
+    async def generate_response(self, messages, model, priority=None, job_id=None, max_tokens=None):
+        prompt = messages[-1]["content"]
+        if prompt in self.held:
+            self.waiting += 1
+            await self.release.wait()
+        return {
+            "content": f"{self.name}: {prompt}",
+            "metrics": {"tokens_used": 10, "output_tokens": 5, "truncated": False,
+                        "cost_usd": 0.001, "latency_ms": 1.0}
+        }
+
+def service(session_factory, ai=None, **kwargs) -> BatchService:
+    kwargs.setdefault("write_interval_ms", 5)
+    return BatchService(ai or FakeAI(), session_factory, **kwargs)
+
+def parse(lines):
+    return [json.loads(line) for line in lines]
+
+async def wait_for(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+def test_results_stream_in_order_and_resume_after_a_seq(session_factory):
+    batch = service(session_factory)
+    
+    async def run():
+        job_id = await batch.create_job([(f"p{i}", f"c{i}") for i in range(5)], "general")
+        streamed = parse([line async for line in batch.stream_results(job_id)])
+        resumed = parse([line async for line in batch.stream_results(job_id, after_seq=3, follow=False)])
+        await batch.stop()
+        return streamed, resumed
+    
+    streamed, resumed = asyncio.run(run())
+    assert [line["seq"] for line in streamed[:-1]] == [1, 2, 3, 4, 5]
+    assert sorted(line["custom_id"] for line in streamed[:-1]) == [f"c{i}" for i in range(5)]
+    assert streamed[-1]["type"] == "summary"
+    assert (streamed[-1]["status"], streamed[-1]["completed"], streamed[-1]["last_seq"]) == ("completed", 5, 5)
+    assert [line.get("seq") for line in resumed] == [4, 5, None]
+    assert resumed[-1]["last_seq"] == 5
+    # Nothing is left behind for streams that have ended
+    assert batch._written == {}
+
+def test_cancelled_jobs_keep_their_results_and_resume(session_factory):
+    ai = FakeAI()
+    ai.held = {"slow"}
+    batch = service(session_factory, ai)
+    
+    async def run():
+        job_id = await batch.create_job([("a", None), ("slow", None), ("b", None)], "general")
+        await wait_for(lambda: ai.waiting == 1)
+        await wait_for(lambda: batch._seq.get(job_id) == 2)
+        cancelled = await batch.cancel(job_id)
+        await wait_for(lambda: job_id not in batch._runners)
+        after_cancel = await batch.get_job(job_id)
+        
+        ai.release.set()
+        resumed = await batch.resume(job_id)
+        lines = parse([line async for line in batch.stream_results(job_id, after_seq=2)])
+        await batch.stop()
+        return cancelled, after_cancel, resumed, lines
+    
+    cancelled, after_cancel, resumed, lines = asyncio.run(run())
+    assert cancelled["status"] == "cancelled"
+    assert (after_cancel["status"], after_cancel["completed"]) == ("cancelled", 2)
+    assert resumed["status"] == "pending"
+    assert [(line.get("seq"), line.get("response")) for line in lines] == [(3, "ai: slow"), (None, None)]
+    assert (lines[-1]["status"], lines[-1]["completed"], lines[-1]["failed"]) == ("completed", 3, 0)
+
+def test_a_job_whose_lease_expired_is_taken_over(session_factory):
+    stalled = FakeAI("first")
+    stalled.held = {"p0", "p1"}
+    first = service(session_factory, stalled, lease_s=60)
+    second = service(session_factory, FakeAI("second"), lease_s=60)
+    
+    async def run():
+        job_id = await first.create_job([("p0", None), ("p1", None)], "general")
+        await wait_for(lambda: stalled.waiting == 2)
+        # The first worker stops renewing, e.g. because it hangs
+        with session_factory() as session:
+            session.execute(
+                update(BatchJob).where(BatchJob.id == job_id)
+                .values(lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+            )
+            session.commit()
+        assert await asyncio.to_thread(second._orphaned_jobs) == [job_id]
+        second.start(job_id)
+        lines = parse([line async for line in second.stream_results(job_id)])
+        
+        # The first worker finds out when it next renews, and its results
+        # are dropped
+        held = await first._call(first._extend_lease, job_id)
+        stalled.release.set()
+        await first.stop()
+        job = await second.get_job(job_id)
+        await second.stop()
+        return lines, held, job
+    
+    lines, held, job = asyncio.run(run())
+    assert sorted(line["response"] for line in lines[:-1]) == ["second: p0", "second: p1"]
+    assert held is False
+    assert (job["status"], job["completed"]) == ("completed", 2)
+
+@pytest.fixture
+def client(session_factory):
+    app = FastAPI()
+    app.include_router(batches.router)
+    ai = FakeAI()
+    services = SimpleNamespace(ai_service=ai, batches=service(session_factory, ai))
+    app.dependency_overrides[get_services] = lambda: services
+    with TestClient(app) as client:
+        yield client
+
+def test_ndjson_results_pick_up_after_the_last_seq(client):
+    job = client.post("/api/v1/batches", json={"items": [{"prompt": f"p{i}"} for i in range(4)]}).json()
+    assert job["total"] == 4
+    full = parse(client.get(f"/api/v1/batches/{job['job_id']}/results").text.splitlines())
+    assert [line.get("seq") for line in full] == [1, 2, 3, 4, None]
+    
+    response = client.get(f"/api/v1/batches/{job['job_id']}/results", params={"after": 2, "follow": False})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = parse(response.text.splitlines())
+    assert [line.get("seq") for line in lines] == [3, 4, None]
+    assert lines[-1]["last_seq"] == 4
+
+def test_batch_requests_are_validated(client):
+    assert client.post("/api/v1/batches", json={"items": []}).status_code == 400
+    unknown = client.post("/api/v1/batches", json={"items": [{"prompt": "p"}], "model": "nope"})
+    assert unknown.status_code == 400
+    assert client.get("/api/v1/batches/missing/results").status_code == 404
+    assert client.post("/api/v1/batches/missing/cancel").status_code == 404
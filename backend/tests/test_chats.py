@@ -0,0 +1,67 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from app.api.chats import decode_cursor, encode_cursor, list_chats, list_messages
+from app.models.models import Chat, Message
+
+T0 = datetime(2025, 1, 1, 12, 0, 0)
+
+def page_through(fetch, limit: int) -> list:
+    """Every item of a listing, following next_cursor"""
+    items, cursor, pages = [], None, 0
+    while True:
+        body = json.loads(fetch(limit=limit, cursor=cursor).body)
+        items.extend(body["items"])
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return items
+        assert pages < 100
+
+def test_cursor_round_trip():
+    stamp = datetime(2025, 1, 1, 12, 0, 0, 123456)
+    assert decode_cursor(encode_cursor(stamp, 42)) == (stamp, 42)
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "bm90IGpzb24=", encode_cursor(T0, 1)[:-4]])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+def test_chat_pages_cover_ties_exactly_once(session_factory):
+    with session_factory() as session:
+        # Groups of chats share a timestamp, so only the id orders them
+        session.add_all(Chat(id=i, created_at=T0 + timedelta(seconds=i // 3)) for i in range(1, 11))
+        session.commit()
+        items = page_through(lambda **kw: list_chats(db=session, **kw), limit=2)
+    
+    assert [item["id"] for item in items] == list(range(10, 0, -1))
+
+def test_message_pages_cover_ties_exactly_once(session_factory):
+    with session_factory() as session:
+        session.add_all([Chat(id=1, created_at=T0), Chat(id=2, created_at=T0)])
+        session.add_all(
+            Message(id=i, chat_id=1, role="user" if i % 2 else "assistant", content=f"m{i}",
+                    created_at=T0 + timedelta(microseconds=i // 4))
+            for i in range(1, 14)
+        )
+        session.add(Message(id=100, chat_id=2, role="user", content="other chat", created_at=T0))
+        session.commit()
+        for limit in (1, 3, 5, 50):
+            items = page_through(lambda **kw: list_messages(chat_id=1, db=session, **kw), limit=limit)
+            assert [item["id"] for item in items] == list(range(13, 0, -1))
+    
+    assert items[0]["content"] == "m13"
+    assert items[0]["metadata"] is None
+
+def test_last_full_page_has_no_cursor(session_factory):
+    with session_factory() as session:
+        session.add_all(Chat(id=i, created_at=T0) for i in range(1, 5))
+        session.commit()
+        first = json.loads(list_chats(limit=2, cursor=None, db=session).body)
+        second = json.loads(list_chats(limit=2, cursor=first["next_cursor"], db=session).body)
+    
+    assert [item["id"] for item in first["items"]] == [4, 3]
+    assert [item["id"] for item in second["items"]] == [2, 1]
+    assert second["next_cursor"] is None
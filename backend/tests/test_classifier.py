@@ -0,0 +1,57 @@
+import pytest
+from app.services import classifier
+from app.services.classifier import LABELS, TaskClassifier, evaluate, features, load_classifier, train
+
+@pytest.fixture(scope="module")
+def shipped():
+    return TaskClassifier.load()
+
+@pytest.mark.parametrize("query, label", [
+    ("Solve the equation 3x + 5 = 20 for x", "math"),
+    ("Write a Python function that reverses a linked list", "programming"),
+    ('Translate "good morning" into Spanish', "translation"),
+    ("Write a short poem about the autumn rain", "creative"),
+    ("What is the average revenue per region in this dataset?", "analytics"),
+    ("hi there, how are you?", "general"),
+])
+def test_shipped_weights_classify_clear_queries(shipped, query, label):
+    predicted, confidence = shipped.classify(query)
+    assert predicted == label
+    assert confidence >= 0.6
+
+def test_probabilities_cover_every_label(shipped):
+    probabilities = shipped.probabilities("anything at all")
+    assert len(probabilities) == len(LABELS)
+    assert sum(probabilities) == pytest.approx(1.0)
+
+def test_features_read_only_the_end_of_long_text():
+    tail = "solve the equation x + 1 = 2"
+    assert features("lorem ipsum " * 100 + tail, 1024, max_chars=len(tail)) == features(tail, 1024, max_chars=len(tail))
+    assert all(0 <= bucket < 64 for bucket in features("some query text", 64))
+
+def test_load_classifier_degrades_to_none(tmp_path, monkeypatch):
+    assert load_classifier(str(tmp_path / "missing.json")) is None
+    broken = tmp_path / "broken.json"
+    broken.write_text("{not json")
+    assert load_classifier(str(broken)) is None
+    monkeypatch.setattr(classifier.settings, "TASK_CLASSIFIER_ENABLED", False)
+    assert load_classifier() is None
+
+def test_trained_weights_survive_a_save_and_load(tmp_path):
+    examples = [
+        ("integrate x squared", "math"), ("what is 12 * 7", "math"), ("solve for y: 2y = 8", "math"),
+        ("fix this javascript error", "programming"), ("write a sql query", "programming"),
+        ("debug my python class", "programming"),
+    ]
+    model = train(examples, labels=("math", "programming"), buckets=4096, epochs=20)
+    report = evaluate(model, examples, min_confidence=0.5)
+    assert report["accuracy"] == 1.0
+    assert report["examples"] == 6
+    
+    path = str(tmp_path / "weights.json")
+    model.save(path)
+    loaded = TaskClassifier.load(path)
+    assert loaded.labels == ("math", "programming")
+    for text, label in examples:
+        assert loaded.classify(text)[0] == label
+        assert loaded.classify(text)[1] == pytest.approx(model.classify(text)[1], abs=1e-3)
@@ -0,0 +1,121 @@
+import asyncio
+import time
+from app.core import shared_state
+from app.core.shared_state import LocalState
+from app.services import context
+from app.services.context import ChatWindow, ContextBuilder, build_messages, estimate_tokens
+from app.services.persistence import PersistenceService
+
+def turn(role: str, content: str) -> dict:
+    return {"role": role, "content": content}
+
+def test_estimate_tokens_counts_overhead():
+    assert estimate_tokens("") == 4
+    assert estimate_tokens("x" * 40) == 14
+
+def test_without_history_only_the_query_is_sent():
+    assert build_messages([], "hello", 100) == [turn("user", "hello")]
+
+def test_keeps_the_most_recent_turns_that_fit():
+    history = [
+        turn("user", "a" * 40),
+        turn("assistant", "b" * 40),
+        turn("user", "c" * 40),
+        turn("assistant", "d" * 40),
+    ]
+    # Each turn costs 14 tokens
+    assert build_messages(history, "next", 28) == [
+        turn("user", "c" * 40),
+        turn("assistant", "d" * 40),
+        turn("user", "next"),
+    ]
+    assert build_messages(history, "next", 56) == history + [turn("user", "next")]
+
+def test_a_leading_assistant_turn_is_dropped():
+    history = [turn("user", "a" * 40), turn("assistant", "b" * 40), turn("user", "c" * 40), turn("assistant", "d" * 40)]
+    # Three turns fit, but the oldest of them is the assistant's
+    assert build_messages(history, "next", 42) == [
+        turn("user", "c" * 40),
+        turn("assistant", "d" * 40),
+        turn("user", "next"),
+    ]
+
+def test_the_query_is_sent_even_over_budget():
+    assert build_messages([turn("user", "a" * 400)], "next", 10) == [turn("user", "next")]
+
+def test_consecutive_turns_of_one_role_are_merged():
+    history = [turn("user", "first"), turn("user", "second")]
+    assert build_messages(history, "third", 100) == [turn("user", "first\n\nsecond\n\nthird")]
+    # The caller's history is left as it was
+    assert history == [turn("user", "first"), turn("user", "second")]
+
+def test_chat_window_is_bounded_by_messages_and_tokens():
+    window = ChatWindow(max_messages=3, max_tokens=100)
+    for i in range(5):
+        window.append("user", str(i))
+    assert [m["content"] for m in window.messages()] == ["2", "3", "4"]
+    assert window.tokens == 3 * estimate_tokens("0")
+    
+    window = ChatWindow(max_messages=10, max_tokens=30)
+    window.append("user", "a" * 40)
+    window.append("assistant", "b" * 40)
+    window.append("user", "c" * 40)
+    assert [m["content"] for m in window.messages()] == ["b" * 40, "c" * 40]
+    assert window.tokens == 28
+
+def test_chat_window_keeps_the_latest_turn_even_over_budget():
+    window = ChatWindow(max_messages=10, max_tokens=10)
+    window.append("user", "a" * 400)
+    assert len(window.messages()) == 1
+
+def test_local_counters_are_bounded_and_expire(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(shared_state.time, "monotonic", lambda: clock[0])
+    state = LocalState(max_counters=2)
+    
+    async def run():
+        await state.incr("a")
+        await state.incr("b", ttl=10)
+        await state.get_int("a")
+        await state.incr("c")
+        # "b" was used least recently
+        assert [await state.get_int(key) for key in ("a", "b", "c")] == [1, 0, 1]
+        await state.incr("d", ttl=10)
+        clock[0] += 8
+        # Reading a counter renews its expiry
+        assert await state.get_int("d", ttl=10) == 1
+        clock[0] += 8
+        assert await state.get_int("d") == 1
+        clock[0] += 10
+        assert await state.get_int("d") == 0
+    
+    asyncio.run(run())
+
+def test_windows_unchecked_past_the_version_ttl_are_reloaded(session_factory, monkeypatch):
+    # The event loop reads the same clock, so it keeps running
+    skipped, monotonic = [0.0], time.monotonic
+    monkeypatch.setattr(time, "monotonic", lambda: monotonic() + skipped[0])
+    state = LocalState()
+    
+    async def run():
+        persistence = PersistenceService(session_factory, flush_interval_ms=1)
+        builder = ContextBuilder(persistence, state, version_ttl=60)
+        await persistence.start()
+        chat_id = await persistence.new_chat()
+        persistence.add_message(chat_id, "user", "hello")
+        await persistence.flush()
+        await asyncio.gather(*builder._pending_versions)
+        assert await state.get_int(f"chat:{chat_id}:version") == 1
+        assert await builder.history(chat_id) == [turn("user", "hello")]
+        
+        # A turn this worker did not see, written after the count expired
+        skipped[0] += 61
+        with session_factory() as session:
+            session.add(context.Message(chat_id=chat_id, role="assistant", content="hi"))
+            session.commit()
+        await state.incr(f"chat:{chat_id}:version", 1)
+        history = await builder.history(chat_id)
+        await persistence.stop()
+        return history
+    
+    assert asyncio.run(run()) == [turn("user", "hello"), turn("assistant", "hi")]
@@ -0,0 +1,100 @@
+import asyncio
+import io
+import os
+from types import SimpleNamespace
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+from app.api import files
+from app.services.container import get_services
+from app.services.file_ingest import FileIngestService, UploadError, UploadTooLarge
+
+CSV = b"region,units\nwest,10\neast,5\nwest,7\n"
+
+async def chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+def png(width: int = 64, height: int = 32) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+@pytest.fixture
+def ingest(tmp_path):
+    service = FileIngestService(str(tmp_path / "uploads"), max_bytes=1024, workers=1)
+    yield service
+    service.shutdown()
+
+def test_identical_uploads_share_one_file(ingest):
+    async def run():
+        first = await ingest.save("a.csv", chunks(CSV[:10], CSV[10:]))
+        second = await ingest.save("B.CSV", chunks(CSV))
+        return first, second
+    
+    first, second = asyncio.run(run())
+    assert first["file_id"] == second["file_id"]
+    assert (first["kind"], first["size"]) == ("csv", len(CSV))
+    assert os.listdir(ingest.upload_dir) == [first["file_id"] + ".csv"]
+
+def test_oversized_and_unsupported_uploads_are_rejected(ingest):
+    async def run():
+        with pytest.raises(UploadTooLarge):
+            await ingest.save("big.csv", chunks(b"x" * 1000, b"x" * 1000))
+        with pytest.raises(UploadError) as rejected:
+            await ingest.save("notes.txt", chunks(b"hello"))
+        return rejected.value
+    
+    rejected = asyncio.run(run())
+    assert not isinstance(rejected, UploadTooLarge)
+    # The partial file of the oversized upload is removed
+    assert os.listdir(ingest.upload_dir) == []
+
+def test_attachments_are_parsed_in_the_process_pool(ingest):
+    async def run():
+        table = await ingest.save("sales.csv", chunks(CSV))
+        image = await ingest.save("logo.png", chunks(png()))
+        results = await asyncio.gather(ingest.extract(table["file_id"]), ingest.extract(image["file_id"]))
+        context = await ingest.context_for([
+            {"fileId": table["file_id"], "filename": "sales.csv"},
+            {"fileId": "0" * 64, "filename": "gone.csv"},
+        ])
+        return table, image, results, context
+    
+    table, image, (table_result, image_result), context = asyncio.run(run())
+    assert ingest._pool is not None
+    assert (table_result["status"], table_result["meta"]["rows"]) == ("ready", 3)
+    assert [c["name"] for c in table_result["meta"]["columns"]] == ["region", "units"]
+    assert image_result["status"] == "ready"
+    assert (image_result["meta"]["width"], image_result["meta"]["height"]) == (64, 32)
+    assert os.path.exists(os.path.join(ingest.upload_dir, image_result["meta"]["preview"]))
+    assert context.startswith("[Attachment: sales.csv (csv)]")
+    # Unknown files are left out
+    assert "gone.csv" not in context
+    
+    # Another worker reads the cached extraction without parsing again
+    other = FileIngestService(ingest.upload_dir, workers=1)
+    assert other.status(table["file_id"]) == table_result
+    assert other._pool is None
+
+@pytest.fixture
+def client(ingest):
+    app = FastAPI()
+    app.include_router(files.router)
+    app.dependency_overrides[get_services] = lambda: SimpleNamespace(file_ingest=ingest)
+    with TestClient(app) as client:
+        yield client
+
+def test_upload_api_status_codes(client):
+    uploaded = client.post("/api/v1/files", params={"filename": "sales.csv"}, content=CSV)
+    assert uploaded.status_code == 200
+    assert client.get(f"/api/v1/files/{uploaded.json()['file_id']}").status_code == 200
+    assert client.get(f"/api/v1/files/{'0' * 64}").status_code == 404
+    
+    assert client.post("/api/v1/files", params={"filename": "notes.txt"}, content=b"hello").status_code == 400
+    # Declared too large, and too large once streamed without a length
+    assert client.post("/api/v1/files", params={"filename": "big.csv"}, content=b"x" * 2000).status_code == 413
+    streamed = client.post("/api/v1/files", params={"filename": "big.csv"},
+                           content=iter([b"x" * 1000, b"x" * 1000]))
+    assert streamed.status_code == 413
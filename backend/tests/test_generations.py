@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+from app.services.generations import ChunkStream, GenerationTracker, TooManyGenerations
+
+class Client:
+    """Collects the chunks a stream emits; ``queued`` stands in for the socket's backlog"""
+    
+    def __init__(self):
+        self.chunks = []
+        self.queued = 0
+    
+    async def emit(self, text, seq):
+        self.chunks.append((seq, text))
+
+def test_chunks_arrive_in_order_and_the_rest_is_flushed_on_close():
+    client = Client()
+    
+    async def run():
+        stream = ChunkStream(client.emit, lambda: client.queued, interval_ms=5)
+        for token in ("a", "b", "c"):
+            await stream.push(token)
+        await asyncio.sleep(0.03)
+        for token in ("d", "e"):
+            await stream.push(token)
+        await stream.close()
+        return stream
+    
+    stream = asyncio.run(run())
+    # Tokens arriving within an interval are coalesced into one chunk
+    assert client.chunks == [(0, "abc"), (1, "de")]
+    assert stream.text == "abcde"
+
+def test_a_backed_up_socket_holds_chunks_back():
+    client = Client()
+    client.queued = 10
+    
+    async def run():
+        stream = ChunkStream(client.emit, lambda: client.queued, max_backlog=4, interval_ms=1)
+        await stream.push("a")
+        await stream.push("b")
+        await asyncio.sleep(0.02)
+        held = list(client.chunks)
+        client.queued = 0
+        await stream.push("c")
+        await stream.close()
+        return held
+    
+    assert asyncio.run(run()) == []
+    assert client.chunks == [(0, "abc")]
+
+def test_overflow_stops_streaming_but_keeps_the_text():
+    client = Client()
+    client.queued = 10
+    
+    async def run():
+        stream = ChunkStream(client.emit, lambda: client.queued, max_chars=5, max_backlog=4, interval_ms=1)
+        for token in ("abc", "def", "ghi"):
+            await stream.push(token)
+        await stream.close()
+        return stream
+    
+    stream = asyncio.run(run())
+    assert stream.overflowed
+    assert client.chunks == []
+    assert stream.text == "abcdefghi"
+
+async def forever(started: asyncio.Event):
+    started.set()
+    await asyncio.Event().wait()
+
+def test_a_new_message_supersedes_the_chat_generation():
+    tracker = GenerationTracker(max_inflight=2)
+    
+    async def run():
+        started = asyncio.Event()
+        first = tracker.start("sid", 1, forever(started))
+        await started.wait()
+        second = tracker.start("sid", 1, forever(asyncio.Event()))
+        with pytest.raises(asyncio.CancelledError):
+            await first.task
+        assert tracker.inflight("sid") == 1
+        tracker.cancel("sid")
+        with pytest.raises(asyncio.CancelledError):
+            await second.task
+        return first, second
+    
+    first, second = asyncio.run(run())
+    assert first.reason == "superseded"
+    assert second.reason == "cancelled"
+    assert tracker.inflight("sid") == 0
+
+def test_generations_per_socket_are_limited():
+    tracker = GenerationTracker(max_inflight=2)
+    
+    async def run():
+        generations = [tracker.start("sid", chat_id, forever(asyncio.Event())) for chat_id in (1, 2)]
+        with pytest.raises(TooManyGenerations):
+            tracker.start("sid", 3, forever(asyncio.Event()))
+        # Other sockets have limits of their own
+        other = tracker.start("other", 3, forever(asyncio.Event()))
+        assert tracker.cancel("sid", 2, reason="disconnect") == 1
+        assert tracker.cancel("sid", 5) == 0
+        await asyncio.gather(generations[1].task, return_exceptions=True)
+        assert tracker.inflight("sid") == 1
+        assert tracker.cancel("sid") + tracker.cancel("other") == 2
+        await asyncio.gather(*(g.task for g in generations + [other]), return_exceptions=True)
+        return generations
+    
+    generations = asyncio.run(run())
+    assert [g.reason for g in generations] == ["cancelled", "disconnect"]
@@ -0,0 +1,169 @@
+import json
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+from app.core.migrations import MIGRATIONS, run_migrations
+from app.models import models
+
+# The schema as the first release created it, before any migration
+BASELINE_SCHEMA = [
+    "CREATE TABLE chats (id INTEGER PRIMARY KEY, created_at DATETIME)",
+    "CREATE INDEX ix_chats_id ON chats (id)",
+    "CREATE TABLE messages (id INTEGER PRIMARY KEY, chat_id INTEGER REFERENCES chats (id), content TEXT, "
+    "role VARCHAR, model VARCHAR, created_at DATETIME, message_metadata JSON)",
+    "CREATE INDEX ix_messages_id ON messages (id)",
+    "CREATE TABLE ai_models (id INTEGER PRIMARY KEY, name VARCHAR UNIQUE, provider VARCHAR, "
+    "model_id VARCHAR, capabilities JSON, priority INTEGER)",
+]
+
+LONG_REPLY = "The quick brown fox jumps over the lazy dog. " * 40
+
+REPLY_METADATA = {
+    "provider": "openai",
+    "metrics": {"tokens_used": 120, "cost_usd": 0.003, "latency_ms": 800.0,
+                "time_to_first_token_ms": 150.0, "queue_wait_ms": 2.5}
+}
+
+def insert_baseline_rows(conn):
+    conn.execute(text("INSERT INTO chats (id, created_at) VALUES (1, '2025-01-01 10:00:00'), (2, '2025-01-02 09:00:00')"))
+    conn.execute(
+        text("INSERT INTO messages (id, chat_id, content, role, model, created_at, message_metadata) "
+             "VALUES (:id, :chat_id, :content, :role, :model, :created_at, :metadata)"),
+        [
+            {"id": 1, "chat_id": 1, "content": "hello", "role": "user", "model": None,
+             "created_at": "2025-01-01 10:00:00", "metadata": None},
+            {"id": 2, "chat_id": 1, "content": LONG_REPLY, "role": "assistant", "model": "gpt-4",
+             "created_at": "2025-01-01 10:00:01", "metadata": json.dumps(REPLY_METADATA)},
+            {"id": 3, "chat_id": 1, "content": "short reply", "role": "assistant", "model": "gpt-4",
+             "created_at": "2025-01-01 10:05:00",
+             "metadata": json.dumps({"provider": "openai", "metrics": {"tokens_used": 30, "cost_usd": 0.001}})},
+            {"id": 4, "chat_id": 2, "content": "bonjour", "role": "assistant", "model": "claude-2.1",
+             "created_at": "2025-01-02 09:00:01",
+             "metadata": json.dumps({"provider": "anthropic", "metrics": {"tokens_used": 50, "cost_usd": 0.002}})},
+        ]
+    )
+    conn.execute(text(
+        "INSERT INTO ai_models (name, provider, model_id, capabilities, priority) VALUES "
+        "('gpt-4', 'openai', 'gpt-4', '[\"general\"]', 5), "
+        "('in-house', 'deepseek', 'deepseek-chat', '[\"general\"]', 1)"
+    ))
+
+def upgrade(engine):
+    """What init_db does on startup"""
+    models.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+@pytest.fixture
+def baseline(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+        insert_baseline_rows(conn)
+    yield engine
+    engine.dispose()
+
+def test_every_migration_is_recorded_once(baseline):
+    upgrade(baseline)
+    upgrade(baseline)
+    with baseline.connect() as conn:
+        versions = [row[0] for row in conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))]
+    assert versions == [version for version, _, _ in MIGRATIONS]
+    assert versions == list(range(1, 9))
+
+def test_upgraded_and_new_databases_share_a_schema(baseline, engine):
+    upgrade(baseline)
+    run_migrations(engine)
+    upgraded, fresh = inspect(baseline), inspect(engine)
+    for table in ("chats", "messages", "ai_models", "usage_rollups_daily", "chat_usage", "id_sequences"):
+        assert {c["name"] for c in upgraded.get_columns(table)} == {c["name"] for c in fresh.get_columns(table)}
+    assert "ix_messages_chat_id_created_at" in {i["name"] for i in upgraded.get_indexes("messages")}
+    assert "ix_chats_created_at" in {i["name"] for i in upgraded.get_indexes("chats")}
+
+def test_chat_ids_continue_after_existing_chats(baseline):
+    upgrade(baseline)
+    with baseline.connect() as conn:
+        assert conn.execute(text("SELECT next_id FROM id_sequences WHERE name = 'chats'")).scalar() == 3
+
+def test_registry_columns_get_defaults_and_seeded_models_capabilities(baseline):
+    upgrade(baseline)
+    with baseline.connect() as conn:
+        rows = {
+            row.name: row for row in conn.execute(text(
+                "SELECT name, capabilities, context_tokens, enabled, input_price_per_1k FROM ai_models"
+            ))
+        }
+    assert json.loads(rows["gpt-4"].capabilities) == ["general", "math", "programming", "analytics"]
+    # Models the operator added keep what they were given
+    assert json.loads(rows["in-house"].capabilities) == ["general"]
+    assert rows["in-house"].context_tokens == 4000
+    assert rows["in-house"].enabled == 1
+    assert rows["in-house"].input_price_per_1k == 0
+
+def test_reply_metrics_move_to_typed_columns(baseline):
+    upgrade(baseline)
+    with baseline.connect() as conn:
+        row = conn.execute(text(
+            "SELECT provider, tokens_used, cost_usd, latency_ms, time_to_first_token_ms, message_metadata "
+            "FROM messages WHERE id = 2"
+        )).one()
+        user_row = conn.execute(text("SELECT provider, tokens_used, message_metadata FROM messages WHERE id = 1")).one()
+    assert (row.provider, row.tokens_used, row.cost_usd, row.latency_ms, row.time_to_first_token_ms) == (
+        "openai", 120, 0.003, 800.0, 150.0
+    )
+    # Metrics without a column of their own stay in the JSON
+    assert json.loads(row.message_metadata) == {"metrics": {"queue_wait_ms": 2.5}}
+    assert tuple(user_row) == (None, None, None)
+
+def test_existing_content_is_compressed_and_reads_back(baseline):
+    upgrade(baseline)
+    with baseline.connect() as conn:
+        stored = dict(conn.execute(text("SELECT id, typeof(content) FROM messages")).all())
+    assert stored == {1: "text", 2: "blob", 3: "text", 4: "text"}
+    with Session(baseline) as session:
+        message = session.get(models.Message, 2)
+        assert message.content == LONG_REPLY
+        assert session.get(models.Message, 1).content == "hello"
+
+def test_usage_rollups_are_seeded_from_stored_replies(baseline):
+    upgrade(baseline)
+    with baseline.connect() as conn:
+        daily = conn.execute(text(
+            "SELECT day, provider, model, requests, tokens_used, cost_usd, latency_ms_total "
+            "FROM usage_rollups_daily ORDER BY day"
+        )).all()
+        chats = conn.execute(text(
+            "SELECT chat_id, day, provider, model, requests, tokens_used, last_at FROM chat_usage ORDER BY chat_id"
+        )).all()
+    assert [tuple(row[:5]) for row in daily] == [
+        ("2025-01-01", "openai", "gpt-4", 2, 150),
+        ("2025-01-02", "anthropic", "claude-2.1", 1, 50),
+    ]
+    assert daily[0].cost_usd == pytest.approx(0.004)
+    assert daily[0].latency_ms_total == 800.0
+    assert [tuple(row[:6]) for row in chats] == [
+        (1, "2025-01-01", "openai", "gpt-4", 2, 150),
+        (2, "2025-01-02", "anthropic", "claude-2.1", 1, 50),
+    ]
+    assert chats[0].last_at.startswith("2025-01-01 10:05:00")
+
+def test_per_chat_usage_keyed_by_model_alone_is_rebuilt(baseline):
+    upgrade(baseline)
+    with baseline.begin() as conn:
+        # The rollup as migration 7 first created it
+        conn.execute(text("DROP TABLE chat_usage"))
+        conn.execute(text(
+            "CREATE TABLE chat_usage (chat_id INTEGER NOT NULL, model VARCHAR NOT NULL, requests INTEGER, "
+            "tokens_used INTEGER, cost_usd FLOAT, last_at DATETIME, PRIMARY KEY (chat_id, model))"
+        ))
+        conn.execute(text("INSERT INTO chat_usage VALUES (1, 'gpt-4', 2, 150, 0.004, '2025-01-01 10:05:00')"))
+        conn.execute(text("DELETE FROM schema_migrations WHERE version = 8"))
+    upgrade(baseline)
+    with baseline.connect() as conn:
+        chats = conn.execute(text(
+            "SELECT chat_id, day, provider, model, requests, tokens_used FROM chat_usage ORDER BY chat_id"
+        )).all()
+    assert [tuple(row) for row in chats] == [
+        (1, "2025-01-01", "openai", "gpt-4", 2, 150),
+        (2, "2025-01-02", "anthropic", "claude-2.1", 1, 50),
+    ]
@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from sqlalchemy import update
+from app.models.models import AIModel
+from app.services.model_registry import DEFAULT_MODELS, ModelRegistry, NoEnabledModels, RegistrySnapshot
+
+def test_snapshot_indexes_enabled_models():
+    snapshot = RegistrySnapshot([
+        {"name": "big", "provider": "openai", "capabilities": ["general", "math"], "priority": 5,
+         "input_price_per_1k": 1.0, "output_price_per_1k": 2.0},
+        {"name": "small", "provider": "openai", "capabilities": ["general"], "priority": 1},
+        {"name": "retired", "provider": "anthropic", "capabilities": ["math"], "priority": 9, "enabled": False},
+    ])
+    assert set(snapshot.entries) == {"big", "small", "retired"}
+    assert set(snapshot.models) == {"big", "small"}
+    assert snapshot.by_capability["general"] == ("big", "small")
+    assert snapshot.by_capability["math"] == ("big",)
+    assert snapshot.cost("big", 1000, 500) == pytest.approx(2.0)
+    assert snapshot.cost("unknown", 1000, 500) == 0.0
+    with pytest.raises(TypeError):
+        snapshot.entries["big"]["priority"] = 1
+
+def test_an_empty_table_is_seeded(session_factory):
+    registry = ModelRegistry(session_factory)
+    assert registry.load()
+    assert set(registry.snapshot.entries) == {model["name"] for model in DEFAULT_MODELS}
+    assert not registry.load()
+
+def test_changes_are_picked_up_and_listeners_called(session_factory):
+    registry = ModelRegistry(session_factory)
+    registry.load()
+    seen = []
+    registry.add_listener(seen.append)
+    with session_factory() as session:
+        session.execute(update(AIModel).where(AIModel.name == "gpt-4").values(enabled=True, priority=9))
+        session.commit()
+    assert asyncio.run(registry.reload())
+    assert seen == [registry.snapshot]
+    assert registry.snapshot.by_capability["math"][0] == "gpt-4"
+
+def test_disabling_every_model_keeps_the_current_catalogue(session_factory):
+    registry = ModelRegistry(session_factory)
+    registry.load()
+    version = registry.snapshot.version
+    with session_factory() as session:
+        session.execute(update(AIModel).values(enabled=False))
+        session.commit()
+    with pytest.raises(NoEnabledModels):
+        registry.load()
+    assert registry.snapshot.version == version
+    assert registry.snapshot.models
@@ -0,0 +1,118 @@
+import asyncio
+import pytest
+from sqlalchemy import func, select
+from app.models.models import Chat, ChatUsage, Message, UsageRollup
+from app.services.persistence import PersistenceService, WriteFailed
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+    
+    def on_chat_created(self, chat_id):
+        self.events.append(("chat", chat_id))
+    
+    def on_message(self, chat_id, role, content):
+        self.events.append((role, chat_id))
+
+def test_queued_rows_are_committed_by_flush(session_factory):
+    recorder = Recorder()
+    
+    async def run():
+        persistence = PersistenceService(session_factory, flush_interval_ms=1, id_block_size=4)
+        persistence.add_listener(recorder)
+        await persistence.start()
+        chat_ids = [await persistence.new_chat() for _ in range(6)]
+        for chat_id in chat_ids:
+            persistence.add_message(chat_id, "user", "question")
+            persistence.add_message(
+                chat_id, "assistant", "answer", model="gpt-4", provider="openai",
+                metrics={"tokens_used": 10, "cost_usd": 0.001, "latency_ms": 100.0, "queue_wait_ms": 1.0}
+            )
+        await persistence.flush()
+        await persistence.stop()
+        return chat_ids
+    
+    chat_ids = asyncio.run(run())
+    assert len(set(chat_ids)) == 6
+    assert recorder.events[:2] == [("chat", chat_ids[0]), ("chat", chat_ids[1])]
+    with session_factory() as session:
+        assert session.execute(select(func.count()).select_from(Chat)).scalar() == 6
+        reply = session.execute(
+            select(Message).where(Message.chat_id == chat_ids[0], Message.role == "assistant")
+        ).scalar_one()
+        assert (reply.provider, reply.tokens_used, reply.cost_usd) == ("openai", 10, 0.001)
+        assert reply.message_metadata == {"metrics": {"queue_wait_ms": 1.0}}
+        # Rollups are written in the same transaction as the replies
+        assert session.execute(select(UsageRollup.requests)).scalar_one() == 6
+        assert session.execute(select(func.count()).select_from(ChatUsage)).scalar() == 6
+
+def test_chat_ids_are_not_reused_across_instances(session_factory):
+    async def allocate():
+        persistence = PersistenceService(session_factory, flush_interval_ms=1, id_block_size=10)
+        await persistence.start()
+        ids = [await persistence.new_chat() for _ in range(3)]
+        await persistence.stop()
+        return ids
+    
+    first = asyncio.run(allocate())
+    second = asyncio.run(allocate())
+    assert not set(first) & set(second)
+
+def test_a_bad_row_does_not_drop_the_rest_of_its_batch(session_factory):
+    async def run():
+        persistence = PersistenceService(session_factory, flush_interval_ms=20, retries=1, retry_delay_ms=1)
+        await persistence.start()
+        chat_id = await persistence.new_chat()
+        await persistence.flush()
+        persistence.add_message(chat_id, "user", "kept")
+        # A second chat row with the same id violates the primary key
+        persistence._enqueue(("chat", {"id": chat_id, "created_at": None}))
+        persistence.add_message(chat_id, "assistant", "also kept")
+        with pytest.raises(WriteFailed):
+            await persistence.flush()
+        # The failure is reported once
+        persistence.add_message(chat_id, "user", "later")
+        await persistence.flush()
+        await persistence.stop()
+        return chat_id
+    
+    chat_id = asyncio.run(run())
+    with session_factory() as session:
+        contents = session.execute(select(Message.content).where(Message.chat_id == chat_id).order_by(Message.id)).scalars().all()
+    assert contents == ["kept", "also kept", "later"]
+
+def test_a_failed_batch_is_retried(session_factory, monkeypatch):
+    persistence = PersistenceService(session_factory, flush_interval_ms=1, retries=2, retry_delay_ms=1)
+    write_batch = persistence._write_batch
+    calls = []
+    
+    def flaky(chats, messages):
+        calls.append(len(chats) + len(messages))
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        write_batch(chats, messages)
+    
+    monkeypatch.setattr(persistence, "_write_batch", flaky)
+    
+    async def run():
+        await persistence.start()
+        chat_id = await persistence.new_chat()
+        persistence.add_message(chat_id, "user", "hello")
+        await persistence.flush()
+        await persistence.stop()
+    
+    asyncio.run(run())
+    assert calls == [2, 2]
+    with session_factory() as session:
+        assert session.execute(select(func.count()).select_from(Message)).scalar() == 1
+
+def test_new_chats_wait_for_ids_off_the_event_loop(session_factory):
+    async def run():
+        persistence = PersistenceService(session_factory, flush_interval_ms=1, id_block_size=2)
+        # Without start() no ids are reserved yet
+        ids = [await persistence.new_chat() for _ in range(5)]
+        await persistence.stop()
+        return ids
+    
+    ids = asyncio.run(run())
+    assert len(set(ids)) == 5
@@ -0,0 +1,78 @@
+import pytest
+from app.services import resilience
+from app.services.resilience import CircuitBreaker, HedgeBudget
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_s=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.available()
+    assert not breaker.allow()
+
+def test_a_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_s=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+def test_half_open_lets_a_single_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_s=10)
+    breaker.record_failure()
+    clock[0] += 10
+    assert breaker.state == "half_open"
+    assert breaker.available()
+    assert breaker.allow()
+    assert not breaker.available()
+    assert not breaker.allow()
+
+def test_a_successful_trial_closes_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_s=10)
+    breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+def test_a_failed_trial_reopens_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_s=10)
+    for _ in range(3):
+        breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock[0] += 9
+    assert breaker.state == "open"
+    clock[0] += 1
+    assert breaker.state == "half_open"
+
+def test_a_released_trial_can_be_claimed_again(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_s=10)
+    breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+def test_hedge_budget_caps_hedges_to_a_share_of_requests():
+    budget = HedgeBudget(ratio=0.25, burst=2)
+    assert budget.try_spend()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    for _ in range(4):
+        budget.earn()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    assert budget.hedges == 3
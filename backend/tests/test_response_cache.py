@@ -0,0 +1,114 @@
+import asyncio
+from app.services import response_cache
+from app.services.response_cache import LRUCache, ResponseCache, SQLiteCacheTier
+
+def response(content: str, cost_usd: float = 0.01) -> dict:
+    return {"content": content, "metrics": {"cost_usd": cost_usd}}
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2, max_bytes=1000, ttl_s=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert len(cache) == 2
+
+def test_lru_is_bounded_by_bytes():
+    cache = LRUCache(max_entries=10, max_bytes=10, ttl_s=60)
+    cache.set("a", "x" * 6)
+    cache.set("b", "y" * 6)
+    assert cache.get("a") is None
+    assert cache.bytes_used == 6
+    # A value larger than the whole cache is not stored at all
+    cache.set("c", "z" * 11)
+    assert cache.get("c") is None
+    assert cache.get("b") == "y" * 6
+
+def test_lru_replacing_a_key_keeps_the_byte_count():
+    cache = LRUCache(max_entries=10, max_bytes=100, ttl_s=60)
+    cache.set("a", "x" * 10)
+    cache.set("a", "x" * 4)
+    assert cache.bytes_used == 4
+    assert len(cache) == 1
+
+def test_lru_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    cache = LRUCache(max_entries=10, max_bytes=100, ttl_s=5)
+    cache.set("a", "1")
+    now[0] += 4
+    assert cache.get("a") == "1"
+    now[0] += 2
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.bytes_used == 0
+
+def test_make_key_ignores_case_and_whitespace():
+    first = ResponseCache.make_key([{"role": "user", "content": "What is  2+2?"}], "gpt-4", "math")
+    second = ResponseCache.make_key([{"role": "user", "content": " what is 2+2? "}], "gpt-4", "math")
+    assert first == second
+    assert first != ResponseCache.make_key([{"role": "user", "content": "What is 2+2?"}], "gpt-4", "general")
+
+def test_miss_then_hit_counts_savings():
+    async def run():
+        cache = ResponseCache()
+        assert await cache.get("k") is None
+        await cache.set("k", response("four", 0.02))
+        cached = await cache.get("k")
+        assert cached == response("four", 0.02)
+        return cache.stats()
+    
+    stats = asyncio.run(run())
+    assert stats == {"cache_hits": 1, "cache_misses": 1, "cache_saved_usd": 0.02}
+
+def test_falls_back_to_the_sqlite_tier(tmp_path):
+    path = str(tmp_path / "cache.db")
+    
+    async def run():
+        writer = ResponseCache(SQLiteCacheTier(path, ttl_s=60))
+        await writer.set("k", response("four"))
+        await writer.aclose()
+        # A fresh process has an empty memory tier
+        reader = ResponseCache(SQLiteCacheTier(path, ttl_s=60))
+        try:
+            assert len(reader.memory) == 0
+            assert await reader.get("k") == response("four")
+            # The hit is promoted into memory
+            assert reader.memory.get("k") is not None
+        finally:
+            await reader.aclose()
+    
+    asyncio.run(run())
+
+def test_expired_sqlite_entries_are_misses(tmp_path):
+    async def run():
+        cache = ResponseCache(SQLiteCacheTier(str(tmp_path / "cache.db"), ttl_s=-1))
+        try:
+            await cache.persistent.set("k", '{"content": "stale", "metrics": {}}')
+            assert await cache.get("k") is None
+        finally:
+            await cache.aclose()
+    
+    asyncio.run(run())
+
+class BrokenTier:
+    async def get(self, key):
+        raise ConnectionError("redis is down")
+    
+    async def set(self, key, value):
+        raise ConnectionError("redis is down")
+    
+    async def aclose(self):
+        pass
+
+def test_a_failing_persistent_tier_degrades_to_memory():
+    async def run():
+        cache = ResponseCache(BrokenTier())
+        assert await cache.get("k") is None
+        await cache.set("k", response("four"))
+        assert await cache.get("k") == response("four")
+    
+    asyncio.run(run())
@@ -0,0 +1,81 @@
+from app.services.router import AdaptiveRouter, percentile
+
+MODELS = {
+    "fast": {"provider": "openai", "capabilities": ["general", "math"], "priority": 1},
+    "slow": {"provider": "anthropic", "capabilities": ["general", "math"], "priority": 1},
+    "writer": {"provider": "anthropic", "capabilities": ["creative"], "priority": 1},
+}
+
+def router(models=MODELS, **weights) -> AdaptiveRouter:
+    weights.setdefault("exploration_rate", 0.0)
+    return AdaptiveRouter(models, {name: 0.01 for name in models}, **weights)
+
+def feed(router: AdaptiveRouter, name: str, latency_ms: float, count: int = 10, cost_usd: float = 0.01):
+    for _ in range(count):
+        router.record(name, {"latency_ms": latency_ms, "tokens_used": 1000, "cost_usd": cost_usd})
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 100) == 100
+    assert percentile([], 95) == 0.0
+
+def test_lower_latency_ranks_first():
+    r = router()
+    feed(r, "fast", 100)
+    feed(r, "slow", 900)
+    assert r.ranked("math") == ("fast", "slow")
+    feed(r, "fast", 5000, count=200)
+    assert r.ranked("math") == ("slow", "fast")
+
+def test_lower_cost_ranks_first():
+    r = router(latency_weight=0.0)
+    feed(r, "fast", 100, cost_usd=0.05)
+    feed(r, "slow", 100, cost_usd=0.01)
+    assert r.select("general") == "slow"
+
+def test_errors_push_a_model_down():
+    r = router()
+    feed(r, "fast", 100)
+    feed(r, "slow", 150)
+    for _ in range(3):
+        r.record("fast", error=True)
+    assert r.ranked("general")[0] == "slow"
+
+def test_priority_breaks_ties():
+    models = {**MODELS, "slow": {**MODELS["slow"], "priority": 5}}
+    assert router(models).ranked("math") == ("slow", "fast")
+
+def test_unknown_task_types_use_general_models():
+    r = router()
+    assert set(r.ranked("poetry")) == {"fast", "slow"}
+    assert r.ranked("creative") == ("writer",)
+
+def test_backup_prefers_another_provider():
+    models = {**MODELS, "fast-mini": {"provider": "openai", "capabilities": ["general"], "priority": 1}}
+    r = router(models)
+    feed(r, "fast", 100)
+    feed(r, "fast-mini", 200)
+    feed(r, "slow", 900)
+    assert r.backup_for("general", "fast") == "slow"
+
+def test_select_skips_models_with_an_open_circuit():
+    r = router()
+    feed(r, "fast", 100)
+    feed(r, "slow", 900)
+    r.breakers["fast"].opened_at = float("inf")
+    assert r.select("math") == "slow"
+    assert r.backup_for("math", "slow") is None
+
+def test_update_models_keeps_statistics():
+    r = router()
+    feed(r, "fast", 100)
+    r.update_models({**MODELS, "new": {"provider": "deepseek", "capabilities": ["math"], "priority": 1}}, {})
+    assert len(r.stats["fast"].outcomes) == 10
+    assert "new" in r.ranked("math")
+
+def test_an_empty_catalogue_is_ignored():
+    r = router()
+    r.update_models({}, {})
+    assert set(r.ranked("general")) == {"fast", "slow"}
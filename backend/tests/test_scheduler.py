@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from app.services import scheduler as scheduler_module
+from app.services.scheduler import (
+    PRIORITY_BATCH, PRIORITY_INTERACTIVE, ProviderScheduler, Scheduler, TokenBucket
+)
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler_module.time, "monotonic", lambda: now[0])
+    return now
+
+def test_bucket_starts_full_and_refills_continuously(clock):
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.wait_time(60) == 0.0
+    bucket.consume(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock[0] += 30
+    assert bucket.wait_time(30) == 0.0
+    assert bucket.wait_time(40) == pytest.approx(10.0)
+
+def test_bucket_does_not_overfill(clock):
+    bucket = TokenBucket(per_minute=60)
+    clock[0] += 600
+    bucket.consume(1)
+    assert bucket.tokens == 59
+
+def test_requests_larger_than_the_bucket_wait_for_a_full_bucket(clock):
+    bucket = TokenBucket(per_minute=60)
+    bucket.consume(60)
+    assert bucket.wait_time(600) == pytest.approx(60.0)
+
+def test_refunds_return_unused_tokens_up_to_capacity(clock):
+    bucket = TokenBucket(per_minute=100)
+    bucket.consume(50)
+    bucket.refund(20)
+    assert bucket.tokens == 70
+    bucket.refund(100)
+    assert bucket.tokens == 100
+    bucket.refund(-30)
+    assert bucket.tokens == 70
+
+def test_higher_priority_is_served_first():
+    async def run():
+        scheduler = ProviderScheduler("openai", rpm=1000, tpm=100000, concurrency=1)
+        order = []
+        
+        async def call(name: str, priority: int):
+            async with scheduler.slot(10, priority):
+                order.append(name)
+                await asyncio.sleep(0)
+        
+        async with scheduler.slot(10, PRIORITY_INTERACTIVE):
+            tasks = [
+                asyncio.ensure_future(call("batch-1", PRIORITY_BATCH)),
+                asyncio.ensure_future(call("batch-2", PRIORITY_BATCH)),
+                asyncio.ensure_future(call("interactive", PRIORITY_INTERACTIVE)),
+            ]
+            await asyncio.sleep(0)
+            assert scheduler.depth == 3
+        await asyncio.gather(*tasks)
+        return order, scheduler.active
+    
+    order, active = asyncio.run(run())
+    assert order == ["interactive", "batch-1", "batch-2"]
+    assert active == 0
+
+def test_calls_wait_for_the_token_quota():
+    async def run():
+        # 6000 TPM refills 100 tokens every second
+        scheduler = ProviderScheduler("openai", rpm=1000, tpm=6000, concurrency=10)
+        async with scheduler.slot(6000):
+            pass
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        async with scheduler.slot(20) as slot:
+            waited = loop.time() - start
+        return waited, slot.queue_depth
+    
+    waited, depth = asyncio.run(run())
+    assert 0.15 <= waited < 1.0
+    assert depth == 0
+
+def test_a_cancelled_waiter_gives_up_its_place():
+    async def run():
+        scheduler = ProviderScheduler("openai", rpm=1000, tpm=100000, concurrency=1)
+        async with scheduler.slot(10):
+            waiter = asyncio.ensure_future(scheduler.acquire(10, PRIORITY_INTERACTIVE))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+        async with scheduler.slot(10):
+            return scheduler.active
+    
+    assert asyncio.run(run()) == 1
+
+def test_limits_are_split_between_workers():
+    scheduler = Scheduler({"openai": {"rpm": 100, "tpm": 10000, "concurrency": 8}}, workers=4)
+    provider = scheduler.providers["openai"]
+    assert provider.requests.capacity == 25
+    assert provider.tokens.capacity == 2500
+    assert provider.concurrency == 2
+
+def test_unknown_providers_get_the_default_limits():
+    scheduler = Scheduler({}, workers=1, default_limits={"rpm": 60, "tpm": 1000, "concurrency": 3})
+    
+    async def run():
+        async with scheduler.slot("deepseek", 10):
+            return scheduler.snapshot()
+    
+    assert asyncio.run(run()) == {"deepseek": {"active": 1, "queued": 0}}
+    assert scheduler.providers["deepseek"].concurrency == 3
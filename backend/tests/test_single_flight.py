@@ -0,0 +1,141 @@
+import asyncio
+import pytest
+from app.services.single_flight import SingleFlight
+
+def test_concurrent_calls_share_one_upstream_call():
+    async def run():
+        flight = SingleFlight()
+        calls = 0
+        release = asyncio.Event()
+        
+        async def fn(on_token):
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"content": "answer", "metrics": {}}
+        
+        tasks = [asyncio.ensure_future(flight.do("k", fn)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+        return flight, calls, results
+    
+    flight, calls, results = asyncio.run(run())
+    assert calls == 1
+    assert [joined for _, joined in results] == [False, True, True]
+    assert all(result == {"content": "answer", "metrics": {}} for result, _ in results)
+    # Each waiter gets its own copy to annotate
+    assert results[0][0] is not results[1][0]
+    assert flight.coalesced["k"] == 2
+    assert flight.coalesced_total == 2
+
+def test_a_finished_flight_is_not_joined():
+    async def run():
+        flight = SingleFlight()
+        
+        async def fn(on_token):
+            return {"content": "answer"}
+        
+        first = await flight.do("k", fn)
+        second = await flight.do("k", fn)
+        return first, second
+    
+    first, second = asyncio.run(run())
+    assert first[1] is False
+    assert second[1] is False
+
+def collector(chunks: list):
+    async def on_token(text: str):
+        chunks.append(text)
+    return on_token
+
+def test_streamed_chunks_reach_late_joiners():
+    async def run():
+        flight = SingleFlight()
+        step = asyncio.Event()
+        
+        async def fn(on_token):
+            await on_token("Hel")
+            await step.wait()
+            await on_token("lo")
+            return {"content": "Hello"}
+        
+        early, late = [], []
+        leader = asyncio.ensure_future(flight.do("k", fn, collector(early)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", fn, collector(late)))
+        await asyncio.sleep(0)
+        step.set()
+        await asyncio.gather(leader, follower)
+        return early, late
+    
+    early, late = asyncio.run(run())
+    assert early == ["Hel", "lo"]
+    assert late == ["Hel", "lo"]
+
+def test_errors_reach_every_waiter():
+    async def run():
+        flight = SingleFlight()
+        release = asyncio.Event()
+        
+        async def fn(on_token):
+            await release.wait()
+            raise RuntimeError("provider down")
+        
+        tasks = [asyncio.ensure_future(flight.do("k", fn)) for _ in range(2)]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+    
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_cancelling_the_leader_keeps_the_call_for_followers():
+    async def run():
+        flight = SingleFlight()
+        release = asyncio.Event()
+        
+        async def fn(on_token):
+            await release.wait()
+            return {"content": "answer"}
+        
+        leader = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+    
+    result, joined = asyncio.run(run())
+    assert result == {"content": "answer"}
+    assert joined is True
+
+def test_the_call_is_cancelled_once_every_waiter_left():
+    async def run():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+        
+        async def fn(on_token):
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        
+        tasks = [asyncio.ensure_future(flight.do("k", fn)) for _ in range(2)]
+        await started.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        # The key is free for a new call
+        await asyncio.sleep(0)
+        return flight._flights
+    
+    assert asyncio.run(run()) == {}
@@ -0,0 +1,74 @@
+import time
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, func, inspect, select
+from app import database
+from app.database import APICall, TelemetryBuffer
+
+def call(i: int = 0, success: bool = True) -> dict:
+    return {
+        "timestamp": datetime.utcnow(), "provider": "openai", "model": "gpt-4",
+        "prompt": f"p{i}", "response": "r", "success": success, "error": None,
+        "latency": 0.1, "tokens_used": 10, "cost_usd": 0.001, "job_id": None
+    }
+
+@pytest.fixture
+def bind(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'api_calls.db'}")
+    yield engine
+    engine.dispose()
+
+def stored(bind) -> int:
+    if not inspect(bind).has_table("api_calls"):
+        return 0
+    with bind.connect() as conn:
+        return conn.execute(select(func.count()).select_from(APICall)).scalar()
+
+def eventually(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_the_first_flush_creates_the_table(bind):
+    buffer = TelemetryBuffer(bind=bind)
+    buffer.flush()
+    assert inspect(bind).has_table("api_calls")
+    assert "job_id" in {c["name"] for c in inspect(bind).get_columns("api_calls")}
+
+def test_rows_are_written_once_a_batch_fills(bind):
+    buffer = TelemetryBuffer(batch_size=3, flush_interval_ms=60000, bind=bind)
+    buffer.record(call(0))
+    buffer.record(call(1))
+    time.sleep(0.1)
+    assert stored(bind) == 0
+    buffer.record(call(2))
+    eventually(lambda: stored(bind) == 3)
+
+def test_rows_are_written_after_the_flush_interval(bind):
+    buffer = TelemetryBuffer(batch_size=1000, flush_interval_ms=50, bind=bind)
+    buffer.record(call())
+    eventually(lambda: stored(bind) == 1)
+
+def test_a_full_buffer_drops_and_counts_rows(bind):
+    buffer = TelemetryBuffer(capacity=2, batch_size=1000, flush_interval_ms=60000, bind=bind)
+    assert [buffer.record(call(i)) for i in range(3)] == [True, True, False]
+    assert buffer.dropped == 1
+    # What shutdown does: everything still buffered is written
+    buffer.flush()
+    assert stored(bind) == 2
+    assert buffer.record(call(3))
+
+def test_rows_that_cannot_be_written_are_counted_as_dropped(bind):
+    buffer = TelemetryBuffer(batch_size=1000, flush_interval_ms=60000, bind=bind)
+    buffer.record({**call(), "timestamp": "yesterday"})
+    buffer.flush()
+    assert buffer.dropped == 1
+    assert stored(bind) == 0
+
+def test_stats_flush_the_buffer_first():
+    before = database.get_api_stats()
+    database.log_api_call("openai", {"success": False, "model": "gpt-4", "prompt": "p", "error": "boom"})
+    after = database.get_api_stats()
+    assert after["total_calls"] == before["total_calls"] + 1
+    assert after["failed_calls"] == before["failed_calls"] + 1
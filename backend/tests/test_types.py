@@ -0,0 +1,62 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import types
+from app.models.models import Chat, Message
+from app.models.types import ZLIB, CompressedText, compress, decompress, resolve_codec
+
+LONG = "All work and no play makes Jack a dull boy. " * 50
+
+def test_compress_round_trip():
+    packed = compress(LONG, "zlib", 512)
+    assert isinstance(packed, bytes)
+    assert packed[:1] == ZLIB
+    assert len(packed) < len(LONG)
+    assert decompress(packed) == LONG
+
+def test_short_or_incompressible_text_is_left_as_is():
+    assert compress("short", "zlib", 512) == "short"
+    assert compress(LONG, "none", 512) == LONG
+    # zlib's header outweighs what it saves on short text without repeats
+    assert compress("abcdefghijklmnopqrstuvwxyz", "zlib", 16) == "abcdefghijklmnopqrstuvwxyz"
+
+def test_legacy_and_missing_values_read_unchanged():
+    assert decompress("plain text") == "plain text"
+    assert decompress(None) is None
+    assert decompress(memoryview(compress(LONG, "zlib", 0))) == LONG
+
+def test_resolve_codec(monkeypatch):
+    assert resolve_codec("zlib") == "zlib"
+    assert resolve_codec("none") == "none"
+    with pytest.raises(ValueError):
+        resolve_codec("lz4")
+    monkeypatch.setattr(types, "zstandard", None)
+    assert resolve_codec("auto") == "zlib"
+    with pytest.raises(ValueError):
+        resolve_codec("zstd")
+
+def test_only_sqlite_values_are_compressed():
+    column = CompressedText(codec="zlib", min_bytes=16)
+    assert isinstance(column.process_bind_param(LONG, sqlite.dialect()), bytes)
+    assert column.process_bind_param(LONG, postgresql.dialect()) == LONG
+    assert column.process_bind_param(None, sqlite.dialect()) is None
+
+def test_orm_reads_legacy_text_rows_and_compressed_rows(session_factory):
+    with session_factory() as session:
+        session.add(Chat(id=1, created_at=datetime(2025, 1, 1)))
+        session.flush()
+        # A row written before compression, straight into the TEXT column
+        session.execute(text(
+            "INSERT INTO messages (id, chat_id, role, content, created_at) "
+            "VALUES (1, 1, 'user', :content, '2025-01-01 00:00:00')"
+        ), {"content": LONG})
+        session.add(Message(id=2, chat_id=1, role="assistant", content=LONG, created_at=datetime(2025, 1, 1)))
+        session.add(Message(id=3, chat_id=1, role="user", content="short", created_at=datetime(2025, 1, 1)))
+        session.commit()
+        
+        stored = dict(session.execute(text("SELECT id, typeof(content) FROM messages")).all())
+        assert stored == {1: "text", 2: "blob", 3: "text"}
+        contents = dict(session.execute(select(Message.id, Message.content)).all())
+    
+    assert contents == {1: LONG, 2: LONG, 3: "short"}
@@ -0,0 +1,89 @@
+from datetime import date, datetime
+import pytest
+from app.services.usage import chat_usage, record_usage, usage_entry, usage_stats
+
+def reply(at: datetime, model: str = "gpt-4", chat_id=1, provider: str = "openai", **metrics) -> dict:
+    metrics = {"tokens_used": 100, "cost_usd": 0.01, "latency_ms": 200.0, **metrics}
+    return usage_entry(at, provider, model, metrics, chat_id)
+
+def test_usage_entry_does_not_bill_coalesced_replies():
+    entry = reply(datetime(2025, 1, 1), coalesced=True)
+    assert entry["requests"] == 1
+    assert entry["tokens_used"] == 0
+    assert entry["cost_usd"] == 0.0
+    assert entry["latency_ms_total"] == 200.0
+
+def test_usage_entry_counts_cache_hits():
+    entry = reply(datetime(2025, 1, 1), cache_hit=True, cost_saved_usd=0.02)
+    assert entry["cache_hits"] == 1
+    assert entry["cost_saved_usd"] == 0.02
+
+def test_record_usage_upserts_across_calls(session_factory):
+    day = datetime(2025, 1, 1, 9)
+    with session_factory() as session:
+        record_usage(session, [reply(day), reply(day.replace(hour=10))])
+        session.commit()
+        record_usage(session, [reply(day.replace(hour=11), tokens_used=50, cost_usd=0.005)])
+        record_usage(session, [reply(day.replace(hour=12), chat_id=2, model="claude-2.1", provider="anthropic")])
+        session.commit()
+        stats = usage_stats(session, group_by=("provider", "model"))
+        first_chat = chat_usage(session, 1)
+    
+    assert stats["total"]["requests"] == 4
+    assert stats["total"]["tokens_used"] == 350
+    assert stats["total"]["cost_usd"] == pytest.approx(0.035)
+    groups = {(g["provider"], g["model"]): g for g in stats["groups"]}
+    assert groups[("openai", "gpt-4")]["requests"] == 3
+    assert groups[("openai", "gpt-4")]["mean_latency_ms"] == 200.0
+    assert groups[("anthropic", "claude-2.1")]["tokens_used"] == 100
+    
+    assert first_chat["requests"] == 3
+    assert first_chat["cost_usd"] == pytest.approx(0.025)
+    assert first_chat["models"]["gpt-4"]["last_at"] == "2025-01-01T11:00:00"
+
+def test_usage_is_rolled_up_per_day(session_factory):
+    with session_factory() as session:
+        record_usage(session, [
+            reply(datetime(2025, 1, 1, 23, 59)),
+            reply(datetime(2025, 1, 2, 0, 1)),
+            reply(datetime(2025, 1, 2, 8), chat_id=None),
+        ])
+        session.commit()
+        by_day = usage_stats(session, group_by=("day",))
+        second_day = usage_stats(session, start=date(2025, 1, 2), end=date(2025, 1, 2), group_by=())
+        chat = chat_usage(session, 1)
+    
+    assert [(g["day"], g["requests"]) for g in by_day["groups"]] == [("2025-01-01", 1), ("2025-01-02", 2)]
+    assert second_day["total"]["requests"] == 2
+    assert second_day["groups"] == []
+    # Calls outside a chat only count towards the daily rollups
+    assert chat["requests"] == 2
+
+def test_chat_usage_over_a_date_range(session_factory):
+    with session_factory() as session:
+        record_usage(session, [
+            reply(datetime(2025, 1, 1, 9)),
+            reply(datetime(2025, 1, 2, 9), tokens_used=40),
+            reply(datetime(2025, 1, 2, 10), model="claude-2.1", provider="anthropic", tokens_used=60),
+            reply(datetime(2025, 1, 3, 9)),
+        ])
+        session.commit()
+        second_day = chat_usage(session, 1, start=date(2025, 1, 2), end=date(2025, 1, 2))
+        from_second_day = chat_usage(session, 1, start=date(2025, 1, 2), provider="openai")
+        whole = chat_usage(session, 1)
+    
+    assert second_day["requests"] == 2
+    assert second_day["tokens_used"] == 100
+    assert set(second_day["models"]) == {"gpt-4", "claude-2.1"}
+    assert second_day["models"]["gpt-4"]["last_at"] == "2025-01-02T09:00:00"
+    assert from_second_day["requests"] == 2
+    assert set(from_second_day["models"]) == {"gpt-4"}
+    assert whole["requests"] == 4
+    assert whole["models"]["gpt-4"]["requests"] == 3
+
+def test_unknown_chats_have_no_usage(session_factory):
+    with session_factory() as session:
+        assert chat_usage(session, 99) == {
+            "chat_id": 99, "start": None, "end": None,
+            "requests": 0, "tokens_used": 0, "cost_usd": 0, "models": {}
+        }
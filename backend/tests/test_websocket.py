@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import select
+from app.api import websocket
+from app.models.models import Message
+from app.services.context import ContextBuilder
+from app.services.generations import GenerationTracker
+from app.services.persistence import PersistenceService
+
+class StalledProvider:
+    """Streams the start of a reply, then waits until it is cancelled"""
+    
+    def __init__(self):
+        self.streaming = asyncio.Event()
+        self.cancelled = False
+    
+    async def route_query(self, query, task_type, on_token=None, history=None, chat_id=None):
+        await on_token("The answer ")
+        await on_token("is")
+        self.streaming.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+@pytest.fixture
+def services(session_factory, monkeypatch):
+    websocket.create_socketio_app()
+    persistence = PersistenceService(session_factory, flush_interval_ms=1)
+    services = SimpleNamespace(
+        persistence=persistence,
+        context_builder=ContextBuilder(persistence),
+        generations=GenerationTracker(),
+        ai_service=StalledProvider()
+    )
+    monkeypatch.setattr(websocket, "get_services", lambda: services)
+    return services
+
+def stored_messages(session_factory):
+    with session_factory() as session:
+        return [
+            (m.chat_id, m.role, m.content, m.message_metadata)
+            for m in session.execute(select(Message).order_by(Message.id)).scalars()
+        ]
+
+@pytest.mark.parametrize("stop", ["cancel", "disconnect"])
+def test_stopping_a_generation_stores_the_partial_reply(services, session_factory, stop):
+    async def run():
+        await services.persistence.start()
+        chat_id = await services.persistence.new_chat()
+        handled = asyncio.ensure_future(websocket.message("sid", {"content": "question", "chatId": chat_id}))
+        await services.ai_service.streaming.wait()
+        assert services.generations.inflight("sid") == 1
+        if stop == "cancel":
+            await websocket.cancel("sid", {"chatId": str(chat_id)})
+        else:
+            await websocket.disconnect("sid")
+        await handled
+        await services.persistence.stop()
+        return chat_id
+    
+    chat_id = asyncio.run(run())
+    assert services.ai_service.cancelled
+    assert services.generations.inflight("sid") == 0
+    assert stored_messages(session_factory) == [
+        (chat_id, "user", "question", None),
+        (chat_id, "assistant", "The answer is", {"metrics": {"partial": True}}),
+    ]
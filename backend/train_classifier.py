@@ -0,0 +1,72 @@
+import argparse
+import json
+import random
+from app.services.classifier import LABELS, WEIGHTS_PATH, train, evaluate
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train and evaluate the task classifier")
+    parser.add_argument("--data", default="data/task_examples.jsonl",
+                        help="JSON lines with 'text' and 'label'")
+    parser.add_argument("--folds", type=int, default=5, help="cross-validation folds; 0 to skip")
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--buckets", type=int, default=2 ** 18)
+    parser.add_argument("--output", default=WEIGHTS_PATH, help="where to write the trained weights")
+    parser.add_argument("--eval-only", action="store_true", help="cross-validate without writing weights")
+    return parser.parse_args()
+
+def load_examples(path):
+    examples = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                if row["label"] not in LABELS:
+                    raise ValueError(f"Unknown label {row['label']!r}")
+                examples.append((row["text"], row["label"]))
+    return examples
+
+def cross_validate(examples, folds, **options):
+    """Accuracy and per-label figures over ``folds`` held-out splits"""
+    shuffled = list(examples)
+    random.Random(0).shuffle(shuffled)
+    held_out = []
+    for fold in range(folds):
+        test = shuffled[fold::folds]
+        model = train([e for i, e in enumerate(shuffled) if i % folds != fold], **options)
+        held_out.append(evaluate(model, test))
+
+    labels = held_out[0]["labels"]
+    return {
+        "folds": folds,
+        "accuracy": sum(r["accuracy"] for r in held_out) / folds,
+        "labels": {
+            label: {
+                metric: sum(r["labels"][label][metric] for r in held_out) / folds
+                for metric in ("precision", "recall")
+            }
+            for label in labels
+        },
+        "routed": {
+            metric: sum(r["routed"][metric] for r in held_out) / folds
+            for metric in ("coverage", "precision")
+        },
+        "latency_ms_p99": max(r["latency_ms"]["p99"] for r in held_out)
+    }
+
+if __name__ == "__main__":
+    args = parse_args()
+    examples = load_examples(args.data)
+    options = dict(epochs=args.epochs, learning_rate=args.learning_rate, l2=args.l2, buckets=args.buckets)
+
+    if args.folds:
+        print(json.dumps(cross_validate(examples, args.folds, **options), indent=2))
+
+    if not args.eval_only:
+        model = train(examples, **options)
+        model.save(args.output)
+        report = evaluate(model, examples)
+        print(f"Training accuracy {report['accuracy']:.3f}, "
+              f"p50 {report['latency_ms']['p50']:.3f} ms, p99 {report['latency_ms']['p99']:.3f} ms")
+        print(f"Weights written to {args.output}")
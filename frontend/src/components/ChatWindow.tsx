@@ -1,14 +1,19 @@
 import React, { useState, useEffect } from 'react';
-import { Box, Paper, TextField, IconButton, Typography, CircularProgress } from '@mui/material';
+import { Box, Paper, TextField, IconButton, Typography, CircularProgress, Chip } from '@mui/material';
 import SendIcon from '@mui/icons-material/Send';
 import AttachFileIcon from '@mui/icons-material/AttachFile';
-import chatService, { Message, ChatResponse } from '../services/ChatService';
+import StopIcon from '@mui/icons-material/Stop';
+import chatService, { Message, ChatResponse, ChatChunk, Attachment } from '../services/ChatService';
+
+const STREAMING_ID = 'streaming';
 
 const ChatWindow: React.FC = () => {
   const [messages, setMessages] = useState<Message[]>([]);
   const [input, setInput] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [currentChatId, setCurrentChatId] = useState<string>();
+  const [attachments, setAttachments] = useState<Attachment[]>([]);
+  const [isUploading, setIsUploading] = useState(false);
 
   useEffect(() => {
     chatService.connect();
@@ -27,27 +32,49 @@ const ChatWindow: React.FC = () => {
         metrics: response.metrics,
       };
       
-      setMessages(prev => [...prev, newMessage]);
+      // Replace the partially streamed message with the final one
+      setMessages(prev => [...prev.filter(m => m.id !== STREAMING_ID), newMessage]);
+    };
+
+    const chunkHandler = (chunk: ChatChunk) => {
+      setMessages(prev => {
+        const streaming = prev.find(m => m.id === STREAMING_ID);
+        if (!streaming) {
+          return [...prev, { id: STREAMING_ID, content: chunk.content, role: 'assistant', timestamp: new Date() }];
+        }
+        return prev.map(m => m.id === STREAMING_ID ? { ...m, content: m.content + chunk.content } : m);
+      });
+    };
+
+    const cancelledHandler = () => {
+      setIsLoading(false);
+      // Keep whatever was streamed before the reply was stopped
+      setMessages(prev => prev.map(m => m.id === STREAMING_ID ? { ...m, id: Date.now().toString() } : m));
     };
 
     const errorHandler = (error: any) => {
       setIsLoading(false);
+      setMessages(prev => prev.filter(m => m.id !== STREAMING_ID));
       console.error('Chat error:', error);
       // TODO: Add error notification
     };
 
     const unsubscribeMessage = chatService.onMessage(messageHandler);
+    const unsubscribeChunk = chatService.onChunk(chunkHandler);
+    const unsubscribeCancelled = chatService.onCancelled(cancelledHandler);
     const unsubscribeError = chatService.onError(errorHandler);
 
     return () => {
       unsubscribeMessage();
+      unsubscribeChunk();
+      unsubscribeCancelled();
       unsubscribeError();
       chatService.disconnect();
     };
   }, []);
 
   const handleSend = () => {
-    if (!input.trim() || isLoading) return;
+    if (!input.trim() || isLoading || isUploading) return;
 
     const newMessage: Message = {
       id: Date.now().toString(),
@@ -58,21 +85,38 @@ const ChatWindow: React.FC = () => {
 
     setMessages(prev => [...prev, newMessage]);
     setInput('');
+    setAttachments([]);
     setIsLoading(true);
 
     try {
-      chatService.sendMessage(input, currentChatId);
+      chatService.sendMessage(input, currentChatId, 'general', attachments);
     } catch (error) {
       console.error('Failed to send message:', error);
       setIsLoading(false);
     }
   };
 
-  const handleFileUpload = (event: React.ChangeEvent<HTMLInputElement>) => {
+  const handleStop = () => {
+    chatService.cancel(currentChatId);
+  };
+
+  const handleFileUpload = async (event: React.ChangeEvent<HTMLInputElement>) => {
     const files = event.target.files;
     if (files && files.length > 0) {
-      // TODO: Handle file upload
-      console.log('File uploaded:', files[0].name);
+      const file = files[0];
+      // Allow picking the same file again after removing it
+      event.target.value = '';
+      setIsUploading(true);
+      try {
+        const attachment = await chatService.uploadFile(file);
+        setAttachments(prev =>
+          prev.some(a => a.fileId === attachment.fileId) ? prev : [...prev, attachment]
+        );
+      } catch (error) {
+        console.error('Failed to upload file:', error);
+      } finally {
+        setIsUploading(false);
+      }
     }
   };
 
@@ -106,32 +150,47 @@ const ChatWindow: React.FC = () => {
                   Tokens: {message.metrics.tokens_used} | 
                   Cost: ${message.metrics.cost_usd.toFixed(6)} | 
                   Latency: {message.metrics.latency_ms.toFixed(0)}ms
+                  {message.metrics.time_to_first_token_ms !== undefined &&
+                    ` | First token: ${message.metrics.time_to_first_token_ms.toFixed(0)}ms`}
                 </Typography>
               )}
             </Paper>
           </Box>
         ))}
-        {isLoading && (
+        {isLoading && !messages.some(m => m.id === STREAMING_ID) && (
           <Box sx={{ display: 'flex', justifyContent: 'center', mt: 2 }}>
             <CircularProgress size={24} />
           </Box>
         )}
       </Box>
       <Box sx={{ p: 2, backgroundColor: 'background.default' }}>
+        {attachments.length > 0 && (
+          <Box sx={{ display: 'flex', gap: 1, flexWrap: 'wrap', mb: 1 }}>
+            {attachments.map(attachment => (
+              <Chip
+                key={attachment.fileId}
+                label={attachment.filename}
+                size="small"
+                onDelete={() => setAttachments(prev => prev.filter(a => a.fileId !== attachment.fileId))}
+              />
+            ))}
+          </Box>
+        )}
         <Box sx={{ display: 'flex', gap: 1 }}>
           <input
             type="file"
             id="file-upload"
             style={{ display: 'none' }}
             onChange={handleFileUpload}
-            accept=".pdf,.png,.jpg,.csv"
+            accept=".pdf,.png,.jpg,.jpeg,.csv"
           />
           <IconButton
             color="primary"
             component="label"
             htmlFor="file-upload"
+            disabled={isUploading}
           >
-            <AttachFileIcon />
+            {isUploading ? <CircularProgress size={24} /> : <AttachFileIcon />}
           </IconButton>
           <TextField
             fullWidth
@@ -147,13 +206,19 @@ const ChatWindow: React.FC = () => {
             }}
             disabled={isLoading}
           />
-          <IconButton
-            color="primary"
-            onClick={handleSend}
-            disabled={!input.trim() || isLoading}
-          >
-            {isLoading ? <CircularProgress size={24} /> : <SendIcon />}
-          </IconButton>
+          {isLoading ? (
+            <IconButton color="primary" onClick={handleStop} title="Stop generating">
+              <StopIcon />
+            </IconButton>
+          ) : (
+            <IconButton
+              color="primary"
+              onClick={handleSend}
+              disabled={!input.trim() || isUploading}
+            >
+              <SendIcon />
+            </IconButton>
+          )}
         </Box>
       </Box>
     </Paper>
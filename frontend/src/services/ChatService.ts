@@ -4,6 +4,7 @@ export interface CostMetrics {
   tokens_used: number;
   cost_usd: number;
   latency_ms: number;
+  time_to_first_token_ms?: number;
 }
 
 export interface Message {
@@ -25,9 +26,45 @@ export interface ChatResponse {
   metrics?: CostMetrics;
 }
 
+export interface ChatChunk {
+  chatId: string;
+  seq: number;
+  content: string;
+}
+
+export interface ChatCancelled {
+  chatId: string | null;
+  reason: 'cancelled' | 'superseded';
+}
+
+export interface Page<T> {
+  items: T[];
+  next_cursor: string | null;
+}
+
+export interface StoredMessage {
+  id: number;
+  role: 'user' | 'assistant';
+  content: string;
+  model: string | null;
+  created_at: string;
+  metadata: Record<string, any> | null;
+}
+
+export interface Attachment {
+  fileId: string;
+  filename: string;
+  kind?: string;
+  size?: number;
+}
+
+const API_URL = 'http://localhost:51692/api/v1';
+
 class ChatService {
   private socket: Socket | null = null;
   private messageHandlers: ((message: ChatResponse) => void)[] = [];
+  private chunkHandlers: ((chunk: ChatChunk) => void)[] = [];
+  private cancelledHandlers: ((cancelled: ChatCancelled) => void)[] = [];
   private errorHandlers: ((error: any) => void)[] = [];
 
   connect() {
@@ -44,6 +81,14 @@ class ChatService {
       this.messageHandlers.forEach(handler => handler(response));
     });
 
+    this.socket.on('message_chunk', (chunk: ChatChunk) => {
+      this.chunkHandlers.forEach(handler => handler(chunk));
+    });
+
+    this.socket.on('cancelled', (cancelled: ChatCancelled) => {
+      this.cancelledHandlers.forEach(handler => handler(cancelled));
+    });
+
     this.socket.on('error', (error: any) => {
       this.errorHandlers.forEach(handler => handler(error));
     });
@@ -60,7 +105,7 @@ class ChatService {
     }
   }
 
-  sendMessage(content: string, chatId?: string, taskType: string = 'general') {
+  sendMessage(content: string, chatId?: string, taskType: string = 'general', attachments: Attachment[] = []) {
     if (!this.socket) {
       throw new Error('Not connected to chat server');
     }
@@ -69,9 +114,45 @@ class ChatService {
       content,
       chatId,
       taskType,
+      attachments: attachments.map(({ fileId, filename }) => ({ fileId, filename })),
     });
   }
 
+  cancel(chatId?: string) {
+    // Without a chat id every reply in flight on this connection is stopped
+    this.socket?.emit('cancel', { chatId });
+  }
+
+  async uploadFile(file: File): Promise<Attachment> {
+    // The raw file is the request body, so the browser streams it from disk
+    const params = new URLSearchParams({ filename: file.name });
+    const response = await fetch(`${API_URL}/files?${params}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/octet-stream' },
+      body: file,
+    });
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({}));
+      throw new Error(error.detail || `Upload failed (${response.status})`);
+    }
+    const upload = await response.json();
+    return { fileId: upload.file_id, filename: upload.filename, kind: upload.kind, size: upload.size };
+  }
+
+  async fetchChats(cursor?: string, limit: number = 50): Promise<Page<{ id: number; created_at: string }>> {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${API_URL}/chats?${params}`);
+    return response.json();
+  }
+
+  async fetchMessages(chatId: string, cursor?: string, limit: number = 50): Promise<Page<StoredMessage>> {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${API_URL}/chats/${chatId}/messages?${params}`);
+    return response.json();
+  }
+
   onMessage(handler: (message: ChatResponse) => void) {
     this.messageHandlers.push(handler);
     return () => {
@@ -79,6 +160,20 @@ class ChatService {
     };
   }
 
+  onChunk(handler: (chunk: ChatChunk) => void) {
+    this.chunkHandlers.push(handler);
+    return () => {
+      this.chunkHandlers = this.chunkHandlers.filter(h => h !== handler);
+    };
+  }
+
+  onCancelled(handler: (cancelled: ChatCancelled) => void) {
+    this.cancelledHandlers.push(handler);
+    return () => {
+      this.cancelledHandlers = this.cancelledHandlers.filter(h => h !== handler);
+    };
+  }
+
   onError(handler: (error: any) => void) {
     this.errorHandlers.push(handler);
     return () => {